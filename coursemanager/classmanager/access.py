@@ -0,0 +1,123 @@
+from functools import wraps
+
+from django.shortcuts import render
+
+from .models import Student, Course, Enrollment
+
+
+class CourseAccess:
+    # objects resolved while checking a user's permission in a course, reused by the view
+    def __init__(self, course, instructor=None, student=None, enrollment=None):
+        self.course = course
+        self.instructor = instructor
+        self.student = student
+        self.enrollment = enrollment
+
+
+def course_access(action, instructor=True, student=True, enrolled=True):
+    # decorator for views taking a course_id, it checks that the user may perform `action` in the course
+    # and stores the resolved CourseAccess on request.access. `action` may use the view's keyword arguments
+    # (e.g. "view {activity}") and `enrolled=False` lets students through without being enrolled (joining).
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            context = {}
+            access = resolve_access(request, kwargs["course_id"], action.format(**kwargs), context,
+                                    instructor, student, enrolled)
+            if access is None:
+                return render(request, "classmanager/failure.html", context)
+            request.access = access
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def resolve_access(request, course_id, action, context, instructor=True, student=True, enrolled=True):
+    # returns a CourseAccess if the user may perform the action, else None with a failure message in context
+    if instructor and request.user.is_instructor:
+        try:
+            course = Course.objects.select_related("instructor").get(pk=course_id)
+        except Course.DoesNotExist:
+            context["failure_message"] = "The course you are searching for does not exist"
+            return None
+        if not instructor_check(request, course, action, context):
+            return None
+        return CourseAccess(course, instructor=course.instructor)
+    if student and request.user.is_student:
+        if not enrolled:
+            return student_access(request, course_id, context)
+        # a single query resolves the enrollment together with its course and student
+        try:
+            enrollment = Enrollment.objects.select_related("course", "student")\
+                .get(course=course_id, student=request.user.pk)
+        except Enrollment.DoesNotExist:
+            # case where student is not enrolled in the class but tried to access page
+            context["failure_message"] = f"Sorry, you don't have the permission to {action}"
+            return None
+        return CourseAccess(enrollment.course, student=enrollment.student, enrollment=enrollment)
+    context["failure_message"] = f"Sorry, you don't have the permission to {action}"
+    return None
+
+
+def instructor_check(request, course, action, context):
+    # check if user is the instructor of an already fetched course (Instructor's primary key is the user's)
+    if not request.user.is_instructor or course.instructor_id != request.user.pk:
+        context["failure_message"] = f"Sorry, you don't have the permission to {action} in this course."
+        return False
+    return True
+
+
+def student_access(request, course_id, context):
+    # resolves the course and student for a student that does not need to be enrolled (e.g. joining)
+    try:
+        course = Course.objects.select_related("instructor__user").get(pk=course_id)
+    except Course.DoesNotExist:
+        context["failure_message"] = "The course you are searching for does not exist"
+        return None
+    return CourseAccess(course, student=Student.objects.get(pk=request.user.pk))
+
+
+def acourse_access(action, instructor=True, student=True, enrolled=True):
+    # course_access for async views, request.user must already be resolved (see async_views.resolved_user)
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            context = {}
+            access = await aresolve_access(request, kwargs["course_id"], action.format(**kwargs), context,
+                                           instructor, student, enrolled)
+            if access is None:
+                return render(request, "classmanager/failure.html", context)
+            request.access = access
+            return await view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+async def aresolve_access(request, course_id, action, context, instructor=True, student=True, enrolled=True):
+    # resolve_access using the async ORM, it runs the same queries
+    if instructor and request.user.is_instructor:
+        try:
+            course = await Course.objects.select_related("instructor").aget(pk=course_id)
+        except Course.DoesNotExist:
+            context["failure_message"] = "The course you are searching for does not exist"
+            return None
+        if not instructor_check(request, course, action, context):
+            return None
+        return CourseAccess(course, instructor=course.instructor)
+    if student and request.user.is_student:
+        if not enrolled:
+            try:
+                course = await Course.objects.select_related("instructor__user").aget(pk=course_id)
+            except Course.DoesNotExist:
+                context["failure_message"] = "The course you are searching for does not exist"
+                return None
+            return CourseAccess(course, student=await Student.objects.aget(pk=request.user.pk))
+        try:
+            enrollment = await Enrollment.objects.select_related("course", "student")\
+                .aget(course=course_id, student=request.user.pk)
+        except Enrollment.DoesNotExist:
+            context["failure_message"] = f"Sorry, you don't have the permission to {action}"
+            return None
+        return CourseAccess(enrollment.course, student=enrollment.student, enrollment=enrollment)
+    context["failure_message"] = f"Sorry, you don't have the permission to {action}"
+    return None
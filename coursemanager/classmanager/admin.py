@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import User, Student, Instructor, Course, Enrollment,\
+from .models import User, Student, Instructor, Course, Enrollment, WaitlistEntry,\
     Announcement, Assignment, Submission, Attendance, Grade
 
 # Register your models here.
@@ -8,6 +8,7 @@ admin.site.register(Student)
 admin.site.register(Instructor)
 admin.site.register(Course)
 admin.site.register(Enrollment)
+admin.site.register(WaitlistEntry)
 admin.site.register(Announcement)
 admin.site.register(Assignment)
 admin.site.register(Submission)
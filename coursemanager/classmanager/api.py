@@ -0,0 +1,128 @@
+from functools import wraps
+
+from django.db.models import Q
+from django.http import JsonResponse
+from django.views.decorators.http import condition, require_GET
+
+from . import course_cache
+from .access import resolve_access
+from .models import Course, Announcement, Assignment, Grade
+from .views import COURSES_PER_PAGE, encode_cursor, decode_cursor
+
+# Read-only JSON versions of the course pages. Responses carry an ETag derived from cached versions (see
+# course_cache) that signals replace on every write, so polling clients get a 304 without any query or
+# serialization when nothing changed. The versions are read from the cache shared by every server process, a
+# process that didn't handle the write still sees the new version. There is no Last-Modified date: it only has a precision of seconds, so
+# a client sending If-Modified-Since would miss a second write within the same second.
+
+
+def api_login_required(view):
+    # like login_required, but answers with a JSON 401 instead of redirecting to the login page
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({"error": "Authentication required"}, status=401)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def api_course_access(action, instructor=True, student=True):
+    # same checks as views.course_access, failures are answered with a JSON 403
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            context = {}
+            access = resolve_access(request, kwargs["course_id"], action, context, instructor, student)
+            if access is None:
+                return JsonResponse({"error": context["failure_message"]}, status=403)
+            request.access = access
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def versioned(name, per_user=False):
+    # condition() arguments deriving the ETag of a response from a cached version, `name` is formatted with the
+    # view's keyword arguments
+    def version(request, **kwargs):
+        return course_cache.get_version(name.format(**kwargs))
+
+    def etag(request, *args, **kwargs):
+        if per_user:
+            return f'"{request.user.pk}-{version(request, **kwargs)}"'
+        return f'"{version(request, **kwargs)}"'
+    return {"etag_func": etag}
+
+
+def course_json(course):
+    return {
+        "id": course.id,
+        "name": course.name,
+        "instructor": course.instructor.get_name(),
+        "department": course.department,
+        "description": course.description,
+        "credits": course.credits,
+        "length": course.length,
+        "is_active": course.is_active,
+        "date_created": course.date_created,
+    }
+
+
+@require_GET
+@api_login_required
+@condition(**versioned("catalog"))
+def courses(request):
+    # a page of active courses ordered by name, the "next" cursor is passed back as ?after=
+    courses = Course.objects.filter(is_active=True)
+    cursor = decode_cursor(request.GET.get("after", ""))
+    if cursor is not None:
+        name, course_id = cursor
+        courses = courses.filter(Q(name__gte=name) & (Q(name__gt=name) | Q(id__gt=course_id)))
+    courses = list(courses.select_related("instructor__user").order_by("name", "id")[:COURSES_PER_PAGE + 1])
+    next_cursor = encode_cursor(courses[COURSES_PER_PAGE - 1]) if len(courses) > COURSES_PER_PAGE else None
+    return JsonResponse({
+        "courses": [course_json(course) for course in courses[:COURSES_PER_PAGE]],
+        "next": next_cursor
+    })
+
+
+@require_GET
+@api_login_required
+@api_course_access("view this course")
+@condition(**versioned("course:{course_id}"))
+def course(request, course_id):
+    return JsonResponse(course_json(Course.objects.select_related("instructor__user").get(pk=course_id)))
+
+
+@require_GET
+@api_login_required
+@api_course_access("view assignments")
+@condition(**versioned("course:{course_id}"))
+def assignments(request, course_id):
+    assignments = Assignment.objects.filter(course=request.access.course).order_by("-date_created")
+    return JsonResponse({"assignments": list(assignments.values(
+        "id", "title", "description", "file_url", "points", "due_date", "date_created"))})
+
+
+@require_GET
+@api_login_required
+@api_course_access("view announcements")
+@condition(**versioned("course:{course_id}"))
+def announcements(request, course_id):
+    announcements = Announcement.objects.filter(course=request.access.course).order_by("-date_created")
+    return JsonResponse({"announcements": list(announcements.values("id", "text", "date_created"))})
+
+
+@require_GET
+@api_login_required
+@api_course_access("view final scores")
+# students only see their own grade, so the ETag is per user as well
+@condition(**versioned("grades:{course_id}", per_user=True))
+def grades(request, course_id):
+    grades = Grade.objects.filter(course=request.access.course)
+    if request.access.student:
+        grades = grades.filter(student=request.access.student)
+    return JsonResponse({"grades": [
+        {"student_id": grade.student_id, "student": grade.student.get_name(), "score": grade.score}
+        for grade in grades.select_related("student__user").order_by("student_id")
+    ]})
@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class ClassmanagerConfig(AppConfig):
     name = 'classmanager'
+
+    def ready(self):
+        # connect signal receivers and instrument queries and template renders of sampled requests
+        from . import db, signals  # noqa: F401
+        from .middleware import install_instrumentation
+        install_instrumentation()
@@ -0,0 +1,117 @@
+import asyncio
+from functools import wraps
+
+from django.contrib.auth.decorators import login_required
+from django.shortcuts import render
+from django.template.loader import render_to_string
+
+from . import course_cache
+from .access import acourse_access
+from .models import Student, Instructor, Announcement, Assignment, Grade
+from .routers import reporting_database
+from .views import catalog_filters, catalog_page, catalog_context, facet_rows
+
+# Async versions of the read-heavy views, routed instead of their counterparts in views when the app is
+# served over ASGI (see settings.ASYNC_VIEWS). They use the async ORM and run independent queries together
+# with asyncio.gather, and evaluate every queryset before rendering since templates can't query the
+# database from the event loop.
+
+
+def resolved_user(view):
+    # request.user is resolved lazily with a synchronous query, which is not allowed on the event loop, so it
+    # is replaced with the user loaded through the async API before templates or access checks read it
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        request.user = await request.auser()
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+async def alist(queryset):
+    return [obj async for obj in queryset]
+
+
+@resolved_user
+async def view_all_courses(request):
+    department, credits, cursor = catalog_filters(request.GET)
+    courses, facets = await asyncio.gather(alist(catalog_page(department, credits, cursor)), alist(facet_rows()))
+    return render(request, "classmanager/view_courses.html",
+                  catalog_context(request, courses, facets, department, credits, cursor))
+
+
+@resolved_user
+@login_required
+@acourse_access("view this course")
+async def view_course(request, course_id):
+    course = request.access.course
+    role = "instructor" if request.access.instructor else "student"
+    version = await course_cache.acourse_version(course.id)
+    course_content = await course_cache.aget_content(course.id, role, version)
+    if course_content is None:
+        announcements, assignments = await asyncio.gather(
+            alist(Announcement.objects.filter(course=course).order_by("-date_created")),
+            alist(Assignment.objects.filter(course=course).order_by("-date_created")))
+        course_content = render_to_string("classmanager/course_content.html", {
+            "course": course,
+            "announcements": announcements,
+            "assignments": assignments
+        }, request)
+        await course_cache.aset_content(course.id, role, version, course_content)
+    return render(request, "classmanager/view_course.html", {
+        "course": course,
+        "course_content": course_content
+    })
+
+
+@resolved_user
+@login_required
+@acourse_access("view {activity}")
+async def view_all(request, activity, course_id):
+    course = request.access.course
+    if activity == "announcements":
+        announcements = await alist(Announcement.objects.filter(course=course).order_by("-date_created"))
+        return render(request, "classmanager/view_announcements.html", {
+            "course": course,
+            "announcements": announcements
+        })
+    elif activity == "assignments":
+        assignments = await alist(Assignment.objects.filter(course=course).order_by("-date_created"))
+        return render(request, "classmanager/view_assignments.html", {
+            "course": course,
+            "assignments": assignments
+        })
+    return render(request, "classmanager/failure.html", {
+        "failure_message": "Sorry, the activity you tried to access does not exist"
+    })
+
+
+@resolved_user
+@login_required
+@acourse_access("view final scores")
+@reporting_database
+async def view_finals(request, course_id):
+    context = {}
+    access = request.access
+    course = access.course
+    if access.instructor:
+        context["grades"] = await alist(Grade.objects.filter(course=course).select_related("student__user", "course"))
+    else:
+        try:
+            context["grade"] = await Grade.objects.aget(course=course, student=access.student)
+        except Grade.DoesNotExist:
+            # handled in the template
+            pass
+    context["course"] = course
+    return render(request, "classmanager/view_finals.html", context)
+
+
+@resolved_user
+@login_required
+async def view_my_profile(request):
+    context = {}
+    if request.user.is_student:
+        context["student"] = await Student.objects.aget(user=request.user)
+    elif request.user.is_instructor:
+        context["instructor"] = await Instructor.objects.aget(user=request.user)
+        context["courses"] = context["instructor"].course_count
+    return render(request, "classmanager/view_profile.html", context)
@@ -0,0 +1,60 @@
+from functools import reduce
+from operator import or_
+
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Instructor, Course, Enrollment, Announcement, Assignment, Submission
+
+# Denormalized counts of courses and instructors, so list pages show them without counting rows. Writes adjust
+# them with F() expressions in the transaction of the write (signals.py for single rows, the caller for bulk
+# writes) and `manage.py repair_counters` recomputes them from the rows.
+
+
+def adjust(queryset, **deltas):
+    # adds the deltas to the counters of the rows, in the database so concurrent writes don't lose updates.
+    # Counters never go below 0
+    queryset.update(**{field: Greatest(F(field) + delta, Value(0)) for field, delta in deltas.items()})
+
+
+def graded(course_id, count=1):
+    # called once ungraded submissions of the course are given a score
+    adjust(Course.objects.filter(pk=course_id), ungraded_count=-count)
+
+
+def count_of(model, field, **filters):
+    # number of rows of the model whose `field` points at the outer row
+    return Coalesce(Subquery(model.objects.filter(**{field: OuterRef("pk")}, **filters).order_by()
+                             .values(field).annotate(count=Count("pk")).values("count")), 0)
+
+
+def course_counts():
+    return {
+        "enrolled_count": count_of(Enrollment, "course"),
+        "assignment_count": count_of(Assignment, "course"),
+        "announcement_count": count_of(Announcement, "course"),
+        "ungraded_count": count_of(Submission, "assignment__course", is_graded=False),
+    }
+
+
+def instructor_counts():
+    return {"course_count": count_of(Course, "instructor")}
+
+
+def drifted(queryset, counts):
+    # the rows of the queryset whose counters differ from the counts of their rows
+    return queryset.annotate(**{f"actual_{field}": count for field, count in counts.items()})\
+        .filter(reduce(or_, [~Q(**{field: F(f"actual_{field}")}) for field in counts]))
+
+
+def recount_courses(course_ids=None, fields=None):
+    # recomputes the counters of the courses (all of them by default) in a single UPDATE
+    courses = Course.objects.all() if course_ids is None else Course.objects.filter(pk__in=course_ids)
+    counts = course_counts()
+    return courses.update(**{field: counts[field] for field in fields or counts})
+
+
+def recount_instructors(instructor_ids=None):
+    instructors = Instructor.objects.all() if instructor_ids is None else \
+        Instructor.objects.filter(pk__in=instructor_ids)
+    return instructors.update(**instructor_counts())
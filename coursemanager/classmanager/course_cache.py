@@ -0,0 +1,80 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .metrics import record_cache
+
+# seconds a rendered course fragment stays cached, outdated fragments are never read again anyway
+CONTENT_TIMEOUT = 60 * 60
+
+
+# the version of a course changes on every write to the course, its announcements or its assignments.
+# Cached content is stored under a key containing the version, so a write makes older entries unreachable
+# instead of having to delete them.
+def version_key(name):
+    return f"classmanager:version:{name}"
+
+
+def get_version(name):
+    version = cache.get(version_key(name))
+    record_cache("version", version is not None)
+    if version is None:
+        # a missing version (never set or evicted) gets a new timestamp so it can't match older entries
+        cache.add(version_key(name), time.time_ns(), None)
+        version = cache.get(version_key(name), time.time_ns())
+    return version
+
+
+async def aget_version(name):
+    # get_version for async views
+    version = await cache.aget(version_key(name))
+    record_cache("version", version is not None)
+    if version is None:
+        await cache.aadd(version_key(name), time.time_ns(), None)
+        version = await cache.aget(version_key(name), time.time_ns())
+    return version
+
+
+def bump_version(name):
+    # a timestamp rather than an increment, so concurrent bumps can't produce a version seen before. It is
+    # bumped again once the transaction commits, in case a concurrent read cached the content of the
+    # uncommitted state under the first new version
+    cache.set(version_key(name), time.time_ns(), None)
+    transaction.on_commit(lambda: cache.set(version_key(name), time.time_ns(), None))
+
+
+def course_version(course_id):
+    return get_version(f"course:{course_id}")
+
+
+async def acourse_version(course_id):
+    return await aget_version(f"course:{course_id}")
+
+
+def bump_course_version(course_id):
+    bump_version(f"course:{course_id}")
+
+
+def content_key(course_id, role, version):
+    return f"classmanager:course_content:{course_id}:{role}:{version}"
+
+
+def get_content(course_id, role, version):
+    content = cache.get(content_key(course_id, role, version))
+    record_cache("course_content", content is not None)
+    return content
+
+
+def set_content(course_id, role, version, content):
+    cache.set(content_key(course_id, role, version), content, CONTENT_TIMEOUT)
+
+
+async def aget_content(course_id, role, version):
+    content = await cache.aget(content_key(course_id, role, version))
+    record_cache("course_content", content is not None)
+    return content
+
+
+async def aset_content(course_id, role, version, content):
+    await cache.aset(content_key(course_id, role, version), content, CONTENT_TIMEOUT)
@@ -0,0 +1,112 @@
+import json
+import logging
+import os
+import random
+import sys
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DatabaseError, OperationalError, connection
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    # apply the connection profile of settings.SQLITE_PRAGMAS to every new SQLite connection
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in getattr(settings, "SQLITE_PRAGMAS", {}).items():
+            cursor.execute(f"PRAGMA {pragma} = {value}")
+
+
+slow_query_logger = logging.getLogger("classmanager.slow_queries")
+
+# set while the plan of a slow query is read, the EXPLAIN itself goes through the execute wrapper
+_explaining = ContextVar("explaining_slow_query", default=False)
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+# the instrumentation wrapping queries and renders is never the call site
+INSTRUMENTATION = {os.path.join(APP_DIR, "db.py"), os.path.join(APP_DIR, "middleware.py")}
+
+
+@receiver(connection_created)
+def install_slow_query_log(sender, connection, **kwargs):
+    if log_slow_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(log_slow_query)
+
+
+def log_slow_query(execute, sql, params, many, context):
+    # logs the queries slower than settings.SLOW_QUERY_THRESHOLD_MS with the app code that issued them and
+    # their query plan, as JSON lines on the classmanager.slow_queries logger (a rotating file, see LOGGING)
+    if _explaining.get() or settings.SLOW_QUERY_THRESHOLD_MS is None or \
+            not slow_query_logger.isEnabledFor(logging.INFO):
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    result = execute(sql, params, many, context)
+    duration = (time.perf_counter() - start) * 1000
+    if duration >= settings.SLOW_QUERY_THRESHOLD_MS:
+        slow_query_logger.info(json.dumps({
+            "time": time.time(),
+            "duration_ms": round(duration, 2),
+            "database": context["connection"].alias,
+            "sql": sql,
+            "params": None if many else params,
+            **call_site(),
+            "plan": None if many else query_plan(context["connection"], sql, params),
+        }, default=str))
+    return result
+
+
+def call_site():
+    # the innermost frame of the app's own code (views, helpers...) on the stack. Querysets evaluated while a
+    # template renders are attributed to the view line that rendered it
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename.startswith(APP_DIR + os.sep) and filename not in INSTRUMENTATION:
+            return {"file": os.path.relpath(filename, APP_DIR), "function": frame.f_code.co_name,
+                    "line": frame.f_lineno}
+        frame = frame.f_back
+    return {"file": None, "function": None, "line": None}
+
+
+def query_plan(connection, sql, params):
+    # the plan of a SELECT, one line per step (SQLite's EXPLAIN QUERY PLAN shows table scans as "SCAN table")
+    if not sql.lstrip().upper().startswith(("SELECT", "WITH")):
+        return None
+    token = _explaining.set(True)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"{connection.ops.explain_query_prefix()} {sql}", params)
+            return [str(row[-1]) for row in cursor.fetchall()]
+    except DatabaseError:
+        return None
+    finally:
+        _explaining.reset(token)
+
+
+def is_busy(error):
+    # SQLite reports SQLITE_BUSY and SQLITE_LOCKED with these messages
+    return str(error) in ("database is locked", "database table is locked")
+
+
+def retry_on_busy(view):
+    # retries a write view, with exponential backoff and jitter, when the database is still locked after
+    # busy_timeout. A failed statement wrote nothing and the view runs again from the start, so it is only safe
+    # for views whose writes are a single statement, an atomic block or idempotent. Inside an outer transaction
+    # (e.g. ATOMIC_REQUESTS) the whole transaction failed, so the error is raised right away.
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        retries = getattr(settings, "SQLITE_BUSY_RETRIES", 0)
+        for attempt in range(retries + 1):
+            try:
+                return view(*args, **kwargs)
+            except OperationalError as error:
+                if attempt == retries or not is_busy(error) or connection.in_atomic_block:
+                    raise
+                time.sleep(settings.SQLITE_BUSY_BACKOFF * 2 ** attempt * random.uniform(1, 1.5))
+    return wrapper
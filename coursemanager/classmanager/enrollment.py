@@ -0,0 +1,91 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+
+from .models import Course, Enrollment, WaitlistEntry
+
+# Seats are allocated with a conditional UPDATE of Course.enrolled_count, which the database applies atomically,
+# instead of counting the enrollments and then inserting one: concurrent joins can't both take the last seat.
+# The unique (course, student) constraints of enrollments and waitlist entries reject double joins.
+
+ENROLLED = "enrolled"
+WAITLISTED = "waitlisted"
+ALREADY_ENROLLED = "already enrolled"
+ALREADY_WAITLISTED = "already waitlisted"
+
+
+def take_seat(course_id):
+    # True if a seat of the course was free and is now taken, courses without a capacity have unlimited seats
+    return Course.objects.filter(Q(capacity__isnull=True) | Q(enrolled_count__lt=F("capacity")), pk=course_id)\
+        .update(enrolled_count=F("enrolled_count") + 1) == 1
+
+
+def release_seat(course_id):
+    Course.objects.filter(pk=course_id, enrolled_count__gt=0).update(enrolled_count=F("enrolled_count") - 1)
+
+
+def join(course_id, student_id):
+    # enrolls the student if a seat is free, else puts them at the end of the waitlist
+    try:
+        with transaction.atomic():
+            if take_seat(course_id):
+                # the seat is given back with the rest of the transaction if the student is already enrolled
+                Enrollment.objects.create(course_id=course_id, student_id=student_id)
+                # a waitlisted student joining again once a seat is free (e.g. the capacity was raised)
+                WaitlistEntry.objects.filter(course=course_id, student=student_id).delete()
+                return ENROLLED
+            if Enrollment.objects.filter(course=course_id, student=student_id).exists():
+                return ALREADY_ENROLLED
+            try:
+                with transaction.atomic():
+                    WaitlistEntry.objects.create(course_id=course_id, student_id=student_id)
+            except IntegrityError:
+                return ALREADY_WAITLISTED
+            return WAITLISTED
+    except IntegrityError:
+        return ALREADY_ENROLLED
+
+
+def leave(course_id, student_id):
+    # removes the enrollment, and gives its seat to the first student of the waitlist
+    with transaction.atomic():
+        deleted, _ = Enrollment.objects.filter(course=course_id, student=student_id).delete()
+        if deleted:
+            release_seat(course_id)
+            promote(course_id)
+
+
+def promote(course_id):
+    # enrolls students of the waitlist, first come first served, while seats are free. Returns their ids
+    promoted = []
+    with transaction.atomic():
+        while take_seat(course_id):
+            entry = pop_waitlist(course_id)
+            if entry is None:
+                release_seat(course_id)
+                break
+            if Enrollment.objects.filter(course=course_id, student=entry.student_id).exists():
+                # already enrolled otherwise, e.g. by an instructor's roster import
+                release_seat(course_id)
+                continue
+            Enrollment.objects.create(course_id=course_id, student_id=entry.student_id)
+            promoted.append(entry.student_id)
+    return promoted
+
+
+def pop_waitlist(course_id):
+    # removes and returns the oldest entry of the waitlist, an entry removed by a concurrent promotion is skipped
+    while True:
+        entry = WaitlistEntry.objects.filter(course=course_id).order_by("id").first()
+        if entry is None:
+            return None
+        if WaitlistEntry.objects.filter(pk=entry.pk).delete()[0]:
+            return entry
+
+
+def waitlist_position(course_id, student_id):
+    # 1 for the first student of the waitlist, None if the student isn't on it
+    entry = WaitlistEntry.objects.filter(course=course_id, student=student_id).first()
+    if entry is None:
+        return None
+    return WaitlistEntry.objects.filter(course=course_id, id__lte=entry.id).count()
+
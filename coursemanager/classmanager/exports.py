@@ -0,0 +1,71 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Enrollment, Submission, Attendance, Grade
+
+# rows fetched from the database at a time while streaming an export
+CHUNK_SIZE = 2000
+
+
+# column names and row querysets of each course dataset that can be exported
+DATASETS = {
+    "roster": (
+        ["student_id", "username", "first_name", "last_name", "email", "major", "standing", "date_joined"],
+        lambda course: Enrollment.objects.filter(course=course).order_by("id").values_list(
+            "student_id", "student__user__username", "student__user__first_name", "student__user__last_name",
+            "student__user__email", "student__major", "student__standing", "date_joined")
+    ),
+    "attendance": (
+        ["student_id", "username", "week"],
+        lambda course: Attendance.objects.filter(course=course).order_by("week", "student_id").values_list(
+            "student_id", "student__user__username", "week")
+    ),
+    "submissions": (
+        ["submission_id", "assignment_id", "assignment", "student_id", "username", "score", "points",
+         "date_submitted"],
+        lambda course: Submission.objects.filter(assignment__course=course).order_by("id").values_list(
+            "id", "assignment_id", "assignment__title", "student_id", "student__user__username", "score",
+            "assignment__points", "date_submitted")
+    ),
+    "grades": (
+        ["student_id", "username", "score"],
+        lambda course: Grade.objects.filter(course=course).order_by("student_id").values_list(
+            "student_id", "student__user__username", "score")
+    ),
+}
+
+
+class Echo:
+    # file-like object whose write returns the written line instead of storing it, for csv.writer
+    def write(self, value):
+        return value
+
+
+def export_rows(dataset, course):
+    # column names and a lazy iterator over the rows of a dataset, read from the database in chunks
+    columns, queryset = DATASETS[dataset]
+    return columns, queryset(course).iterator(chunk_size=CHUNK_SIZE)
+
+
+def csv_lines(columns, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    yield from batched(writer.writerow(row) for row in rows)
+
+
+def ndjson_lines(columns, rows):
+    yield from batched(json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder) + "\n" for row in rows)
+
+
+def batched(lines, size=100):
+    # join lines into larger pieces so that each piece sent to the client isn't a single row
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) == size:
+            yield "".join(batch)
+            batch = []
+    if batch:
+        yield "".join(batch)
@@ -1,7 +1,7 @@
 from django import forms
 from django.forms import ModelForm, Textarea
 from django.utils import timezone
-from .models import Student, Instructor, Course, Announcement, Assignment, Submission
+from .models import Student, Instructor, Course, Announcement, Assignment, Submission, GradingPolicy
 from datetime import datetime
 
 # date picker for dates between today and january 1 1920
@@ -33,7 +33,7 @@ class InstructorRegisterForm(ModelForm):
 class CourseCreationForm(ModelForm):
     class Meta:
         model = Course
-        fields = ["name", "department", "description", "length", "credits"]
+        fields = ["name", "department", "description", "length", "credits", "capacity"]
 
 
 class AnnouncementCreationForm(ModelForm):
@@ -55,3 +55,14 @@ class SubmissionForm(ModelForm):
     class Meta:
         model = Submission
         fields = ["text"]
+
+
+class GradingPolicyForm(ModelForm):
+    class Meta:
+        model = GradingPolicy
+        fields = ["assignment_weight", "attendance_weight", "a_cutoff", "b_cutoff", "c_cutoff", "d_cutoff"]
+        labels = {
+            "assignment_weight": "Assignments (% of the final score)",
+            "attendance_weight": "Attendance (% of the final score)",
+            "a_cutoff": "Lowest A", "b_cutoff": "Lowest B", "c_cutoff": "Lowest C", "d_cutoff": "Lowest D"
+        }
@@ -0,0 +1,92 @@
+import numpy as np
+
+from .models import Student, Assignment, Submission
+
+
+class Gradebook:
+    # student x assignment matrix of a course's scores, a student's score of an assignment is their best graded
+    # submission capped at the assignment's points like in final grades. Cells without a graded submission are NaN,
+    # `submitted` tells the ungraded ones apart from the missing ones
+    def __init__(self, students, assignments, scores, submitted):
+        self.students = students
+        self.assignments = assignments
+        self.points = np.array([assignment.points for assignment in assignments], dtype=float)
+        self.scores = np.minimum(scores, self.points)
+        graded = ~np.isnan(scores)
+        self.ungraded = submitted & ~graded
+
+        # per-student statistics, ungraded submissions don't earn points yet
+        self.totals = np.nansum(self.scores, axis=1)
+        self.possible = self.points.sum()
+        self.percentages = self.totals / self.possible * 100 if self.possible else np.zeros(len(students))
+        self.student_missing = (~submitted).sum(axis=1)
+
+        # per-assignment statistics, only computed for assignments that have at least one graded submission
+        self.assignment_missing = (~submitted).sum(axis=0)
+        self.means = np.full(len(assignments), np.nan)
+        self.medians = np.full(len(assignments), np.nan)
+        self.stddevs = np.full(len(assignments), np.nan)
+        columns = graded.any(axis=0)
+        if columns.any():
+            self.means[columns] = np.nanmean(self.scores[:, columns], axis=0)
+            self.medians[columns] = np.nanmedian(self.scores[:, columns], axis=0)
+            self.stddevs[columns] = np.nanstd(self.scores[:, columns], axis=0)
+
+    def rows(self):
+        # one row per student for templates, cells without a graded submission have a None score
+        scores = np.where(np.isnan(self.scores), None, self.scores).tolist()
+        return [
+            {"student": student, "total": total, "percentage": percentage, "missing": missing,
+             "cells": [{"score": score, "ungraded": ungraded} for score, ungraded in zip(row_scores, row_ungraded)]}
+            for student, row_scores, row_ungraded, total, percentage, missing in zip(
+                self.students, scores, self.ungraded.tolist(), self.totals.tolist(), self.percentages.tolist(),
+                self.student_missing.tolist())
+        ]
+
+    def columns(self):
+        # one column per assignment for templates, statistics of assignments without submissions are None
+        def values(array):
+            return np.where(np.isnan(array), None, array).tolist()
+        return [
+            {"assignment": assignment, "mean": mean, "median": median, "stddev": stddev, "missing": missing}
+            for assignment, mean, median, stddev, missing in zip(
+                self.assignments, values(self.means), values(self.medians), values(self.stddevs),
+                self.assignment_missing.tolist())
+        ]
+
+
+def build_gradebook(course):
+    # loads the roster, the assignments and every submission score of the course in three queries
+    students = list(Student.objects.filter(enrollment__course=course).select_related("user")
+                    .order_by("user__last_name", "user__first_name"))
+    assignments = list(Assignment.objects.filter(course=course).order_by("due_date", "id"))
+    submissions = Submission.objects.filter(assignment__course=course)\
+        .values_list("student_id", "assignment_id", "score", "is_graded")
+    submissions = np.array(list(submissions), dtype=float).reshape(-1, 4)
+    graded = submissions[:, 3] == 1
+    scores = score_matrix(students, assignments, submissions[graded, :3])
+    submitted = ~np.isnan(score_matrix(students, assignments, submissions[:, :3]))
+    return Gradebook(students, assignments, scores, submitted)
+
+
+def score_matrix(students, assignments, submissions):
+    # scatters (student_id, assignment_id, score) rows into a dense matrix keeping the best score of each cell
+    scores = np.full((len(students), len(assignments)), np.nan)
+    if not len(students) or not len(assignments) or not len(submissions):
+        return scores
+    student_ids = np.array([student.pk for student in students], dtype=float)
+    assignment_ids = np.array([assignment.pk for assignment in assignments], dtype=float)
+    rows = lookup(student_ids, submissions[:, 0])
+    columns = lookup(assignment_ids, submissions[:, 1])
+    # ignore submissions of students that are no longer enrolled
+    kept = (rows >= 0) & (columns >= 0)
+    np.fmax.at(scores, (rows[kept], columns[kept]), submissions[kept, 2])
+    return scores
+
+
+def lookup(ids, values):
+    # position of each value in ids, or -1 if it is not there
+    order = np.argsort(ids)
+    positions = np.searchsorted(ids, values, sorter=order).clip(max=len(ids) - 1)
+    found = ids[order[positions]] == values
+    return np.where(found, order[positions], -1)
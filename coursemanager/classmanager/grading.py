@@ -0,0 +1,61 @@
+from django.db import transaction
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import Least
+
+from . import course_cache
+from .models import Student, Enrollment, Assignment, Submission, Attendance, Grade, GradingPolicy
+
+# Final grades computed under the course's grading policy. The assignment part is the share of the course's
+# assignment points a student earned (their best submission of each assignment, capped at its points), the
+# attendance part the share of the weeks attendance was taken in that they attended. A part with nothing to
+# grade yet (no assignment, no attendance taken) gives its weight to the other one.
+
+
+def policy_of(course):
+    # the course's policy, or an unsaved one with the default weights and cutoffs
+    return GradingPolicy.objects.filter(course=course).first() or GradingPolicy(course=course)
+
+
+def final_scores(course, policy):
+    # {student_id: final score out of 100} of every enrolled student, from five aggregate queries
+    students = list(Enrollment.objects.filter(course=course).values_list("student_id", flat=True))
+    total_points = Assignment.objects.filter(course=course).aggregate(total=Sum("points"))["total"] or 0
+    earned = dict.fromkeys(students, 0)
+    best_scores = Submission.objects.filter(assignment__course=course).order_by().values("student", "assignment")\
+        .annotate(best=Least(Max("score"), F("assignment__points"))).values_list("student", "best")
+    for student_id, best in best_scores:
+        if student_id in earned:
+            earned[student_id] += best
+    attendances = Attendance.objects.filter(course=course).order_by()
+    weeks = attendances.aggregate(weeks=Count("week", distinct=True))["weeks"]
+    attended = dict(attendances.values("student").annotate(weeks=Count("week")).values_list("student", "weeks"))
+    assignment_weight = policy.assignment_weight if total_points else 0
+    attendance_weight = policy.attendance_weight if weeks else 0
+    if not assignment_weight + attendance_weight:
+        return dict.fromkeys(students, 0)
+    return {
+        student_id: min(100, round(100 * (
+            assignment_weight * (earned[student_id] / total_points if total_points else 0) +
+            attendance_weight * (attended.get(student_id, 0) / weeks if weeks else 0)
+        ) / (assignment_weight + attendance_weight)))
+        for student_id in students
+    }
+
+
+def compute_final_grades(course):
+    # computes and saves the final grade of every enrolled student in one upsert, returns how many were saved
+    policy = policy_of(course)
+    scores = final_scores(course, policy)
+    with transaction.atomic():
+        graded = set(Grade.objects.filter(course=course).values_list("student_id", flat=True))
+        Grade.objects.bulk_create(
+            [Grade(course=course, student_id=student_id, score=score, letter=policy.letter(score))
+             for student_id, score in scores.items()],
+            update_conflicts=True, unique_fields=["course", "student"], update_fields=["score", "letter"]
+        )
+        # like grading by hand, a student's first final grade in the course gives them its credits
+        Student.objects.filter(pk__in=[student_id for student_id in scores if student_id not in graded])\
+            .update(credits=F("credits") + course.credits)
+        # bulk writes skip the signal replacing the version of the cached grades
+        course_cache.bump_version(f"grades:{course.id}")
+    return len(scores)
@@ -0,0 +1,190 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.utils.module_loading import import_string
+
+from ...models import User
+
+
+class Command(BaseCommand):
+    help = "Compare the throughput of the app served by the WSGI and the ASGI handler (with the async views) " \
+           "at several numbers of concurrent clients. Requests are sent in-process, without a server or network."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", action="append", dest="paths",
+                            help="path to request, may be repeated (default: /view_all_courses)")
+        parser.add_argument("--username", help="send the requests logged in as this user")
+        parser.add_argument("--concurrency", type=int, nargs="+", default=[50, 200, 1000],
+                            help="numbers of concurrent clients to measure")
+        parser.add_argument("--requests", type=int, default=2000, help="requests sent at each concurrency")
+        parser.add_argument("--output", help="also write the results to this JSON file")
+        # runs one handler in this process, the command starts one process per handler so each one is
+        # loaded with its own settings.ASYNC_VIEWS
+        parser.add_argument("--handler", choices=["wsgi", "asgi"], help="internal, measure a single handler")
+
+    def handle(self, *args, **options):
+        paths = options["paths"] or ["/view_all_courses"]
+        if options["handler"]:
+            cookie = session_cookie(options["username"]) if options["username"] else ""
+            run = run_wsgi if options["handler"] == "wsgi" else run_asgi
+            results = [run(paths, cookie, concurrency, options["requests"]) for concurrency in options["concurrency"]]
+            self.stdout.write(json.dumps(results))
+            return
+        results = {}
+        for handler in ["wsgi", "asgi"]:
+            results[handler] = self.measure(handler, paths, options)
+        self.stdout.write(f"{'clients':>8} {'handler':>8} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+        for index, concurrency in enumerate(options["concurrency"]):
+            for handler in ["wsgi", "asgi"]:
+                result = results[handler][index]
+                self.stdout.write(f"{concurrency:>8} {handler:>8} {result['throughput']:>9.1f} "
+                                  f"{result['p50'] * 1000:>8.1f} {result['p95'] * 1000:>8.1f} {result['errors']:>7}")
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                json.dump(results, file, indent=2)
+
+    def measure(self, handler, paths, options):
+        command = [sys.executable, "-m", "django", "bench_asgi", "--handler", handler,
+                   "--requests", str(options["requests"]), "--concurrency"]
+        command += [str(concurrency) for concurrency in options["concurrency"]]
+        for path in paths:
+            command += ["--path", path]
+        if options["username"]:
+            command += ["--username", options["username"]]
+        env = dict(os.environ, CLASSMANAGER_ASYNC_VIEWS="1" if handler == "asgi" else "0",
+                   DJANGO_SETTINGS_MODULE=os.environ.get("DJANGO_SETTINGS_MODULE", "coursemanager.settings"))
+        process = subprocess.run(command, cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+        if process.returncode:
+            raise CommandError(f"The {handler} benchmark failed:\n{process.stderr}")
+        return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def session_cookie(username):
+    # a session logged in as the user, created directly in the session store
+    try:
+        user = User.objects.get(username=username)
+    except User.DoesNotExist:
+        raise CommandError(f"User '{username}' does not exist")
+    session = import_string(f"{settings.SESSION_ENGINE}.SessionStore")()
+    session[SESSION_KEY] = str(user.pk)
+    session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.save()
+    return f"{settings.SESSION_COOKIE_NAME}={session.session_key}"
+
+
+def summary(latencies, errors, elapsed, concurrency):
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "throughput": len(latencies) / elapsed,
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[int(len(latencies) * 0.95)],
+        "errors": errors
+    }
+
+
+def run_wsgi(paths, cookie, concurrency, requests):
+    # each client is a thread sending requests one after the other, like a threaded WSGI server
+    application = get_wsgi_application()
+    latencies, errors = [], []
+    remaining = iter(range(requests))
+    lock = threading.Lock()
+
+    def client():
+        while True:
+            with lock:
+                number = next(remaining, None)
+            if number is None:
+                return
+            start = time.perf_counter()
+            status = wsgi_request(application, paths[number % len(paths)], cookie)
+            latencies.append(time.perf_counter() - start)
+            if status >= 400:
+                errors.append(status)
+
+    wsgi_request(application, paths[0], cookie)
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summary(latencies, len(errors), time.perf_counter() - start, concurrency)
+
+
+def wsgi_request(application, path, cookie):
+    path, _, query = path.partition("?")
+    environ = {
+        "REQUEST_METHOD": "GET", "PATH_INFO": path, "QUERY_STRING": query, "SERVER_NAME": "localhost",
+        "SERVER_PORT": "80", "SERVER_PROTOCOL": "HTTP/1.1", "HTTP_HOST": "localhost", "HTTP_COOKIE": cookie,
+        "wsgi.version": (1, 0), "wsgi.url_scheme": "http", "wsgi.input": BytesIO(), "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True, "wsgi.multiprocess": False, "wsgi.run_once": False
+    }
+    statuses = []
+    response = application(environ, lambda status, headers: statuses.append(int(status.split()[0])))
+    for _ in response:
+        pass
+    response.close()
+    return statuses[0]
+
+
+def run_asgi(paths, cookie, concurrency, requests):
+    # each client is a task on one event loop sending requests one after the other, like an ASGI server
+    application = get_asgi_application()
+    latencies, errors = [], []
+    remaining = iter(range(requests))
+
+    async def client():
+        for number in remaining:
+            start = time.perf_counter()
+            status = await asgi_request(application, paths[number % len(paths)], cookie)
+            latencies.append(time.perf_counter() - start)
+            if status >= 400:
+                errors.append(status)
+
+    async def main():
+        await asgi_request(application, paths[0], cookie)
+        start = time.perf_counter()
+        await asyncio.gather(*[client() for _ in range(concurrency)])
+        return time.perf_counter() - start
+
+    elapsed = asyncio.run(main())
+    return summary(latencies, len(errors), elapsed, concurrency)
+
+
+async def asgi_request(application, path, cookie):
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": query.encode(), "root_path": "",
+        "headers": [(b"host", b"localhost"), (b"cookie", cookie.encode())],
+        "server": ("localhost", 80), "client": ("127.0.0.1", 0)
+    }
+    messages = [{"type": "http.request", "body": b"", "more_body": False}]
+    statuses = []
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        # the client never disconnects, Django cancels this once the response is sent
+        await asyncio.Future()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+
+    await application(scope, receive, send)
+    return statuses[0]
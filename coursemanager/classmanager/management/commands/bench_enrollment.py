@@ -0,0 +1,127 @@
+import logging
+import os
+import queue
+import random
+import tempfile
+import threading
+import time
+from copy import deepcopy
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.urls import reverse
+
+from .bench_sqlite import Measurements, request
+from ...models import User, Student, Instructor, Course, Enrollment, WaitlistEntry
+
+
+class Command(BaseCommand):
+    help = "Stress test seat allocation: students join a course with fewer seats than students from many threads " \
+           "at once through the join_course view, some of those who got a seat leave it, then the seats, " \
+           "enrollments and waitlist are checked for overbooking and lost students. Runs on a new temporary " \
+           "SQLite database with the configured connection profile."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--students", type=int, default=200)
+        parser.add_argument("--capacity", type=int, default=50, help="seats of the course")
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument("--leave", type=float, default=0.2,
+                            help="fraction of the students leaving the course if they got a seat")
+        parser.add_argument("--seed", type=int, default=0, help="seed choosing the students who leave")
+
+    def handle(self, *args, **options):
+        # failed requests are counted, not logged, nor are sampled requests
+        logging.getLogger("django.request").setLevel(logging.CRITICAL)
+        logging.getLogger("classmanager.performance").setLevel(logging.WARNING)
+        leavers = set(random.Random(options["seed"]).sample(range(options["students"]),
+                                                            int(options["students"] * options["leave"])))
+        # the default alias is pointed at a temporary database, new connections of every thread use its settings
+        original = deepcopy(connections.settings["default"])
+        connections["default"].close()
+        with tempfile.TemporaryDirectory() as directory:
+            connections.settings["default"]["NAME"] = os.path.join(directory, "bench.sqlite3")
+            try:
+                call_command("migrate", verbosity=0, interactive=False)
+                course, clients = seed(options["students"], options["capacity"])
+                connections["default"].close()
+                students = queue.Queue()
+                for index in range(options["students"]):
+                    students.put(index)
+                joins, leaves, left = Measurements(), Measurements(), []
+                threads = [threading.Thread(target=join_and_leave,
+                                            args=(students, clients, course, leavers, joins, leaves, left))
+                           for _ in range(options["threads"])]
+                start = time.perf_counter()
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                elapsed = time.perf_counter() - start
+                enrolled = set(Enrollment.objects.filter(course=course).values_list("student_id", flat=True))
+                waitlisted = list(WaitlistEntry.objects.filter(course=course).values_list("student_id", flat=True))
+                course.refresh_from_db()
+                problems = check(course, len(clients), enrolled, waitlisted, left)
+            finally:
+                connections["default"].close()
+                connections.settings["default"].clear()
+                connections.settings["default"].update(original)
+        self.stdout.write(
+            f"{len(joins.latencies)} joins in {elapsed:.2f}s ({len(joins.latencies) / elapsed:.1f}/s, "
+            f"p95 {joins.percentile(0.95) * 1000:.1f}ms), {len(leaves.latencies)} leaves "
+            f"(p95 {leaves.percentile(0.95) * 1000:.1f}ms), {joins.failed + leaves.failed} failed requests"
+        )
+        self.stdout.write(f"{len(enrolled)} of {course.capacity} seats taken, {len(waitlisted)} students waitlisted")
+        if problems:
+            raise CommandError("\n".join(problems))
+        self.stdout.write(self.style.SUCCESS("No overbooking, every student is enrolled, waitlisted or left"))
+
+
+def seed(students, capacity):
+    # an instructor with a course of `capacity` seats, and a logged in client for each student
+    user = User.objects.create(username="bench-instructor", is_instructor=True)
+    instructor = Instructor.objects.create(user=user, department="Science")
+    course = Course.objects.create(instructor=instructor, name="Bench", department="Science", credits=3,
+                                   description="", capacity=capacity)
+    clients = []
+    for i in range(students):
+        user = User.objects.create(username=f"bench-student-{i}", is_student=True)
+        Student.objects.create(user=user)
+        client = Client(HTTP_HOST="localhost", raise_request_exception=False)
+        client.force_login(user)
+        client.student_id = user.pk
+        clients.append(client)
+    return course, clients
+
+
+def join_and_leave(students, clients, course, leavers, joins, leaves, left):
+    while True:
+        try:
+            index = students.get_nowait()
+        except queue.Empty:
+            break
+        client = clients[index]
+        request(joins, client.post, reverse("join-course", args=[course.id]))
+        if index in leavers and Enrollment.objects.filter(course=course, student=client.student_id).exists():
+            request(leaves, client.post, reverse("leave-course", args=[course.id]))
+            if not Enrollment.objects.filter(course=course, student=client.student_id).exists():
+                left.append(client.student_id)
+    connections.close_all()
+
+
+def check(course, students, enrolled, waitlisted, left):
+    # the invariants of seat allocation, returns the violated ones
+    problems = []
+    if len(enrolled) > course.capacity:
+        problems.append(f"Overbooked: {len(enrolled)} students enrolled for {course.capacity} seats")
+    if course.enrolled_count != len(enrolled):
+        problems.append(f"enrolled_count is {course.enrolled_count} for {len(enrolled)} enrollments")
+    if waitlisted and len(enrolled) < course.capacity:
+        problems.append(f"{course.capacity - len(enrolled)} seats left free with {len(waitlisted)} students waiting")
+    if enrolled & set(waitlisted) or len(set(waitlisted)) != len(waitlisted):
+        problems.append("Students both enrolled and waitlisted, or waitlisted twice")
+    if len(enrolled) + len(waitlisted) + len(left) != students:
+        problems.append(f"{students - len(enrolled) - len(waitlisted) - len(left)} students neither enrolled, "
+                        f"waitlisted nor left")
+    return problems
@@ -0,0 +1,155 @@
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from copy import deepcopy
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from ...models import User, Student, Instructor, Course, Enrollment, Assignment
+
+
+class Command(BaseCommand):
+    help = "Measure concurrent writes to SQLite through the write views (joining and leaving courses, submissions " \
+           "and attendance) while other clients read course pages, with SQLite's defaults and with the " \
+           "configured profile (settings.SQLITE_PRAGMAS). Each run uses a new temporary database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--writers", type=int, default=16, help="threads of students writing")
+        parser.add_argument("--readers", type=int, default=8, help="threads of students reading course pages")
+        parser.add_argument("--duration", type=float, default=10, help="seconds each profile is measured")
+
+    def handle(self, *args, **options):
+        database = settings.DATABASES["default"]
+        profiles = {
+            # rollback journal, deferred transactions and a new connection for every request
+            "default": {"pragmas": {}, "options": {}, "conn_max_age": 0, "retries": 0},
+            "configured": {"pragmas": settings.SQLITE_PRAGMAS, "options": database.get("OPTIONS", {}),
+                           "conn_max_age": database.get("CONN_MAX_AGE", 0), "retries": settings.SQLITE_BUSY_RETRIES},
+        }
+        # failed requests are counted, not logged
+        logging.getLogger("django.request").setLevel(logging.CRITICAL)
+        self.stdout.write(f"{'profile':>10} {'writes/s':>9} {'failed':>7} {'write p95':>10} "
+                          f"{'reads/s':>8} {'failed':>7} {'read p95':>9}")
+        for name, profile in profiles.items():
+            writes, reads, elapsed = run_profile(profile, options)
+            self.stdout.write(
+                f"{name:>10} {len(writes.latencies) / elapsed:>9.1f} {writes.failed:>7} "
+                f"{writes.percentile(0.95) * 1000:>8.1f}ms {len(reads.latencies) / elapsed:>8.1f} "
+                f"{reads.failed:>7} {reads.percentile(0.95) * 1000:>7.1f}ms"
+            )
+
+
+class Measurements:
+    # latencies of successful requests and the number of failed ones, shared by threads
+    def __init__(self):
+        self.latencies = []
+        self.failed = 0
+        self.lock = threading.Lock()
+
+    def add(self, start, response):
+        with self.lock:
+            if response is not None and response.status_code < 400:
+                self.latencies.append(time.perf_counter() - start)
+            else:
+                self.failed += 1
+
+    def percentile(self, fraction):
+        latencies = sorted(self.latencies)
+        return latencies[int(len(latencies) * fraction)] if latencies else 0
+
+
+def run_profile(profile, options):
+    # the default alias is pointed at a temporary database, new connections of every thread use its settings
+    original = deepcopy(connections.settings["default"])
+    connections["default"].close()
+    with tempfile.TemporaryDirectory() as directory, \
+            override_settings(SQLITE_PRAGMAS=profile["pragmas"], SQLITE_BUSY_RETRIES=profile["retries"]):
+        connections.settings["default"].update({
+            "NAME": os.path.join(directory, "bench.sqlite3"),
+            "OPTIONS": profile["options"],
+            "CONN_MAX_AGE": profile["conn_max_age"],
+        })
+        try:
+            call_command("migrate", verbosity=0, interactive=False)
+            clients, courses, assignment = seed(options["writers"] + options["readers"])
+            connections["default"].close()
+            writes, reads = Measurements(), Measurements()
+            deadline = time.perf_counter() + options["duration"]
+            threads = [threading.Thread(target=write, args=(clients[i], courses, assignment, deadline, writes))
+                       for i in range(options["writers"])]
+            threads += [threading.Thread(target=read, args=(clients[i], courses[0], deadline, reads))
+                        for i in range(options["writers"], options["writers"] + options["readers"])]
+            threads.append(threading.Thread(target=take_attendance, args=(clients[-1], courses[0], deadline, writes)))
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+        finally:
+            connections["default"].close()
+            connections.settings["default"].clear()
+            connections.settings["default"].update(original)
+    return writes, reads, elapsed
+
+
+def seed(students):
+    # an instructor with two courses and students enrolled in the first one, with a logged in client for each
+    user = User.objects.create(username="bench-instructor", is_instructor=True)
+    instructor = Instructor.objects.create(user=user, department="Science")
+    courses = [Course.objects.create(instructor=instructor, name=f"Bench {i}", department="Science", credits=3,
+                                     description="") for i in range(2)]
+    assignment = Assignment.objects.create(course=courses[0], title="Bench", points=100)
+    clients = []
+    for i in range(students):
+        user = User.objects.create(username=f"bench-student-{i}", is_student=True)
+        student = Student.objects.create(user=user)
+        Enrollment.objects.create(course=courses[0], student=student)
+        client = Client(HTTP_HOST="localhost", raise_request_exception=False)
+        client.force_login(user)
+        clients.append(client)
+    instructor_client = Client(HTTP_HOST="localhost", raise_request_exception=False)
+    instructor_client.force_login(instructor.user)
+    return clients + [instructor_client], courses, assignment
+
+
+def request(measurements, method, *args, **kwargs):
+    start = time.perf_counter()
+    try:
+        response = method(*args, **kwargs)
+    except Exception:
+        response = None
+    measurements.add(start, response)
+
+
+def write(client, courses, assignment, deadline, measurements):
+    # submit the assignment, and now and then leave and join the second course
+    while time.perf_counter() < deadline:
+        request(measurements, client.post, reverse("create-submission", args=[courses[0].id, assignment.id]),
+                {"text": "Bench submission"})
+        if random.random() < 0.2:
+            request(measurements, client.post, reverse("join-course", args=[courses[1].id]))
+            request(measurements, client.post, reverse("leave-course", args=[courses[1].id]))
+    connections.close_all()
+
+
+def take_attendance(client, course, deadline, measurements):
+    students = {str(pk): "on" for pk in Enrollment.objects.filter(course=course).values_list("student_id", flat=True)}
+    while time.perf_counter() < deadline:
+        request(measurements, client.post, reverse("create-attendance", args=[course.id]),
+                dict(students, week=random.randint(1, course.length - 1)))
+    connections.close_all()
+
+
+def read(client, course, deadline, measurements):
+    while time.perf_counter() < deadline:
+        request(measurements, client.get, reverse("view-course", args=[course.id]))
+    connections.close_all()
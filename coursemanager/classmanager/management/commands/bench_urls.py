@@ -0,0 +1,156 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ... import urls
+from ...models import Student, Course, Enrollment, Assignment, Submission
+
+# routes that can't be requested repeatedly without changing the session
+SKIPPED_ROUTES = {"logout"}
+
+
+class Command(BaseCommand):
+    help = "Request every named route of classmanager.urls as a student and as an instructor of a seeded data set " \
+           "(see seed_scale) and record the p50/p95/p99 latency, query count and response size of each. Results " \
+           "can be written to JSON and compared with a baseline, failing on regressions."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--student", help="username of the student (default: the busiest student of the course)")
+        parser.add_argument("--instructor", help="username of the instructor (default: the instructor of the "
+                                                 "largest active course)")
+        parser.add_argument("--iterations", type=int, default=20, help="timed requests per route and role")
+        parser.add_argument("--warmup", type=int, default=2, help="untimed requests per route and role")
+        parser.add_argument("--route", action="append", dest="routes", help="only benchmark this route name")
+        parser.add_argument("--output", help="write the results to this JSON file")
+        parser.add_argument("--baseline", help="compare with the results in this JSON file")
+        parser.add_argument("--threshold", type=float, default=0.2,
+                            help="p95 latency increase over the baseline reported as a regression (0.2 = 20%%)")
+        parser.add_argument("--min-delta", type=float, default=5.0,
+                            help="milliseconds of p95 increase below which a route is never a regression")
+
+    def handle(self, *args, **options):
+        if options["iterations"] < 1:
+            raise CommandError("At least one iteration is needed")
+        course = self.course(options)
+        users = {"student": self.student(course, options), "instructor": course.instructor.user}
+        kwargs = route_kwargs(course, users["student"])
+        results = {}
+        for role, user in users.items():
+            client = Client(HTTP_HOST="localhost", raise_request_exception=False)
+            client.force_login(user)
+            for pattern in urls.urlpatterns:
+                if not pattern.name or pattern.name in SKIPPED_ROUTES or \
+                        (options["routes"] and pattern.name not in options["routes"]):
+                    continue
+                try:
+                    path = reverse(pattern.name, kwargs={name: kwargs[name] for name in pattern.pattern.converters})
+                except KeyError as error:
+                    self.stderr.write(f"Skipping {pattern.name}: no {error} in the data set")
+                    continue
+                results[f"{pattern.name}:{role}"] = measure(client, path, options["iterations"], options["warmup"])
+        self.report(results)
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                json.dump({"student": users["student"].username, "instructor": users["instructor"].username,
+                           "course": course.id, "iterations": options["iterations"], "routes": results},
+                          file, indent=2)
+        if options["baseline"]:
+            self.compare(results, options)
+
+    def course(self, options):
+        # the largest active course, of the given instructor if any
+        courses = Course.objects.filter(is_active=True).select_related("instructor__user")
+        if options["instructor"]:
+            courses = courses.filter(instructor__user__username=options["instructor"])
+        course = courses.annotate(students=Count("enrollment")).order_by("-students", "id").first()
+        if course is None:
+            raise CommandError("No active course to benchmark, create a data set with `manage.py seed_scale`")
+        return course
+
+    def student(self, course, options):
+        students = Student.objects.filter(pk__in=Enrollment.objects.filter(course=course).values("student"))
+        if options["student"]:
+            students = students.filter(user__username=options["student"])
+        student = students.annotate(courses=Count("enrollment")).order_by("-courses", "pk")\
+            .select_related("user").first()
+        if student is None:
+            raise CommandError(f"No student of '{course.name}' to benchmark with")
+        return student.user
+
+    def report(self, results):
+        self.stdout.write(f"{'route':<40} {'status':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+                          f"{'queries':>7} {'bytes':>9}")
+        for key, result in results.items():
+            self.stdout.write(f"{key:<40} {result['status']:>6} {result['p50']:>8.2f} {result['p95']:>8.2f} "
+                              f"{result['p99']:>8.2f} {result['queries']:>7} {result['bytes']:>9}")
+
+    def compare(self, results, options):
+        try:
+            with open(options["baseline"]) as file:
+                baseline = json.load(file)["routes"]
+        except (OSError, ValueError, KeyError) as error:
+            raise CommandError(f"Could not read the baseline: {error}")
+        regressions = []
+        for key, result in results.items():
+            if key not in baseline:
+                continue
+            before = baseline[key]
+            if result["p95"] > before["p95"] * (1 + options["threshold"]) and \
+                    result["p95"] - before["p95"] > options["min_delta"]:
+                regressions.append(f"{key}: p95 {before['p95']:.2f}ms -> {result['p95']:.2f}ms")
+            if result["queries"] > before["queries"]:
+                regressions.append(f"{key}: {before['queries']} -> {result['queries']} queries")
+        if regressions:
+            raise CommandError("Regressions over the baseline:\n" + "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS(f"No regression over {options['baseline']}"))
+
+
+def route_kwargs(course, student):
+    # URL arguments of the routes, taken from the benchmarked course
+    kwargs = {"course_id": course.id, "user_id": student.pk, "activity": "assignments", "dataset": "roster",
+              "role": "student"}
+    assignment = Assignment.objects.filter(course=course).order_by("id").first()
+    if assignment is not None:
+        kwargs["assignment_id"] = assignment.id
+        submission = Submission.objects.filter(assignment=assignment).order_by("id").first()
+        if submission is not None:
+            kwargs["submission_id"] = submission.id
+    return kwargs
+
+
+def percentile(values, fraction):
+    # nearest-rank percentile of sorted values
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def get(client, path):
+    # returns the response and its content, streamed responses are produced while they are read
+    response = client.get(path)
+    return response, b"".join(response) if response.streaming else response.content
+
+
+def measure(client, path, iterations, warmup):
+    for _ in range(warmup):
+        get(client, path)
+    latencies = []
+    for _ in range(iterations):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response, content = get(client, path)
+            latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "path": path,
+        "status": response.status_code,
+        "p50": percentile(latencies, 0.5),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "queries": len(queries),
+        "bytes": len(content)
+    }
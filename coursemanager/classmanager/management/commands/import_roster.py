@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...roster import import_roster
+
+
+class Command(BaseCommand):
+    help = "Create student accounts and enrollments from a roster CSV file " \
+           "(columns: username, email, first_name, last_name, password, major, standing, courses)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV file to import")
+        parser.add_argument("--processes", type=int, default=None,
+                            help="processes used to hash passwords (default: number of CPUs)")
+        parser.add_argument("--chunk-size", type=int, default=1000, help="rows imported per transaction")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options["path"], newline="", encoding="utf-8-sig") as file:
+                result = import_roster(file, processes=options["processes"], chunk_size=options["chunk_size"])
+        except OSError as error:
+            raise CommandError(error)
+        for line, message in result.errors:
+            self.stderr.write(f"line {line}: {message}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {result.created} students and {result.enrolled} enrollments, {len(result.errors)} errors"
+        ))
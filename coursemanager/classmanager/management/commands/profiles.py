@@ -0,0 +1,86 @@
+import json
+import os
+import pstats
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Merge the request profiles saved in settings.PROFILE_DIR (see classmanager.middleware." \
+           "profiling_middleware) and report, per URL name, the requests' timings, the functions that took the " \
+           "most time and the lines that allocated the most memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument("url_names", nargs="*", help="only report these URL names")
+        parser.add_argument("--dir", default=None, help="profile directory (default: settings.PROFILE_DIR)")
+        parser.add_argument("--limit", type=int, default=20, help="functions and allocation lines to show")
+        parser.add_argument("--sort", default="cumulative", choices=["cumulative", "tottime", "calls"],
+                            help="order of the functions")
+        parser.add_argument("--output", help="also write the merged cProfile stats to this .pstats file "
+                                             "(with a single URL name)")
+
+    def handle(self, *args, **options):
+        directory = str(options["dir"] or settings.PROFILE_DIR)
+        if not os.path.isdir(directory):
+            raise CommandError(f"No profiles in {directory}")
+        url_names = options["url_names"] or sorted(
+            name for name in os.listdir(directory) if os.path.isdir(os.path.join(directory, name)))
+        if options["output"] and len(url_names) != 1:
+            raise CommandError("--output needs a single URL name")
+        for url_name in url_names:
+            files = profile_files(os.path.join(directory, url_name))
+            if not files["json"]:
+                raise CommandError(f"No profiles of {url_name} in {directory}")
+            self.report(url_name, files, options)
+
+    def report(self, url_name, files, options):
+        requests = []
+        for path in files["json"]:
+            with open(path) as file:
+                requests.append(json.load(file))
+        durations = sorted(request["duration_ms"] for request in requests)
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{url_name}: {len(requests)} requests, mean {sum(durations) / len(durations):.1f}ms, "
+            f"max {durations[-1]:.1f}ms"
+        ))
+        peaks = [request["peak_bytes"] for request in requests if request["peak_bytes"] is not None]
+        if peaks:
+            self.stdout.write(f"peak memory: mean {sum(peaks) / len(peaks) / 1024:.0f} KiB, "
+                              f"max {max(peaks) / 1024:.0f} KiB")
+        if files["pstats"]:
+            stats = pstats.Stats(*files["pstats"], stream=self.stdout)
+            stats.strip_dirs().sort_stats(options["sort"]).print_stats(options["limit"])
+            if options["output"]:
+                stats.dump_stats(options["output"])
+        if files["allocations"]:
+            self.stdout.write(f"Top allocations over {len(files['allocations'])} requests (KiB per request, "
+                              f"blocks per request, line):")
+            for line, size, count in merged_allocations(files["allocations"])[:options["limit"]]:
+                self.stdout.write(f"{size / len(files['allocations']) / 1024:>10.1f} "
+                                  f"{count / len(files['allocations']):>10.0f}  {line}")
+        self.stdout.write("")
+
+
+def profile_files(directory):
+    # the .pstats, .allocations and .json files of the requests, by extension
+    files = {"pstats": [], "allocations": [], "json": []}
+    if os.path.isdir(directory):
+        for name in sorted(os.listdir(directory)):
+            extension = name.rpartition(".")[2]
+            if extension in files:
+                files[extension].append(os.path.join(directory, name))
+    return files
+
+
+def merged_allocations(paths):
+    # total size and number of the blocks allocated by each line, over every snapshot
+    totals = {}
+    for path in paths:
+        for statistic in tracemalloc.Snapshot.load(path).statistics("lineno"):
+            frame = statistic.traceback[0]
+            size, count = totals.get(f"{frame.filename}:{frame.lineno}", (0, 0))
+            totals[f"{frame.filename}:{frame.lineno}"] = (size + statistic.size, count + statistic.count)
+    return sorted(((line, size, count) for line, (size, count) in totals.items()), key=lambda total: total[1],
+                  reverse=True)
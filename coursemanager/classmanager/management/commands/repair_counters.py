@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from ...counters import course_counts, instructor_counts, drifted, recount_courses, recount_instructors
+from ...models import Instructor, Course
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized counters of courses (enrolled students, assignments, announcements, " \
+           "ungraded submissions) and instructors (courses) from their rows, in bulk. Counters only drift when " \
+           "rows are written without the app, e.g. with raw SQL or bulk inserts."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--course", type=int, action="append", dest="courses",
+                            help="only recount this course (and its instructor)")
+        parser.add_argument("--check", action="store_true",
+                            help="only report the rows whose counters are wrong, failing if there are any")
+
+    def handle(self, *args, **options):
+        course_ids, instructor_ids = options["courses"], None
+        courses, instructors = Course.objects.all(), Instructor.objects.all()
+        if course_ids:
+            courses = courses.filter(pk__in=course_ids)
+            instructor_ids = list(courses.values_list("instructor", flat=True))
+            instructors = instructors.filter(pk__in=instructor_ids)
+        with transaction.atomic():
+            wrong_courses = drifted(courses, course_counts()).count()
+            wrong_instructors = drifted(instructors, instructor_counts()).count()
+            if options["check"]:
+                if wrong_courses or wrong_instructors:
+                    raise CommandError(f"Wrong counters on {wrong_courses} courses and {wrong_instructors} "
+                                       f"instructors, run `manage.py repair_counters`")
+                self.stdout.write(self.style.SUCCESS("Every counter is right"))
+                return
+            recount_courses(course_ids)
+            recount_instructors(instructor_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f"Recounted {courses.count()} courses and {instructors.count()} instructors, "
+            f"fixed {wrong_courses} courses and {wrong_instructors} instructors"
+        ))
@@ -0,0 +1,192 @@
+import random
+import time
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+
+from ... import counters, course_cache, progress, search
+from ...models import User, Student, Instructor, Course, Enrollment, \
+    Announcement, Assignment, Submission, Attendance, Grade, CourseProgress
+
+FIRST_NAMES = ["Ada", "Alex", "Amara", "Ben", "Chen", "Dara", "Elena", "Farah", "Gus", "Hana", "Ivan", "Jade",
+               "Kofi", "Lena", "Mateo", "Nia", "Omar", "Priya", "Quinn", "Rosa", "Sam", "Tariq", "Uma", "Yuki"]
+LAST_NAMES = ["Adams", "Bello", "Chan", "Diaz", "Eze", "Fischer", "Garcia", "Haddad", "Ito", "Jensen", "Khan",
+              "Lopez", "Mensah", "Novak", "Okafor", "Patel", "Rossi", "Silva", "Tanaka", "Wong"]
+SUBJECTS = {
+    "Math": ["Calculus", "Linear Algebra", "Statistics", "Number Theory", "Discrete Math"],
+    "English": ["Composition", "Poetry", "Literature", "Rhetoric", "Creative Writing"],
+    "Science": ["Physics", "Chemistry", "Biology", "Astronomy", "Geology"],
+    "Technology": ["Programming", "Databases", "Networks", "Operating Systems", "Algorithms"],
+    "Law": ["Contracts", "Torts", "Constitutional Law", "Criminal Law", "Ethics"],
+    "Art": ["Drawing", "Painting", "Sculpture", "Art History", "Photography"],
+    "Business": ["Accounting", "Marketing", "Finance", "Management", "Economics"],
+    "Health": ["Anatomy", "Nutrition", "Public Health", "Physiology", "Pharmacology"],
+}
+
+
+class Command(BaseCommand):
+    help = "Generate a large, reproducible data set for load testing: students, instructors, courses of very " \
+           "different sizes (a few of --max-seats seats, most small) with their assignments, submissions, " \
+           "attendance and final grades. Rows are added next to the existing ones, every user gets --password."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--students", type=int, default=20000)
+        parser.add_argument("--instructors", type=int, default=250)
+        parser.add_argument("--courses", type=int, default=1200)
+        parser.add_argument("--max-seats", type=int, default=1000, help="seats of the largest courses")
+        parser.add_argument("--assignments", type=int, default=6, help="average number of assignments per course")
+        parser.add_argument("--password", default="password", help="password of every generated user")
+        parser.add_argument("--seed", type=int, default=0, help="seed of the random generator")
+        parser.add_argument("--batch-size", type=int, default=10000, help="rows inserted at a time")
+
+    def handle(self, *args, **options):
+        if options["students"] < 1 or options["instructors"] < 1:
+            raise CommandError("At least one student and one instructor are needed")
+        start = time.perf_counter()
+        seeder = ScaleSeeder(options)
+        with transaction.atomic():
+            seeder.seed()
+            # bulk inserts skip the signals keeping the counters, the students' progress, the search index and
+            # the cached catalog up to date
+            course_ids = range(seeder.first_course_id, seeder.next_id[Course])
+            counters.recount_courses(course_ids, ["assignment_count", "announcement_count", "ungraded_count"])
+            counters.recount_instructors(seeder.instructor_ids)
+            seeder.counts[CourseProgress] = len(progress.rebuild(course_ids, batch_size=seeder.batch_size))
+        search.index_courses(seeder.first_course_id, seeder.next_id[Course] - 1)
+        course_cache.bump_version("catalog")
+        if connection.vendor == "sqlite":
+            # refresh the statistics the query planner uses to pick indexes
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+        for model, count in seeder.counts.items():
+            self.stdout.write(f"{model.__name__:>12}: {count}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {sum(seeder.counts.values())} rows in {time.perf_counter() - start:.1f}s"
+        ))
+
+
+class ScaleSeeder:
+    def __init__(self, options):
+        self.options = options
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        self.counts = {}
+        # primary keys are assigned here, after the existing rows, so related rows can be generated without
+        # reading back what was inserted
+        self.next_id = {model: (model.objects.aggregate(id=Max("pk"))["id"] or 0) + 1
+                        for model in [User, Course, Enrollment, Assignment, Submission, Attendance, Grade]}
+        self.first_course_id = self.next_id[Course]
+
+    def new_id(self, model):
+        self.next_id[model] += 1
+        return self.next_id[model] - 1
+
+    def insert(self, model, fields, rows):
+        # rows are tuples of values for `fields` (foreign keys as ids), the other columns get their default.
+        # They are inserted in batches with executemany, creating model instances would take most of the time
+        fields = [model._meta.get_field(name) for name in fields]
+        others = [field for field in model._meta.concrete_fields if field not in fields]
+        instance = model()
+        defaults = tuple(field.get_db_prep_save(field.pre_save(instance, True), connection) for field in others)
+        columns = ", ".join(connection.ops.quote_name(field.column) for field in fields + others)
+        sql = f"INSERT INTO {connection.ops.quote_name(model._meta.db_table)} ({columns}) " \
+              f"VALUES ({', '.join(['%s'] * (len(fields) + len(others)))})"
+        rows = iter(rows)
+        self.counts.setdefault(model, 0)
+        with connection.cursor() as cursor:
+            while True:
+                batch = [row + defaults for row in islice(rows, self.batch_size)]
+                if not batch:
+                    return
+                cursor.executemany(sql, batch)
+                self.counts[model] += len(batch)
+
+    def seed(self):
+        options, rng = self.options, self.rng
+        # a single hash for every user, hashing is by far the slowest part of creating a user
+        password = make_password(options["password"])
+        instructor_ids = self.instructor_ids = [self.new_id(User) for _ in range(options["instructors"])]
+        student_ids = [self.new_id(User) for _ in range(options["students"])]
+        self.insert(User, ["id", "username", "email", "password", "first_name", "last_name", "is_instructor",
+                           "is_student"],
+                    (self.user(user_id, password, instructor=True) for user_id in instructor_ids))
+        self.insert(User, ["id", "username", "email", "password", "first_name", "last_name", "is_instructor",
+                           "is_student"],
+                    (self.user(user_id, password) for user_id in student_ids))
+        departments = [department for department, _ in Instructor.DEPARTMENTS]
+        instructors = {user_id: rng.choice(departments) for user_id in instructor_ids}
+        self.insert(Instructor, ["user", "department"], instructors.items())
+        majors, standings = [major for major, _ in Student.MAJORS], [standing for standing, _ in Student.STANDINGS]
+        self.insert(Student, ["user", "major", "standing", "credits"],
+                    ((user_id, rng.choice(majors), rng.choice(standings), rng.randint(0, 120))
+                     for user_id in student_ids))
+        courses = [self.course(instructor_ids, instructors) for _ in range(options["courses"])]
+        rosters = {course.id: rng.sample(student_ids, min(self.seats(index), len(student_ids)))
+                   for index, course in enumerate(courses)}
+        self.insert(Course, ["id", "instructor", "name", "department", "description", "credits", "length",
+                             "is_active", "capacity", "enrolled_count"],
+                    ((course.id, course.instructor_id, course.name, course.department, course.description,
+                      course.credits, course.length, course.is_active, self.capacity(len(rosters[course.id])),
+                      len(rosters[course.id])) for course in courses))
+        # (id, points) of the assignments of each course
+        assignments = {course.id: [(self.new_id(Assignment), rng.choice([10, 20, 50, 100]))
+                                   for _ in range(rng.randint(0, 2 * options["assignments"]))]
+                       for course in courses}
+        self.insert(Assignment, ["id", "course", "title", "description", "points"],
+                    ((assignment_id, course_id, f"Assignment {number}", "Generated assignment", points)
+                     for course_id, course_assignments in assignments.items()
+                     for number, (assignment_id, points) in enumerate(course_assignments, start=1)))
+        self.insert(Announcement, ["course", "text"], ((course.id, f"Welcome to {course.name}!") for course in courses))
+        self.insert(Enrollment, ["id", "course", "student"],
+                    ((self.new_id(Enrollment), course_id, student_id)
+                     for course_id, roster in rosters.items() for student_id in roster))
+        self.insert(Submission, ["id", "assignment", "student", "text", "score", "is_graded"],
+                    self.submissions(courses, rosters, assignments))
+        self.insert(Attendance, ["id", "course", "student", "week"],
+                    ((self.new_id(Attendance), course.id, student_id, week)
+                     for course in courses for student_id in rosters[course.id]
+                     for week in range(1, course.length) if rng.random() < 0.85))
+        self.insert(Grade, ["id", "course", "student", "score"],
+                    ((self.new_id(Grade), course.id, student_id, min(100, max(0, round(rng.gauss(78, 12)))))
+                     for course in courses if not course.is_active for student_id in rosters[course.id]))
+
+    def user(self, user_id, password, instructor=False):
+        username = f"{'instructor' if instructor else 'student'}{user_id}"
+        return (user_id, username, f"{username}@example.com", password, self.rng.choice(FIRST_NAMES),
+                self.rng.choice(LAST_NAMES), instructor, not instructor)
+
+    def course(self, instructor_ids, instructors):
+        instructor_id = self.rng.choice(instructor_ids)
+        department = instructors[instructor_id]
+        name = f"{self.rng.choice(SUBJECTS[department])} {self.rng.randint(100, 499)}"
+        # a quarter of the courses are finished, with final grades
+        return Course(id=self.new_id(Course), instructor_id=instructor_id, name=name, department=department,
+                      description=f"An introduction to {name}.", credits=self.rng.choice([2, 3, 4, 5]),
+                      length=self.rng.choice([8, 10, 12, 14]), is_active=self.rng.random() >= 0.25)
+
+    def seats(self, index):
+        # one course in 200 is full size, the others follow a Pareto distribution, mostly 10 to 40 seats
+        max_seats = self.options["max_seats"]
+        if index % 200 == 0:
+            return max_seats
+        return min(max_seats, int(10 * self.rng.paretovariate(1.2)))
+
+    def capacity(self, enrolled):
+        # the largest courses and one in five of the others are full, the others have a few seats left
+        if enrolled >= self.options["max_seats"] or self.rng.random() < 0.2:
+            return enrolled
+        return enrolled + self.rng.randint(1, 10)
+
+    def submissions(self, courses, rosters, assignments):
+        # students submit most assignments, those of finished courses and about half of the others are graded
+        rng = self.rng
+        for course in courses:
+            for assignment_id, points in assignments[course.id]:
+                for student_id in rosters[course.id]:
+                    if rng.random() < 0.75:
+                        graded = not course.is_active or rng.random() < 0.5
+                        yield (self.new_id(Submission), assignment_id, student_id, "Generated submission",
+                               rng.randint(points // 2, points) if graded else 0, graded)
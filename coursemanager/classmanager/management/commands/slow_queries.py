@@ -0,0 +1,75 @@
+import json
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Summarize the slow query log (settings.SLOW_QUERY_LOG and its rotated files): the queries that took " \
+           "the most time in total, grouped by the code that issued them and their SQL, with their query plan."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--file", default=None, help="log to read (default: settings.SLOW_QUERY_LOG)")
+        parser.add_argument("--limit", type=int, default=10, help="number of queries to show")
+        parser.add_argument("--since", type=float, default=None,
+                            help="only count the queries logged in the last this many hours")
+
+    def handle(self, *args, **options):
+        path = str(options["file"] or settings.SLOW_QUERY_LOG)
+        # rotated files are named log.1 (the newest) to log.N
+        paths = [f"{path}.{number}" for number in range(1, 100) if os.path.exists(f"{path}.{number}")]
+        if os.path.exists(path):
+            paths.append(path)
+        if not paths:
+            raise CommandError(f"No slow query log at {path}")
+        entries = read_entries(paths)
+        if options["since"] is not None:
+            start = time.time() - options["since"] * 3600
+            entries = [entry for entry in entries if entry["time"] >= start]
+        offenders = summarize(entries)
+        self.stdout.write(f"{len(entries)} slow queries, {len(offenders)} distinct, "
+                          f"{sum(offender['total_ms'] for offender in offenders) / 1000:.1f}s in total")
+        for rank, offender in enumerate(offenders[:options["limit"]], start=1):
+            site = f"{offender['file']}:{offender['line']} in {offender['function']}" if offender["file"] \
+                else "outside the app"
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"\n{rank}. {offender['total_ms']:.0f}ms total, {offender['count']} queries, "
+                f"mean {offender['total_ms'] / offender['count']:.1f}ms, max {offender['max_ms']:.1f}ms - {site}"
+            ))
+            self.stdout.write(f"   {offender['sql']}")
+            for step in offender["plan"] or []:
+                # full table scans are what usually needs an index
+                line = f"   | {step}"
+                self.stdout.write(self.style.WARNING(line) if step.startswith("SCAN") else line)
+
+
+def read_entries(paths):
+    entries = []
+    for path in paths:
+        with open(path) as file:
+            for line in file:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # a line cut by a crash or a rotation
+                    continue
+    return entries
+
+
+def summarize(entries):
+    # totals per call site and SQL, the plan is the one of the slowest query
+    offenders = {}
+    for entry in entries:
+        key = (entry["file"], entry["line"], entry["sql"])
+        offender = offenders.setdefault(key, {
+            "file": entry["file"], "function": entry["function"], "line": entry["line"], "sql": entry["sql"],
+            "count": 0, "total_ms": 0.0, "max_ms": 0.0, "plan": None
+        })
+        offender["count"] += 1
+        offender["total_ms"] += entry["duration_ms"]
+        if entry["duration_ms"] >= offender["max_ms"]:
+            offender["max_ms"] = entry["duration_ms"]
+            offender["plan"] = entry["plan"]
+    return sorted(offenders.values(), key=lambda offender: offender["total_ms"], reverse=True)
@@ -0,0 +1,49 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = "Copy the default SQLite database into the replica and reporting databases " \
+           "(settings.DATABASE_REPLICAS and settings.DATABASE_REPORTING) with SQLite's online backup API"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=None,
+                            help="keep copying every this many seconds instead of copying once")
+
+    def handle(self, *args, **options):
+        aliases = list(settings.DATABASE_REPLICAS)
+        if settings.DATABASE_REPORTING:
+            aliases.append(settings.DATABASE_REPORTING)
+        if not aliases:
+            raise CommandError("No replica or reporting database is configured "
+                               "(see CLASSMANAGER_REPLICAS and CLASSMANAGER_REPORTING_DB)")
+        for alias in [DEFAULT_DB_ALIAS] + aliases:
+            if connections[alias].vendor != "sqlite":
+                raise CommandError(f"'{alias}' is not a SQLite database, use the database's own replication")
+        while True:
+            start = time.perf_counter()
+            for alias in aliases:
+                copy_database(connections[DEFAULT_DB_ALIAS].settings_dict["NAME"],
+                              connections[alias].settings_dict["NAME"])
+            self.stdout.write(f"Copied the database to {', '.join(aliases)} "
+                              f"in {time.perf_counter() - start:.2f}s")
+            if options["interval"] is None:
+                break
+            time.sleep(options["interval"])
+
+
+def copy_database(source, destination):
+    # the backup reads a consistent snapshot of the source and replaces the destination in place, so its open
+    # connections see the new content on their next read (they wait for busy_timeout while it is written)
+    timeout = settings.SQLITE_PRAGMAS.get("busy_timeout", 5000) / 1000
+    source_connection = sqlite3.connect(source, timeout=timeout)
+    destination_connection = sqlite3.connect(destination, timeout=timeout)
+    try:
+        source_connection.backup(destination_connection)
+    finally:
+        source_connection.close()
+        destination_connection.close()
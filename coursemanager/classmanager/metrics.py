@@ -0,0 +1,187 @@
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.views.decorators.http import require_GET
+
+# Request and cache metrics in the Prometheus text format. Each worker process counts in memory and writes its
+# counts to settings.METRICS_DIR/<pid>.json (at most every METRICS_FLUSH_INTERVAL seconds), and the /metrics view
+# of any worker sums the files of all of them, so no shared memory or metrics service is needed. A worker removes its
+# file when it exits, and the files of workers that were killed are skipped and removed by the next scrape.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+# name: (type, help, histogram buckets)
+METRICS = {
+    "classmanager_requests_total": ("counter", "Requests handled, by URL name, method and status.", None),
+    "classmanager_request_duration_seconds": ("histogram", "Time spent handling requests.", LATENCY_BUCKETS),
+    "classmanager_request_queries": ("histogram", "Database queries run per request.", QUERY_BUCKETS),
+    "classmanager_request_db_duration_seconds": ("histogram", "Time spent in the database per request.",
+                                                 LATENCY_BUCKETS),
+    "classmanager_cache_requests_total": ("counter", "Cache reads, by cache and result (hit or miss).", None),
+}
+
+
+def label_text(labels):
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return ",".join(f'{name}="{escape(value)}"' for name, value in labels.items())
+
+
+class Registry:
+    # counters are {name: {labels: value}}, histograms {name: {labels: {"counts": [per bucket and +Inf],
+    # "sum": total}}} with the labels as their text, so worker files can be merged by key
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.flushed = 0.0
+
+    def increment(self, name, labels, value=1):
+        labels = label_text(labels)
+        with self.lock:
+            counter = self.counters.setdefault(name, {})
+            counter[labels] = counter.get(labels, 0) + value
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        labels = label_text(labels)
+        with self.lock:
+            histogram = self.histograms.setdefault(name, {}).setdefault(
+                labels, {"counts": [0] * (len(buckets) + 1), "sum": 0})
+            histogram["counts"][bisect_left(buckets, value)] += 1
+            histogram["sum"] += value
+
+    def flush(self, force=False):
+        # written to a temporary file and renamed, so readers never see a partial file
+        if not force and time.monotonic() - self.flushed < settings.METRICS_FLUSH_INTERVAL:
+            return
+        with self.lock:
+            self.flushed = time.monotonic()
+            data = json.dumps({"counters": self.counters, "histograms": self.histograms})
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", dir=settings.METRICS_DIR, suffix=".tmp", delete=False) as file:
+            file.write(data)
+        os.replace(file.name, worker_file(os.getpid()))
+
+
+registry = Registry()
+
+
+def worker_file(pid):
+    return os.path.join(settings.METRICS_DIR, f"{pid}.json")
+
+
+def running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # a process of another user reuses the pid
+        return False
+    return True
+
+
+@atexit.register
+def remove_on_exit():
+    # the counts of a stopped worker aren't served anymore, Prometheus sees the drop as a counter reset
+    if registry.flushed:
+        try:
+            os.remove(worker_file(os.getpid()))
+        except FileNotFoundError:
+            pass
+
+
+def record_request(url_name, method, status, duration, queries, db_duration):
+    # called by the performance middleware once a request is handled, durations in seconds
+    labels = {"view": url_name or "unnamed"}
+    registry.increment("classmanager_requests_total", {**labels, "method": method, "status": status})
+    registry.observe("classmanager_request_duration_seconds", labels, duration)
+    registry.observe("classmanager_request_queries", labels, queries)
+    registry.observe("classmanager_request_db_duration_seconds", labels, db_duration)
+    registry.flush()
+
+
+def record_cache(cache, hit):
+    if settings.METRICS_ENABLED:
+        registry.increment("classmanager_cache_requests_total", {"cache": cache, "result": "hit" if hit else "miss"})
+
+
+def merged():
+    # the sum of the counts of every worker
+    counters, histograms = {}, {}
+    for name in os.listdir(settings.METRICS_DIR):
+        pid, extension = os.path.splitext(name)
+        if extension != ".json" or not pid.isdigit():
+            continue
+        if not running(int(pid)):
+            # a worker killed before it could remove its file
+            try:
+                os.remove(worker_file(pid))
+            except FileNotFoundError:
+                pass
+            continue
+        try:
+            with open(worker_file(pid)) as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            # removed since it was listed
+            continue
+        for metric, values in data["counters"].items():
+            for labels, value in values.items():
+                counters.setdefault(metric, {})
+                counters[metric][labels] = counters[metric].get(labels, 0) + value
+        for metric, values in data["histograms"].items():
+            for labels, histogram in values.items():
+                total = histograms.setdefault(metric, {}).setdefault(
+                    labels, {"counts": [0] * len(histogram["counts"]), "sum": 0})
+                total["counts"] = [a + b for a, b in zip(total["counts"], histogram["counts"])]
+                total["sum"] += histogram["sum"]
+    return counters, histograms
+
+
+def exposition(counters, histograms):
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        for labels, value in sorted(counters.get(name, {}).items()):
+            lines.append(f"{name}{{{labels}}} {value}")
+        for labels, histogram in sorted(histograms.get(name, {}).items()):
+            cumulative = 0
+            for bound, count in zip(buckets + ("+Inf",), histogram["counts"]):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{labels}}} {histogram['sum']}")
+            lines.append(f"{name}_count{{{labels}}} {cumulative}")
+    # hit ratios of the caches, also computable from classmanager_cache_requests_total
+    lines += ["# HELP classmanager_cache_hit_ratio Fraction of the cache reads that were hits.",
+              "# TYPE classmanager_cache_hit_ratio gauge"]
+    reads = {}
+    for labels, value in counters.get("classmanager_cache_requests_total", {}).items():
+        cache, _, result = labels.rpartition(",result=")
+        hits, total = reads.get(cache, (0, 0))
+        reads[cache] = (hits + value if result == '"hit"' else hits, total + value)
+    for cache, (hits, total) in sorted(reads.items()):
+        lines.append(f"classmanager_cache_hit_ratio{{{cache}}} {hits / total}")
+    return "\n".join(lines) + "\n"
+
+
+@require_GET
+def metrics(request):
+    # scraped by Prometheus with settings.METRICS_TOKEN as bearer token, or read by staff users
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    scraper = settings.METRICS_TOKEN and request.headers.get("Authorization") == f"Bearer {settings.METRICS_TOKEN}"
+    if not scraper and not request.user.is_staff:
+        return HttpResponse("Unauthorized\n", status=401, content_type="text/plain")
+    # this worker's counts are written first so the response includes them
+    registry.flush(force=True)
+    return HttpResponse(exposition(*merged()), content_type="text/plain; version=0.0.4; charset=utf-8")
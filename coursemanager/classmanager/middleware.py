@@ -0,0 +1,229 @@
+import cProfile
+import json
+import logging
+import os
+import random
+import threading
+import time
+import tracemalloc
+from contextvars import ContextVar
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.template.base import Template
+from django.utils.decorators import sync_and_async_middleware
+
+from .metrics import record_request
+
+logger = logging.getLogger("classmanager.performance")
+
+# metrics of the request being handled, None when it is neither sampled nor counted in /metrics
+_metrics = ContextVar("performance_metrics", default=None)
+
+
+class RequestMetrics:
+    def __init__(self, sampled):
+        self.sampled = sampled
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.rendering = False
+
+    def timings(self):
+        # milliseconds spent in the database, in templates (excluding the queries they run) and in total
+        total = (time.perf_counter() - self.start) * 1000
+        db, template = self.db_time * 1000, self.template_time * 1000
+        return {"total": total, "db": db, "template": template, "app": max(0.0, total - db - template)}
+
+
+def record_query(execute, sql, params, many, context):
+    # execute wrapper installed on every connection, it only times queries of measured requests
+    metrics = _metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_time += time.perf_counter() - start
+        metrics.queries += 1
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+_render = Template.render
+
+
+def timed_render(self, context):
+    # times the outermost template render of measured requests, included and extended templates are part of it
+    metrics = _metrics.get()
+    if metrics is None or metrics.rendering:
+        return _render(self, context)
+    metrics.rendering = True
+    start, db_time = time.perf_counter(), metrics.db_time
+    try:
+        return _render(self, context)
+    finally:
+        # queries run by lazy querysets while rendering are counted as database time
+        metrics.template_time += time.perf_counter() - start - (metrics.db_time - db_time)
+        metrics.rendering = False
+
+
+def install_instrumentation():
+    # called once the apps are ready, so that every connection and template render is instrumented
+    connection_created.connect(install_query_recorder, dispatch_uid="classmanager.performance")
+    Template.render = timed_render
+
+
+@sync_and_async_middleware
+def performance_middleware(get_response):
+    # measures a sample of the requests (settings.PERFORMANCE_SAMPLE_RATE) and reports the time spent in the
+    # database, in templates and in total in a Server-Timing header and a JSON log line tagged with the URL name.
+    # With settings.METRICS_ENABLED every request is measured and counted in the /metrics histograms.
+    def begin():
+        sampled = random.random() < settings.PERFORMANCE_SAMPLE_RATE
+        if not sampled and not settings.METRICS_ENABLED:
+            return None
+        return _metrics.set(RequestMetrics(sampled))
+
+    def finish(request, response, token):
+        metrics = _metrics.get()
+        _metrics.reset(token)
+        timings = metrics.timings()
+        match = request.resolver_match
+        url_name = match.url_name if match else None
+        if settings.METRICS_ENABLED:
+            record_request(url_name, request.method, response.status_code, timings["total"] / 1000,
+                           metrics.queries, timings["db"] / 1000)
+        if not metrics.sampled:
+            return
+        response["Server-Timing"] = ", ".join([
+            f'db;dur={timings["db"]:.2f};desc="{metrics.queries} queries"',
+            f'template;dur={timings["template"]:.2f}',
+            f'app;dur={timings["app"]:.2f}',
+            f'total;dur={timings["total"]:.2f}',
+        ])
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({
+                "url_name": url_name,
+                "method": request.method,
+                "status": response.status_code,
+                "queries": metrics.queries,
+                **{f"{name}_ms": round(value, 2) for name, value in timings.items()},
+            }))
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            token = begin()
+            if token is None:
+                return await get_response(request)
+            try:
+                response = await get_response(request)
+            except BaseException:
+                _metrics.reset(token)
+                raise
+            finish(request, response, token)
+            return response
+    else:
+        def middleware(request):
+            token = begin()
+            if token is None:
+                return get_response(request)
+            try:
+                response = get_response(request)
+            except BaseException:
+                _metrics.reset(token)
+                raise
+            finish(request, response, token)
+            return response
+    return middleware
+
+
+# cProfile and tracemalloc trace the whole process, so profiled requests run one at a time
+_profiling_lock = threading.Lock()
+
+
+def profile_modes(request):
+    # "cpu", "memory", "cpu,memory" or "all" in the X-Profile header or the profile query parameter
+    value = request.headers.get("X-Profile") or request.GET.get("profile")
+    if not value:
+        return set()
+    if value == "all":
+        return {"cpu", "memory"}
+    return set(value.split(",")) & {"cpu", "memory"}
+
+
+@sync_and_async_middleware
+def profiling_middleware(get_response):
+    # runs the requests of staff users that ask for it under cProfile and/or tracemalloc and saves the .pstats,
+    # the allocation snapshot and the request's timings to settings.PROFILE_DIR/<url name>/, where
+    # `manage.py profiles` merges them. Must come after AuthenticationMiddleware.
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            modes = profile_modes(request)
+            if not modes or not (await request.auser()).is_staff:
+                return await get_response(request)
+            # the profilers and their lock are synchronous, only profiled requests leave the event loop
+            return await sync_to_async(profile)(request, modes, async_to_sync(get_response))
+    else:
+        def middleware(request):
+            modes = profile_modes(request)
+            if not modes or not request.user.is_staff:
+                return get_response(request)
+            return profile(request, modes, get_response)
+    return middleware
+
+
+def profile(request, modes, get_response):
+    with _profiling_lock:
+        profiler = cProfile.Profile() if "cpu" in modes else None
+        tracing = "memory" in modes and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        if "memory" in modes:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        try:
+            response = get_response(request)
+        finally:
+            if profiler:
+                profiler.disable()
+            duration = (time.perf_counter() - start) * 1000
+            snapshot = peak = None
+            if "memory" in modes:
+                # allocations made during the request that were still alive at its end
+                snapshot = tracemalloc.take_snapshot().filter_traces([
+                    tracemalloc.Filter(False, tracemalloc.__file__),
+                    tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+                ])
+                peak = tracemalloc.get_traced_memory()[1]
+            if tracing:
+                tracemalloc.stop()
+    match = request.resolver_match
+    name = save_profile(match.url_name if match and match.url_name else "unnamed", request, response,
+                        duration, profiler, snapshot, peak)
+    response["X-Profile"] = name
+    return response
+
+
+def save_profile(url_name, request, response, duration, profiler, snapshot, peak):
+    # the files of a request share a name, returned to be shown to who asked for the profile
+    directory = os.path.join(settings.PROFILE_DIR, url_name)
+    os.makedirs(directory, exist_ok=True)
+    name = f"{time.time_ns()}-{os.getpid()}"
+    path = os.path.join(directory, name)
+    if profiler:
+        profiler.dump_stats(f"{path}.pstats")
+    if snapshot:
+        snapshot.dump(f"{path}.allocations")
+    with open(f"{path}.json", "w") as file:
+        json.dump({"url_name": url_name, "path": request.get_full_path(), "user": request.user.username,
+                   "status": response.status_code, "duration_ms": round(duration, 2), "peak_bytes": peak}, file)
+    return f"{url_name}/{name}"
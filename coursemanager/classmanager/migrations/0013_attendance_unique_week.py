@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:06
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def remove_duplicate_attendances(apps, schema_editor):
+    # keep the first attendance recorded for each student, course and week
+    Attendance = apps.get_model("classmanager", "Attendance")
+    keep = Attendance.objects.values("student", "course", "week").annotate(first=Min("id")).values("first")
+    Attendance.objects.exclude(id__in=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classmanager', '0012_auto_20210712_0612'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_attendances, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='attendance',
+            constraint=models.UniqueConstraint(fields=('student', 'course', 'week'), name='unique_attendance_per_week'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:07
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def remove_duplicate_rows(apps, schema_editor):
+    # keep the first enrollment and grade of each student in a course
+    for model_name in ("Enrollment", "Grade"):
+        model = apps.get_model("classmanager", model_name)
+        keep = model.objects.values("course", "student").annotate(first=Min("id")).values("first")
+        model.objects.exclude(id__in=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classmanager', '0013_attendance_unique_week'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='announcement',
+            index=models.Index(fields=['course', '-date_created'], name='announcement_course_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='assignment',
+            index=models.Index(fields=['course', '-date_created'], name='assignment_course_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['course', 'week'], name='attendance_course_week_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(condition=models.Q(is_active=True), fields=['name'], name='course_active_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['instructor', '-date_created'], name='course_instructor_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(fields=['assignment', 'student'], name='submission_assignment_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_rows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='enrollment',
+            constraint=models.UniqueConstraint(fields=('course', 'student'), name='unique_enrollment'),
+        ),
+        migrations.AddConstraint(
+            model_name='grade',
+            constraint=models.UniqueConstraint(fields=('course', 'student'), name='unique_grade'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:20
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    # FTS5 virtual table holding the searchable text of each course, its rowid is the course id
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE classmanager_course_fts USING fts5("
+        "name, description, department, instructor, tokenize = 'porter unicode61')"
+    )
+    schema_editor.execute(
+        "INSERT INTO classmanager_course_fts (rowid, name, description, department, instructor) "
+        "SELECT c.id, c.name, COALESCE(c.description, ''), c.department, TRIM(u.first_name || ' ' || u.last_name) "
+        "FROM classmanager_course c JOIN classmanager_user u ON u.id = c.instructor_id"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute("DROP TABLE classmanager_course_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classmanager', '0014_access_pattern_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_enrollments(apps, schema_editor):
+    Course = apps.get_model("classmanager", "Course")
+    Enrollment = apps.get_model("classmanager", "Enrollment")
+    Course.objects.update(enrolled_count=Coalesce(Subquery(
+        Enrollment.objects.filter(course=OuterRef("pk")).values("course").annotate(count=Count("id")).values("count")
+    ), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classmanager', '0015_course_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='capacity',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='enrolled_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_enrollments, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='WaitlistEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_joined', models.DateTimeField(auto_now_add=True)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='classmanager.course')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='classmanager.student')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('course', 'student'), name='unique_waitlist_entry')],
+            },
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:54
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_rows(apps, schema_editor):
+    Instructor = apps.get_model("classmanager", "Instructor")
+    Course = apps.get_model("classmanager", "Course")
+    Announcement = apps.get_model("classmanager", "Announcement")
+    Assignment = apps.get_model("classmanager", "Assignment")
+    Submission = apps.get_model("classmanager", "Submission")
+
+    def count_of(model, field, **filters):
+        return Coalesce(Subquery(model.objects.filter(**{field: OuterRef("pk")}, **filters).order_by()
+                                 .values(field).annotate(count=Count("pk")).values("count")), 0)
+
+    # scores start at 0 and grading asks for at least 1 point, so only submissions with a score were graded
+    Submission.objects.filter(score__gt=0).update(is_graded=True)
+    Course.objects.update(assignment_count=count_of(Assignment, "course"),
+                          announcement_count=count_of(Announcement, "course"),
+                          ungraded_count=count_of(Submission, "assignment__course", is_graded=False))
+    Instructor.objects.update(course_count=count_of(Course, "instructor"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classmanager', '0016_course_capacity_waitlist'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='announcement_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='assignment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='ungraded_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='instructor',
+            name='course_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='submission',
+            name='is_graded',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(count_rows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:59
+
+import django.db.models.deletion
+import django.db.models.expressions
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classmanager', '0017_denormalized_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='grade',
+            name='letter',
+            field=models.CharField(blank=True, default='', max_length=2),
+        ),
+        migrations.CreateModel(
+            name='GradingPolicy',
+            fields=[
+                ('course', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='classmanager.course')),
+                ('assignment_weight', models.PositiveIntegerField(default=80)),
+                ('attendance_weight', models.PositiveIntegerField(default=20)),
+                ('a_cutoff', models.PositiveIntegerField(default=90)),
+                ('b_cutoff', models.PositiveIntegerField(default=80)),
+                ('c_cutoff', models.PositiveIntegerField(default=70)),
+                ('d_cutoff', models.PositiveIntegerField(default=60)),
+            ],
+            options={
+                'constraints': [models.CheckConstraint(condition=models.Q(('assignment_weight', django.db.models.expressions.CombinedExpression(models.Value(100), '-', models.F('attendance_weight')))), name='grading_weights_sum_100', violation_error_message='The weights must add up to 100'), models.CheckConstraint(condition=models.Q(('a_cutoff__gt', models.F('b_cutoff')), ('a_cutoff__lte', 100), ('b_cutoff__gt', models.F('c_cutoff')), ('c_cutoff__gt', models.F('d_cutoff'))), name='grading_cutoffs_descending', violation_error_message='The cutoffs must go down from A to D, A being at most 100')],
+            },
+        ),
+    ]
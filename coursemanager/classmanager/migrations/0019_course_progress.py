@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import Least
+
+
+def sum_rows(apps, schema_editor):
+    Enrollment = apps.get_model("classmanager", "Enrollment")
+    Assignment = apps.get_model("classmanager", "Assignment")
+    Submission = apps.get_model("classmanager", "Submission")
+    Attendance = apps.get_model("classmanager", "Attendance")
+    CourseProgress = apps.get_model("classmanager", "CourseProgress")
+
+    progress = {(course_id, student_id): CourseProgress(course_id=course_id, student_id=student_id)
+                for course_id, student_id in Enrollment.objects.values_list("course", "student")}
+    possible = dict(Assignment.objects.order_by().values("course").annotate(total=Sum("points"))
+                    .values_list("course", "total"))
+    for (course_id, _), row in progress.items():
+        row.points_possible = possible.get(course_id) or 0
+    # the best submission of each assignment, capped at its points
+    for course_id, student_id, best, count in Submission.objects.order_by()\
+            .values("assignment__course", "student", "assignment")\
+            .annotate(best=Least(Max("score"), F("assignment__points")), count=Count("pk"))\
+            .values_list("assignment__course", "student", "best", "count"):
+        if (course_id, student_id) in progress:
+            progress[course_id, student_id].points_earned += best
+            progress[course_id, student_id].submission_count += count
+    for course_id, student_id, count in Attendance.objects.order_by().values("course", "student")\
+            .annotate(count=Count("pk")).values_list("course", "student", "count"):
+        if (course_id, student_id) in progress:
+            progress[course_id, student_id].attendance_count = count
+    CourseProgress.objects.bulk_create(progress.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classmanager', '0018_grading_policy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseProgress',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('points_earned', models.PositiveIntegerField(default=0, editable=False)),
+                ('points_possible', models.PositiveIntegerField(default=0, editable=False)),
+                ('submission_count', models.PositiveIntegerField(default=0, editable=False)),
+                ('attendance_count', models.PositiveIntegerField(default=0, editable=False)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='classmanager.course')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='classmanager.student')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('course', 'student'), name='unique_course_progress')],
+            },
+        ),
+        migrations.RunPython(sum_rows, migrations.RunPython.noop),
+    ]
@@ -52,6 +52,8 @@ class Instructor(models.Model):
         ("Business", "Business"), ("Health", "Health")
     ]
     department = models.CharField(max_length=20, choices=DEPARTMENTS, default="Other")
+    # kept up to date by counters.py
+    course_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return f"Name: {self.get_name()}, DoB: {self.date_of_birth}," \
@@ -77,26 +79,76 @@ class Course(models.Model):
     credits = models.PositiveIntegerField(default=2)
     # course length in weeks, default = 10 weeks
     length = models.PositiveIntegerField(default=10)
+    # number of seats, unlimited when empty. Seats are taken and freed in enrollment.py, which keeps
+    # enrolled_count up to date
+    capacity = models.PositiveIntegerField(null=True, blank=True)
+    enrolled_count = models.PositiveIntegerField(default=0, editable=False)
+    # kept up to date by counters.py, so list pages show them without counting rows
+    assignment_count = models.PositiveIntegerField(default=0, editable=False)
+    announcement_count = models.PositiveIntegerField(default=0, editable=False)
+    ungraded_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # the course catalog only lists active courses ordered by name
+            models.Index(fields=["name"], condition=models.Q(is_active=True), name="course_active_name_idx"),
+            models.Index(fields=["instructor", "-date_created"], name="course_instructor_created_idx"),
+        ]
 
     def __str__(self):
         return f"Course Name: {self.name}, Instructor: {self.instructor.get_name()}, credits: {self.credits}," \
                f" length: {self.length} weeks."
 
+    def weeks(self):
+        # the weeks attendance can be taken in
+        return range(1, self.length + 1)
+
+    def seats_left(self):
+        # None when the course has no capacity
+        if self.capacity is None:
+            return None
+        return max(0, self.capacity - self.enrolled_count)
+
 
 class Enrollment(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
     date_joined = models.DateField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["course", "student"], name="unique_enrollment")
+        ]
+
     def __str__(self):
         return f"Student: {self.student.get_name()} joined {self.course.name} on {self.date_joined}."
 
 
+# students waiting for a seat of a full course, promoted in the order they joined (by id)
+class WaitlistEntry(models.Model):
+    course = models.ForeignKey(Course, on_delete=models.CASCADE)
+    student = models.ForeignKey(Student, on_delete=models.CASCADE)
+    date_joined = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["course", "student"], name="unique_waitlist_entry")
+        ]
+
+    def __str__(self):
+        return f"Student: {self.student.get_name()} waiting for {self.course.name} since {self.date_joined}."
+
+
 class Announcement(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
     text = models.TextField(max_length=1000, default=None)
     date_created = models.DateField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["course", "-date_created"], name="announcement_course_date_idx")
+        ]
+
     def __str__(self):
         return f"Announcement for '{self.course.name}': {self.text}; Posted by {self.course.instructor.get_name()}," \
                f" on {self.date_created}."
@@ -112,6 +164,11 @@ class Assignment(models.Model):
     due_date = models.DateField(blank=False, default=date.today() + timedelta(days=3))
     points = models.PositiveIntegerField(default=1)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["course", "-date_created"], name="assignment_course_date_idx")
+        ]
+
     def __str__(self):
         return f"Assignment for '{self.course.name}': '{self.title}'; Due: {self.due_date}, points: {self.points}"
 
@@ -120,9 +177,15 @@ class Submission(models.Model):
     assignment = models.ForeignKey(Assignment, on_delete=models.CASCADE)
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
     score = models.PositiveIntegerField(default=0)
+    is_graded = models.BooleanField(default=False)
     text = models.TextField(max_length=1000)
     date_submitted = models.DateField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["assignment", "student"], name="submission_assignment_idx")
+        ]
+
     def __str__(self):
         return f"Submission for '{self.assignment.title}' by '{self.student.get_name()}' on {self.date_submitted}"
 
@@ -132,6 +195,14 @@ class Attendance(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
     week = models.PositiveIntegerField(default=1)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["student", "course", "week"], name="unique_attendance_per_week")
+        ]
+        indexes = [
+            models.Index(fields=["course", "week"], name="attendance_course_week_idx")
+        ]
+
     def __str__(self):
         return f"'{self.student.get_name()}' attended {self.course.name} in week {self.week}"
 
@@ -140,6 +211,77 @@ class Grade(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
     score = models.PositiveIntegerField(default=0)
+    # letter of the score under the course's grading policy
+    letter = models.CharField(max_length=2, blank=True, default="")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["course", "student"], name="unique_grade")
+        ]
+
+    def __str__(self):
+        letter = f" ({self.letter})" if self.letter else ""
+        return f"'{self.student.get_name()}' scored {self.score}%{letter} in '{self.course.name}'"
+
+
+# how the final grades of a course are computed from its submissions and attendance (see grading.py)
+class GradingPolicy(models.Model):
+    course = models.OneToOneField(Course, primary_key=True, on_delete=models.CASCADE)
+    # percentages of the final score
+    assignment_weight = models.PositiveIntegerField(default=80)
+    attendance_weight = models.PositiveIntegerField(default=20)
+    # lowest final score of each letter grade, lower scores get an F
+    a_cutoff = models.PositiveIntegerField(default=90)
+    b_cutoff = models.PositiveIntegerField(default=80)
+    c_cutoff = models.PositiveIntegerField(default=70)
+    d_cutoff = models.PositiveIntegerField(default=60)
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(condition=models.Q(assignment_weight=100 - models.F("attendance_weight")),
+                                   name="grading_weights_sum_100",
+                                   violation_error_message="The weights must add up to 100"),
+            models.CheckConstraint(condition=models.Q(a_cutoff__lte=100, a_cutoff__gt=models.F("b_cutoff"),
+                                                      b_cutoff__gt=models.F("c_cutoff"),
+                                                      c_cutoff__gt=models.F("d_cutoff")),
+                                   name="grading_cutoffs_descending",
+                                   violation_error_message="The cutoffs must go down from A to D, "
+                                                           "A being at most 100"),
+        ]
+
+    def __str__(self):
+        return f"Grading of '{self.course.name}': assignments {self.assignment_weight}%, " \
+               f"attendance {self.attendance_weight}%"
+
+    def letter(self, score):
+        for letter, cutoff in (("A", self.a_cutoff), ("B", self.b_cutoff), ("C", self.c_cutoff),
+                               ("D", self.d_cutoff)):
+            if score >= cutoff:
+                return letter
+        return "F"
+
+
+# running totals of an enrolled student in a course, kept up to date by the writes (see progress.py)
+class CourseProgress(models.Model):
+    student = models.ForeignKey(Student, on_delete=models.CASCADE)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE)
+    # the best submission of each assignment counts, capped at the assignment's points
+    points_earned = models.PositiveIntegerField(default=0, editable=False)
+    points_possible = models.PositiveIntegerField(default=0, editable=False)
+    submission_count = models.PositiveIntegerField(default=0, editable=False)
+    attendance_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["course", "student"], name="unique_course_progress")
+        ]
 
     def __str__(self):
-        return f"'{self.student.get_name()}' scored {self.score}% in '{self.course.name}'"
+        return f"'{self.student.get_name()}' earned {self.points_earned}/{self.points_possible} points in " \
+               f"'{self.course.name}'"
+
+    def percent(self):
+        # None until the course has an assignment
+        if not self.points_possible:
+            return None
+        return round(100 * self.points_earned / self.points_possible)
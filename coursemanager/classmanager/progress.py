@@ -0,0 +1,162 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models import Case, Count, Exists, F, Max, OuterRef, Sum, Value, When
+from django.db.models.functions import Least
+
+from .counters import adjust
+from .models import Enrollment, Assignment, Submission, Attendance, CourseProgress
+
+# Running totals of each enrolled student in a course (CourseProgress), so dashboards and rosters show the points
+# earned and possible, submissions and attendances without scanning them. Writes add deltas to the totals in the
+# transaction of the write (signals.py for single rows, the caller for bulk writes and grading) and
+# `manage.py rebuild_progress` recomputes them from the rows. Like final grades, the points earned count the best
+# submission of each assignment, capped at the assignment's points.
+
+FIELDS = ["points_earned", "points_possible", "submission_count", "attendance_count"]
+
+_suspended = ContextVar("progress_suspended", default=False)
+
+
+@contextmanager
+def suspended():
+    # deleting submissions and attendances in the block doesn't update any progress, for callers that remove
+    # or rebuild it themselves
+    token = _suspended.set(True)
+    try:
+        yield
+    finally:
+        _suspended.reset(token)
+
+
+def tracking():
+    return not _suspended.get()
+
+
+def rows(course_id, student_ids=None):
+    progress = CourseProgress.objects.filter(course=course_id)
+    return progress if student_ids is None else progress.filter(student__in=student_ids)
+
+
+def add(course_id, field, deltas):
+    # adds {student_id: delta} to a total of the students in the course, in one UPDATE
+    deltas = {student_id: delta for student_id, delta in deltas.items() if delta}
+    if deltas:
+        adjust(rows(course_id, deltas), **{field: Case(
+            *[When(student=student_id, then=Value(delta)) for student_id, delta in deltas.items()], default=Value(0)
+        )})
+
+
+def enrolled(enrollment):
+    # every assignment of the course is possible for a new student
+    possible = Assignment.objects.filter(course=enrollment.course_id).aggregate(total=Sum("points"))["total"]
+    CourseProgress.objects.create(course_id=enrollment.course_id, student_id=enrollment.student_id,
+                                  points_possible=possible or 0)
+
+
+def unenrolled(enrollment):
+    rows(enrollment.course_id, [enrollment.student_id]).delete()
+
+
+def assignment_added(assignment):
+    adjust(rows(assignment.course_id), points_possible=assignment.points)
+
+
+def attended(course_id, student_ids):
+    # called once the students' attendance of a new week is saved
+    if student_ids:
+        adjust(rows(course_id, student_ids), attendance_count=1)
+
+
+def submitted(submission):
+    adjust(rows(submission.assignment.course_id, [submission.student_id]), submission_count=1)
+    if submission.score:
+        rescored(submission.assignment, {submission.pk: 0})
+
+
+def rescored(assignment, old_scores):
+    # called once the submissions of the assignment in old_scores ({submission id: score before}) are saved with
+    # their new score, adds the change of each student's best score of the assignment to their points earned
+    student_ids = Submission.objects.filter(pk__in=old_scores).values("student")
+    before, after = {}, {}
+    for pk, student_id, score in Submission.objects.filter(assignment=assignment, student__in=student_ids)\
+            .values_list("pk", "student", "score"):
+        before[student_id] = max(before.get(student_id, 0), old_scores.get(pk, score))
+        after[student_id] = max(after.get(student_id, 0), score)
+    add(assignment.course_id, "points_earned", {
+        student_id: min(after[student_id], assignment.points) - min(before[student_id], assignment.points)
+        for student_id in after
+    })
+
+
+def unsubmitted(submission):
+    # the best score of the assignment can't be found back from a delta, the student's progress is recomputed
+    if submission.score:
+        rebuild([submission.assignment.course_id], [submission.student_id])
+    else:
+        adjust(rows(submission.assignment.course_id, [submission.student_id]), submission_count=-1)
+
+
+def expected(course_ids=None, student_ids=None):
+    # {(course_id, student_id): CourseProgress} of the enrollments of the courses and students (all of them by
+    # default) with totals computed from their rows, in four aggregate queries
+    def scope(queryset, course="course", student="student"):
+        if course_ids is not None:
+            queryset = queryset.filter(**{f"{course}__in": course_ids})
+        if student_ids is not None and student:
+            queryset = queryset.filter(**{f"{student}__in": student_ids})
+        return queryset.order_by()
+
+    progress = {(course_id, student_id): CourseProgress(course_id=course_id, student_id=student_id)
+                for course_id, student_id in scope(Enrollment.objects).values_list("course", "student")}
+    if not progress:
+        return progress
+    possible = dict(scope(Assignment.objects, student=None).values("course").annotate(total=Sum("points"))
+                    .values_list("course", "total"))
+    submissions = scope(Submission.objects, course="assignment__course")\
+        .values("assignment__course", "student", "assignment")\
+        .annotate(best=Least(Max("score"), F("assignment__points")), count=Count("pk"))\
+        .values_list("assignment__course", "student", "best", "count")
+    attendances = scope(Attendance.objects).values("course", "student").annotate(count=Count("pk"))\
+        .values_list("course", "student", "count")
+    for (course_id, _), row in progress.items():
+        row.points_possible = possible.get(course_id) or 0
+    for course_id, student_id, best, count in submissions:
+        # submissions of students who left the course don't count
+        if (course_id, student_id) in progress:
+            progress[course_id, student_id].points_earned += best
+            progress[course_id, student_id].submission_count += count
+    for course_id, student_id, count in attendances:
+        if (course_id, student_id) in progress:
+            progress[course_id, student_id].attendance_count = count
+    return progress
+
+
+def rebuild(course_ids=None, student_ids=None, batch_size=500):
+    # recomputes the progress of the enrollments of the courses and students (all of them by default) and saves
+    # it in one upsert, removing the progress of students who aren't enrolled anymore. Returns the saved rows
+    progress = list(expected(course_ids, student_ids).values())
+    stale = CourseProgress.objects.filter(~Exists(Enrollment.objects.filter(course=OuterRef("course"),
+                                                                              student=OuterRef("student"))))
+    if course_ids is not None:
+        stale = stale.filter(course__in=course_ids)
+    if student_ids is not None:
+        stale = stale.filter(student__in=student_ids)
+    stale.delete()
+    CourseProgress.objects.bulk_create(progress, batch_size=batch_size, update_conflicts=True,
+                                       unique_fields=["course", "student"], update_fields=FIELDS)
+    return progress
+
+
+def drifted(course_ids=None):
+    # the (course_id, student_id) pairs whose progress is wrong, missing or left over
+    progress = expected(course_ids)
+    saved = CourseProgress.objects.order_by()
+    if course_ids is not None:
+        saved = saved.filter(course__in=course_ids)
+    wrong = set()
+    for course_id, student_id, *totals in saved.values_list("course", "student", *FIELDS):
+        row = progress.pop((course_id, student_id), None)
+        if row is None or totals != [getattr(row, field) for field in FIELDS]:
+            wrong.add((course_id, student_id))
+    return wrong | set(progress)
@@ -0,0 +1,174 @@
+import csv
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.db import DatabaseError, transaction
+
+from . import progress
+from .counters import recount_courses
+from .models import User, Student, Course, Enrollment
+
+REQUIRED_COLUMNS = ["username", "email", "first_name", "last_name"]
+# passwords are hashed in the calling process below this many rows in a chunk
+POOL_THRESHOLD = 64
+# rows of a roster uploaded from the site, whose passwords are hashed in the request (a few tenths of a second
+# each), larger rosters are imported with `manage.py import_roster`
+UPLOAD_MAX_ROWS = 20
+
+
+class RosterImport:
+    # outcome of a roster import, errors are (line number, message) tuples
+    def __init__(self):
+        self.created = 0
+        self.enrolled = 0
+        self.errors = []
+        # line of the file that couldn't be read, the rows before it are imported
+        self.unreadable_line = None
+
+
+def import_roster(file, courses=None, processes=None, chunk_size=1000):
+    # creates users, student profiles and enrollments from a CSV file with the columns username, email,
+    # first_name, last_name and optionally password, major, standing and courses (course ids separated by
+    # spaces or semicolons). Only active courses of the `courses` queryset can be joined. Rows are imported
+    # in chunks, each in its own transaction, and invalid rows are reported without stopping the import.
+    result = RosterImport()
+    reader = csv.DictReader(file)
+    missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or [])]
+    if missing:
+        result.errors.append((1, f"Missing columns: {', '.join(missing)}"))
+        return result
+    courses = Course.objects.all() if courses is None else courses
+    course_ids = set(courses.filter(is_active=True).values_list("id", flat=True))
+    seen = set()
+    rows = read_rows(reader, result)
+    with PasswordHasher(processes) as hasher:
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            import_chunk(chunk, course_ids, seen, hasher, result)
+    result.errors.sort()
+    return result
+
+
+def read_rows(reader, result):
+    # the rows of the file with their line number, up to the first one that can't be read (e.g. invalid UTF-8)
+    # the header is line 1, so rows start at line 2
+    line = 1
+    try:
+        for line, row in enumerate(reader, start=2):
+            yield line, row
+    except (csv.Error, UnicodeDecodeError) as error:
+        result.unreadable_line = line + 1
+        result.errors.append((line + 1, f"Could not read the file from this line on: {error}"))
+
+
+def import_chunk(chunk, course_ids, seen, hasher, result):
+    valid = []
+    for line, row in chunk:
+        error = validate_row(row, course_ids, seen)
+        if error:
+            result.errors.append((line, error))
+        else:
+            valid.append((line, row))
+    if not valid:
+        return
+    usernames = [row["username"] for _, row in valid]
+    existing = {username: (pk, is_student) for username, pk, is_student in
+                User.objects.filter(username__in=usernames).values_list("username", "id", "is_student")}
+    new_rows, enrolling = [], []
+    for line, row in valid:
+        if row["username"] not in existing:
+            new_rows.append((line, row))
+        elif existing[row["username"]][1]:
+            # students that already have an account are only enrolled in the listed courses
+            enrolling.append((line, row))
+        else:
+            result.errors.append((line, f"Username '{row['username']}' is already taken by a non-student"))
+    passwords = hasher.hash([row.get("password") or None for _, row in new_rows])
+    try:
+        with transaction.atomic():
+            User.objects.bulk_create([
+                User(username=row["username"], email=row["email"], first_name=row["first_name"],
+                     last_name=row["last_name"], password=password, is_student=True)
+                for (_, row), password in zip(new_rows, passwords)
+            ])
+            # fetch the new primary keys, bulk_create doesn't set them on every database
+            user_ids = dict(User.objects.filter(username__in=usernames).values_list("username", "id"))
+            Student.objects.bulk_create([
+                Student(user_id=user_ids[row["username"]], major=row.get("major") or "Undecided",
+                        standing=row.get("standing") or "FR")
+                for _, row in new_rows
+            ])
+            enrollments = {(user_ids[row["username"]], course_id)
+                           for _, row in new_rows + enrolling for course_id in parse_courses(row)}
+            already_enrolled = set(Enrollment.objects.filter(student__in=[pk for pk, _ in enrollments])
+                                   .values_list("student_id", "course_id"))
+            new_enrollments = [Enrollment(student_id=student_id, course_id=course_id)
+                               for student_id, course_id in enrollments
+                               if (student_id, course_id) not in already_enrolled]
+            Enrollment.objects.bulk_create(new_enrollments, ignore_conflicts=True)
+            # rosters are imported by the instructor regardless of the capacity, the seat counts follow
+            recount_courses({course_id for _, course_id in enrollments}, ["enrolled_count"])
+            progress.rebuild({course_id for _, course_id in enrollments}, [pk for pk, _ in enrollments])
+    except DatabaseError as error:
+        # e.g. a username registered while the chunk was being imported
+        for line, _ in new_rows + enrolling:
+            result.errors.append((line, f"Could not import row: {error}"))
+    else:
+        result.created += len(new_rows)
+        result.enrolled += len(new_enrollments)
+
+
+def validate_row(row, course_ids, seen):
+    # returns an error message for an invalid row, else None
+    for column in REQUIRED_COLUMNS:
+        if not (row.get(column) or "").strip():
+            return f"Missing {column}"
+    username = row["username"]
+    if username in seen:
+        return f"Username '{username}' appears more than once in the file"
+    seen.add(username)
+    if len(username) > 150 or not re.fullmatch(r"[\w.@+-]+", username):
+        return f"Invalid username '{username}'"
+    if row.get("major") and row["major"] not in dict(Student.MAJORS):
+        return f"Invalid major '{row['major']}'"
+    if row.get("standing") and row["standing"] not in dict(Student.STANDINGS):
+        return f"Invalid standing '{row['standing']}'"
+    try:
+        courses = parse_courses(row)
+    except ValueError:
+        return f"Invalid course list '{row['courses']}'"
+    for course_id in courses:
+        if course_id not in course_ids:
+            return f"Course {course_id} does not exist or can't be joined"
+    return None
+
+
+def parse_courses(row):
+    return [int(course_id) for course_id in re.split(r"[\s;]+", row.get("courses") or "") if course_id]
+
+
+class PasswordHasher:
+    # hashes passwords across a pool of processes, rows without a password get an unusable one
+    def __init__(self, processes=None):
+        self.processes = processes or os.cpu_count()
+        self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+    def hash(self, passwords):
+        if self.processes == 1 or len(passwords) < POOL_THRESHOLD:
+            return [make_password(password) for password in passwords]
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(self.processes)
+        chunksize = max(1, len(passwords) // (self.processes * 4))
+        return list(self.pool.map(make_password, passwords, chunksize=chunksize))
@@ -0,0 +1,129 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.decorators import sync_and_async_middleware
+
+# session key holding the time until which the session's reads stay on the default database
+PIN_KEY = "_replica_pin_until"
+
+
+class RoutingState:
+    # per request (or per thread outside of requests) routing state
+    def __init__(self, sticky=False):
+        # the session wrote recently, or the request itself wrote, reads then go to the default database
+        self.sticky = sticky
+        self.wrote = False
+
+
+_state = ContextVar("replica_routing_state", default=None)
+# set while a view decorated with reporting_database runs
+_reporting = ContextVar("replica_routing_reporting", default=False)
+
+
+def replicas_enabled():
+    return bool(settings.DATABASE_REPLICAS or settings.DATABASE_REPORTING)
+
+
+def routing_state():
+    # outside of a routing_scope, e.g. in management commands, the state lasts as long as the thread
+    state = _state.get()
+    if state is None:
+        state = RoutingState()
+        _state.set(state)
+    return state
+
+
+@contextmanager
+def routing_scope(sticky=False):
+    # a new routing state for the duration of a request
+    state = RoutingState(sticky)
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+class ReplicaRouter:
+    # Sends writes to the default database and reads to one of settings.DATABASE_REPLICAS. Once a request or a
+    # session has written, its reads stay on the default database (for settings.REPLICA_STICKY_SECONDS in the
+    # session, see replica_middleware) so it sees its own writes. Views decorated with reporting_database read
+    # from settings.DATABASE_REPORTING instead, unless they have to see the session's writes.
+    def db_for_read(self, model, **hints):
+        state = routing_state()
+        replicas = settings.DATABASE_REPLICAS
+        # sessions are read on every request and must see a login right away
+        if state.sticky or state.wrote or model._meta.app_label == "sessions" \
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if _reporting.get() and settings.DATABASE_REPORTING:
+            return settings.DATABASE_REPORTING
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        routing_state().wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # every alias holds a copy of the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas are copies of the default database, schema included
+        return db == DEFAULT_DB_ALIAS
+
+
+def reporting_database(view):
+    # reads of the view go to the reporting database, for reports that can tolerate its replication delay
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            token = _reporting.set(True)
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _reporting.reset(token)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        token = _reporting.set(True)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _reporting.reset(token)
+    return wrapper
+
+
+@sync_and_async_middleware
+def replica_middleware(get_response):
+    # gives every request its own routing state, sticky if its session wrote recently, and keeps the session's
+    # reads on the default database for a while after the request wrote
+    def is_pinned(pinned_until):
+        return pinned_until is not None and pinned_until > time.time()
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            if not replicas_enabled():
+                return await get_response(request)
+            with routing_scope(is_pinned(await request.session.aget(PIN_KEY))) as state:
+                response = await get_response(request)
+            if state.wrote:
+                await request.session.aset(PIN_KEY, time.time() + settings.REPLICA_STICKY_SECONDS)
+            return response
+    else:
+        def middleware(request):
+            if not replicas_enabled():
+                return get_response(request)
+            with routing_scope(is_pinned(request.session.get(PIN_KEY))) as state:
+                response = get_response(request)
+            if state.wrote:
+                request.session[PIN_KEY] = time.time() + settings.REPLICA_STICKY_SECONDS
+            return response
+    return middleware
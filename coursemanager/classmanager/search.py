@@ -0,0 +1,94 @@
+import re
+
+from django.db import connection
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Course
+
+# markers put around matched terms by SQLite, they are swapped for <mark> tags once the text is escaped
+MATCH_START, MATCH_END = "\x02", "\x03"
+
+
+# add or replace a course in the full-text index
+def index_course(course):
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM classmanager_course_fts WHERE rowid = %s", [course.id])
+        cursor.execute(
+            "INSERT INTO classmanager_course_fts (rowid, name, description, department, instructor) "
+            "VALUES (%s, %s, %s, %s, %s)",
+            [course.id, course.name, course.description or "", course.department, course.instructor.get_name()]
+        )
+
+
+# add the courses with ids from first_id to last_id, created in bulk without the post_save signal, to the index
+def index_courses(first_id, last_id):
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM classmanager_course_fts WHERE rowid BETWEEN %s AND %s", [first_id, last_id])
+        cursor.execute(
+            "INSERT INTO classmanager_course_fts (rowid, name, description, department, instructor) "
+            "SELECT c.id, c.name, COALESCE(c.description, ''), c.department, "
+            "TRIM(u.first_name || ' ' || u.last_name) "
+            "FROM classmanager_course c JOIN classmanager_user u ON u.id = c.instructor_id "
+            "WHERE c.id BETWEEN %s AND %s",
+            [first_id, last_id]
+        )
+
+
+# remove a deleted course from the full-text index
+def remove_course(course_id):
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM classmanager_course_fts WHERE rowid = %s", [course_id])
+
+
+# update the instructor name of every indexed course taught by an instructor
+def rename_instructor(user):
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "UPDATE classmanager_course_fts SET instructor = %s "
+            "WHERE rowid IN (SELECT id FROM classmanager_course WHERE instructor_id = %s)",
+            [user.get_full_name(), user.pk]
+        )
+
+
+# turn user input into an FTS5 query where every word must match as a prefix, e.g. 'intro phys' becomes
+# '"intro"* "phys"*', so that quotes or operators typed by the user can't break the query syntax
+def match_expression(query):
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", query))
+
+
+# escape text returned by SQLite and highlight the matched terms
+def highlight(text):
+    return mark_safe(escape(text).replace(MATCH_START, "<mark>").replace(MATCH_END, "</mark>"))
+
+
+# return up to `limit` active courses matching the query as (course, name, snippet) tuples, best match first
+def search_courses(query, limit=20):
+    expression = match_expression(query)
+    if not expression:
+        return []
+    if connection.vendor != "sqlite":
+        courses = Course.objects.filter(is_active=True, name__icontains=query).select_related("instructor__user")
+        return [(course, course.name, course.description) for course in courses[:limit]]
+    with connection.cursor() as cursor:
+        # bm25 weights the columns: name, description, department, instructor
+        cursor.execute(
+            "SELECT f.rowid, highlight(classmanager_course_fts, 0, %s, %s), "
+            "snippet(classmanager_course_fts, 1, %s, %s, '...', 16) "
+            "FROM classmanager_course_fts f JOIN classmanager_course c ON c.id = f.rowid "
+            "WHERE classmanager_course_fts MATCH %s AND c.is_active "
+            "ORDER BY bm25(classmanager_course_fts, 10.0, 1.0, 2.0, 5.0) LIMIT %s",
+            [MATCH_START, MATCH_END, MATCH_START, MATCH_END, expression, limit]
+        )
+        rows = cursor.fetchall()
+    courses = Course.objects.select_related("instructor__user").in_bulk([row[0] for row in rows])
+    return [(courses[course_id], highlight(name), highlight(snippet)) for course_id, name, snippet in rows
+            if course_id in courses]
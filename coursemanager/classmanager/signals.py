@@ -0,0 +1,187 @@
+from django.db.models import Count
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from . import counters, course_cache, enrollment, progress, search
+from .models import User, Student, Instructor, Course, Enrollment, WaitlistEntry, Announcement, Assignment, \
+    Submission, Attendance, Grade
+
+
+def deleted_from(origin, model):
+    # whether the deletion started from rows of the model (an instance or a queryset), rather than a cascade
+    return getattr(origin, "model", type(origin)) is model
+
+
+# keep the course search index in sync with courses and their instructor's name
+@receiver(post_save, sender=Course)
+def index_course(sender, instance, **kwargs):
+    search.index_course(instance)
+
+
+@receiver(post_delete, sender=Course)
+def remove_course(sender, instance, **kwargs):
+    search.remove_course(instance.id)
+
+
+@receiver(post_save, sender=User)
+def rename_instructor(sender, instance, update_fields=None, **kwargs):
+    # logging in only updates last_login, which is neither indexed nor shown with courses
+    if instance.is_instructor and update_fields != frozenset(["last_login"]):
+        search.rename_instructor(instance)
+        # courses show the name of their instructor
+        course_cache.bump_version("catalog")
+        for course_id in Course.objects.filter(instructor=instance.pk).values_list("id", flat=True):
+            course_cache.bump_course_version(course_id)
+
+
+@receiver(post_save, sender=User)
+def rename_student(sender, instance, update_fields=None, **kwargs):
+    # final grades show the name of their student
+    if instance.is_student and update_fields != frozenset(["last_login"]):
+        for course_id in Grade.objects.filter(student=instance.pk).values_list("course_id", flat=True):
+            course_cache.bump_version(f"grades:{course_id}")
+
+
+# change the version of a course's cached content whenever the course or its content changes
+@receiver([post_save, post_delete], sender=Course)
+def bump_course_version(sender, instance, **kwargs):
+    course_cache.bump_course_version(instance.id)
+    course_cache.bump_version("catalog")
+
+
+@receiver([post_save, post_delete], sender=Announcement)
+@receiver([post_save, post_delete], sender=Assignment)
+def bump_content_version(sender, instance, **kwargs):
+    course_cache.bump_course_version(instance.course_id)
+
+
+@receiver([post_save, post_delete], sender=Grade)
+def bump_grades_version(sender, instance, **kwargs):
+    course_cache.bump_version(f"grades:{instance.course_id}")
+
+
+# denormalized counters (see counters.py), write views save inside transaction.atomic() so that the counter
+# changes with the row
+@receiver(post_save, sender=Course)
+def count_course(sender, instance, created, **kwargs):
+    if created:
+        counters.adjust(Instructor.objects.filter(pk=instance.instructor_id), course_count=1)
+
+
+@receiver(post_delete, sender=Course)
+def uncount_course(sender, instance, **kwargs):
+    counters.adjust(Instructor.objects.filter(pk=instance.instructor_id), course_count=-1)
+
+
+@receiver(post_save, sender=Announcement)
+@receiver(post_save, sender=Assignment)
+def count_course_content(sender, instance, created, **kwargs):
+    if created:
+        counters.adjust(Course.objects.filter(pk=instance.course_id),
+                        **{f"{sender._meta.model_name}_count": 1})
+
+
+@receiver(post_delete, sender=Announcement)
+@receiver(post_delete, sender=Assignment)
+def uncount_course_content(sender, instance, origin=None, **kwargs):
+    # the counters of a deleted course go with it
+    if deleted_from(origin, sender):
+        counters.adjust(Course.objects.filter(pk=instance.course_id),
+                        **{f"{sender._meta.model_name}_count": -1})
+
+
+@receiver(post_save, sender=Submission)
+def count_submission(sender, instance, created, **kwargs):
+    # grading is counted by the views that grade (counters.graded), they know whether it was graded before
+    if created and not instance.is_graded:
+        counters.adjust(Course.objects.filter(assignment=instance.assignment_id), ungraded_count=1)
+
+
+@receiver(post_delete, sender=Submission)
+def uncount_submission(sender, instance, origin=None, **kwargs):
+    # submissions removed by a cascade belong to a course being deleted, or are counted by recount_ungraded or
+    # uncount_student
+    if deleted_from(origin, Submission) and not instance.is_graded:
+        counters.adjust(Course.objects.filter(assignment=instance.assignment_id), ungraded_count=-1)
+
+
+@receiver(post_delete, sender=Assignment)
+def recount_ungraded(sender, instance, origin=None, **kwargs):
+    if deleted_from(origin, Assignment):
+        counters.recount_courses([instance.course_id], ["ungraded_count"])
+
+
+@receiver(pre_delete, sender=Student)
+def uncount_student(sender, instance, **kwargs):
+    # also sent when the student's user is deleted. The cascade removes the student's enrollments and submissions
+    # without counting them, their courses are counted here in the same transaction and their seats are given to
+    # the waitlists
+    WaitlistEntry.objects.filter(student=instance.pk).delete()
+    enrolled = Enrollment.objects.filter(student=instance.pk).values("course").annotate(count=Count("pk"))
+    ungraded = Submission.objects.filter(student=instance.pk, is_graded=False)\
+        .values("assignment__course").annotate(count=Count("pk"))
+    course_ids = []
+    for row in enrolled.order_by():
+        counters.adjust(Course.objects.filter(pk=row["course"]), enrolled_count=-row["count"])
+        course_ids.append(row["course"])
+    for row in ungraded.order_by():
+        counters.adjust(Course.objects.filter(pk=row["assignment__course"]), ungraded_count=-row["count"])
+    # the student's waitlist entries are gone and their enrollments skipped, so they aren't promoted themselves
+    for course_id in course_ids:
+        enrollment.promote(course_id)
+
+
+# running totals of the enrolled students (see progress.py)
+@receiver(post_save, sender=Enrollment)
+def start_progress(sender, instance, created, **kwargs):
+    if created:
+        progress.enrolled(instance)
+
+
+@receiver(post_delete, sender=Enrollment)
+def remove_progress(sender, instance, origin=None, **kwargs):
+    # the progress of a deleted course or student is deleted by the same cascade
+    if deleted_from(origin, Enrollment):
+        progress.unenrolled(instance)
+
+
+@receiver(post_save, sender=Assignment)
+def progress_assignment(sender, instance, created, **kwargs):
+    if created:
+        progress.assignment_added(instance)
+    else:
+        # the points of the assignment may have changed, which changes the capped scores too
+        progress.rebuild([instance.course_id])
+
+
+@receiver(post_delete, sender=Assignment)
+def unprogress_assignment(sender, instance, origin=None, **kwargs):
+    # the progress of a deleted course goes with it
+    if deleted_from(origin, Assignment):
+        progress.rebuild([instance.course_id])
+
+
+@receiver(post_save, sender=Submission)
+def progress_submission(sender, instance, created, **kwargs):
+    # grading is added by the views that grade (progress.rescored), they know the score before
+    if created:
+        progress.submitted(instance)
+
+
+@receiver(post_delete, sender=Submission)
+def unprogress_submission(sender, instance, origin=None, **kwargs):
+    # the submissions of a deleted assignment are counted once the assignment is gone (unprogress_assignment)
+    if deleted_from(origin, Submission) and progress.tracking():
+        progress.unsubmitted(instance)
+
+
+@receiver(post_save, sender=Attendance)
+def progress_attendance(sender, instance, created, **kwargs):
+    if created:
+        progress.attended(instance.course_id, [instance.student_id])
+
+
+@receiver(post_delete, sender=Attendance)
+def unprogress_attendance(sender, instance, origin=None, **kwargs):
+    if deleted_from(origin, Attendance) and progress.tracking():
+        counters.adjust(progress.rows(instance.course_id, [instance.student_id]), attendance_count=-1)
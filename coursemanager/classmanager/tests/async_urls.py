@@ -0,0 +1,13 @@
+from django.urls import path
+
+from .. import async_views, urls
+
+# the app's routes with the read-heavy views replaced by their async versions, as when settings.ASYNC_VIEWS
+# is set under ASGI
+urlpatterns = [
+    path("view_all_courses", async_views.view_all_courses, name="view-all-courses"),
+    path("view_course/<int:course_id>", async_views.view_course, name="view-course"),
+    path("view/all/<str:activity>/<int:course_id>", async_views.view_all, name="view-all"),
+    path("view/final/<int:course_id>", async_views.view_finals, name="view-finals"),
+    path("view/my_profile", async_views.view_my_profile, name="view-my-profile"),
+] + urls.urlpatterns
@@ -0,0 +1,36 @@
+import logging
+from tempfile import TemporaryDirectory
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+# loggers whose lines tests capture with assertLogs, and that would otherwise print every sampled request and
+# slow query of the tests
+QUIET_LOGGERS = ["classmanager.performance", "classmanager.slow_queries"]
+# passwords of the test users are hashed in every test setup, the default hasher takes tenths of a second each
+FAST_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+
+
+class TestRunner(DiscoverRunner):
+    # settings of the whole test run: requests of the tests aren't counted in the metrics of the server
+    # (MetricsTest enables them in its own directory), passwords are hashed quickly and the cache starts empty in a
+    # directory of the run
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.cache_directory = TemporaryDirectory(prefix="classmanager-tests-cache-")
+        self.settings = override_settings(
+            METRICS_ENABLED=False, PASSWORD_HASHERS=FAST_HASHERS,
+            CACHES={"default": {**settings.CACHES["default"], "LOCATION": self.cache_directory.name}},
+        )
+        self.settings.enable()
+        self.levels = {name: logging.getLogger(name).level for name in QUIET_LOGGERS}
+        for name in QUIET_LOGGERS:
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+    def teardown_test_environment(self, **kwargs):
+        for name, level in self.levels.items():
+            logging.getLogger(name).setLevel(level)
+        self.settings.disable()
+        self.cache_directory.cleanup()
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,89 @@
+from django.test import TestCase
+from django.urls import reverse
+from .test_models import get_users, create_students
+from .test_views import setup_objects, bump_in_other_process
+from ..models import Course, Enrollment, Announcement, Grade
+
+
+class ApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        setup_objects()
+
+    def setUp(self):
+        self.u1, self.u2, self.u3 = get_users()
+        self.s1, self.s2 = create_students()
+        self.c1, self.c2 = Course.objects.get(id=1), Course.objects.get(id=2)
+        Enrollment.objects.create(course=self.c1, student=self.s1)
+        Enrollment.objects.create(course=self.c1, student=self.s2)
+        Announcement.objects.create(course=self.c1, text="Welcome")
+
+    def test_authentication_and_permissions(self):
+        response = self.client.get(reverse("api-courses"))
+        self.assertEqual(response.status_code, 401)
+        self.client.login(username=self.u1.username, password="123")
+        response = self.client.get(reverse("api-course", args=[self.c2.id]))
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json()["error"], "Sorry, you don't have the permission to view this course")
+        response = self.client.get(reverse("api-course", args=[self.c1.id]))
+        self.assertEqual(response.json()["instructor"], "Ashley Bernat")
+
+    def test_conditional_get(self):
+        self.client.login(username=self.u1.username, password="123")
+        url = reverse("api-announcements", args=[self.c1.id])
+        response = self.client.get(url)
+        self.assertEqual([a["text"] for a in response.json()["announcements"]], ["Welcome"])
+        etag = response["ETag"]
+        self.assertNotIn("Last-Modified", response)
+        # session, user and access queries only
+        with self.assertNumQueries(3):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # a new announcement changes the ETag
+        Announcement.objects.create(course=self.c1, text="Quiz on Friday")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["announcements"]), 2)
+        self.assertNotEqual(response["ETag"], etag)
+        # and so does a write handled by another server process
+        etag = response["ETag"]
+        Announcement.objects.filter(course=self.c1).update(text="Class moved online")
+        bump_in_other_process(f"course:{self.c1.id}")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({a["text"] for a in response.json()["announcements"]}, {"Class moved online"})
+
+    def test_catalog(self):
+        self.client.login(username=self.u2.username, password="123")
+        response = self.client.get(reverse("api-courses"))
+        self.assertEqual([c["name"] for c in response.json()["courses"]], ["Astrophysics", "Physics 1"])
+        self.assertIsNone(response.json()["next"])
+        etag = response["ETag"]
+        self.c2.is_active = False
+        self.c2.save()
+        response = self.client.get(reverse("api-courses"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual([c["name"] for c in response.json()["courses"]], ["Physics 1"])
+
+    def test_grades(self):
+        Grade.objects.create(course=self.c1, student=self.s1, score=90)
+        Grade.objects.create(course=self.c1, student=self.s2, score=80)
+        self.client.login(username=self.u2.username, password="123")
+        response = self.client.get(reverse("api-grades", args=[self.c1.id]))
+        self.assertEqual([g["score"] for g in response.json()["grades"]], [90, 80])
+        self.client.login(username=self.u1.username, password="123")
+        response = self.client.get(reverse("api-grades", args=[self.c1.id]))
+        self.assertEqual(response.json()["grades"], [{"student_id": self.s1.pk, "student": "Joe Charles",
+                                                      "score": 90}])
+        etag = response["ETag"]
+        # ETags are specific to each user
+        self.client.login(username=self.u3.username, password="123")
+        response = self.client.get(reverse("api-grades", args=[self.c1.id]), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        # renaming a student changes the grades that show their name
+        self.client.login(username=self.u1.username, password="123")
+        response = self.client.get(reverse("api-grades", args=[self.c1.id]), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.u1.first_name = "Jo"
+        self.u1.save()
+        response = self.client.get(reverse("api-grades", args=[self.c1.id]), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.json()["grades"][0]["student"], "Jo Charles")
@@ -0,0 +1,346 @@
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from io import StringIO
+from tempfile import NamedTemporaryFile, TemporaryDirectory
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import models
+from django.test import SimpleTestCase, TestCase, override_settings
+from .test_models import create_courses, get_users, create_students
+from .test_views import setup_objects
+from .. import enrollment, roster
+from ..management.commands.sync_replicas import copy_database
+from ..models import User, Student, Instructor, Course, Enrollment, Assignment, Submission, Attendance, Grade, \
+    CourseProgress
+from ..search import search_courses
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class ImportRosterTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_courses()
+        create_students()
+
+    def setUp(self):
+        self.c1, self.c2 = Course.objects.get(id=1), Course.objects.get(id=2)
+
+    def import_roster(self, text, *args):
+        with NamedTemporaryFile("w", suffix=".csv", delete=False) as file:
+            file.write(text)
+        out, err = StringIO(), StringIO()
+        call_command("import_roster", file.name, "--processes", "1", *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_import(self):
+        rows = ["username,email,first_name,last_name,password,major,courses",
+                f"ann,ann@test.net,Ann,Lee,secret,Math,{self.c1.id};{self.c2.id}",
+                f"bob,bob@test.net,Bob,Ray,,Art,{self.c2.id}",
+                f"jcharles,jcharles@gmail.com,Joe,Charles,,,{self.c1.id}",
+                "carl,carl@test.net,,Fox,,,",
+                "abernat,abernat@hotmail.com,Ashley,Bernat,,,",
+                "dan,dan@test.net,Dan,Ito,,,99",
+                "ann,ann2@test.net,Ann,Lee,,,"]
+        out, err = self.import_roster("\n".join(rows), "--chunk-size", "2")
+        self.assertIn("Created 2 students and 4 enrollments, 4 errors", out)
+        self.assertEqual(err.splitlines(), [
+            "line 5: Missing first_name",
+            "line 6: Username 'abernat' is already taken by a non-student",
+            "line 7: Course 99 does not exist or can't be joined",
+            "line 8: Username 'ann' appears more than once in the file",
+        ])
+        self.assertEqual(authenticate(username="ann", password="secret"), User.objects.get(username="ann"))
+        self.assertFalse(User.objects.get(username="bob").has_usable_password())
+        self.assertEqual(Student.objects.get(user__username="ann").major, "Math")
+        self.assertEqual(Enrollment.objects.filter(course=self.c1).count(), 2)
+        self.assertEqual([Course.objects.get(pk=course.pk).enrolled_count for course in (self.c1, self.c2)], [2, 2])
+        self.assertEqual(CourseProgress.objects.filter(course=self.c1).count(), 2)
+        # importing the same file twice doesn't create anything new
+        out, err = self.import_roster("\n".join(rows[:4]))
+        self.assertIn("Created 0 students and 0 enrollments, 0 errors", out)
+
+    def test_password_pool(self):
+        rows = ["username,email,first_name,last_name,password"] + \
+            [f"student{i},s{i}@test.net,Stu,Dent,secret{i}" for i in range(4)]
+        with mock.patch.object(roster, "POOL_THRESHOLD", 2), \
+                mock.patch.object(roster, "ProcessPoolExecutor", wraps=ProcessPoolExecutor) as pool:
+            with NamedTemporaryFile("w", suffix=".csv", delete=False) as file:
+                file.write("\n".join(rows))
+            out = StringIO()
+            call_command("import_roster", file.name, "--processes", "2", stdout=out)
+        # the passwords are hashed by 2 processes
+        pool.assert_called_once_with(2)
+        self.assertIn("Created 4 students and 0 enrollments, 0 errors", out.getvalue())
+        for i in range(4):
+            self.assertEqual(authenticate(username=f"student{i}", password=f"secret{i}"),
+                             User.objects.get(username=f"student{i}"))
+
+    def test_unreadable_roster(self):
+        rows = "".join(f"student{i},s{i}@test.net,Stu,Dent,{self.c1.id}\n" for i in range(400))
+        with NamedTemporaryFile("wb", suffix=".csv", delete=False) as file:
+            # invalid UTF-8 past the first block the file is decoded in
+            file.write(f"username,email,first_name,last_name,courses\n{rows}".encode() + b"\xff\xfe,x@test.net,X,Y\n")
+        out, err = StringIO(), StringIO()
+        call_command("import_roster", file.name, "--processes", "1", stdout=out, stderr=err)
+        # the rows before the unreadable block are imported
+        created = Enrollment.objects.filter(course=self.c1).count()
+        self.assertTrue(0 < created < 400)
+        line, message = err.getvalue().strip().split(": ", 1)
+        self.assertEqual(line, f"line {created + 2}")
+        self.assertTrue(message.startswith("Could not read the file from this line on"))
+        self.assertIn(f"Created {created} students and {created} enrollments, 1 errors", out.getvalue())
+
+    def test_missing_columns(self):
+        _, err = self.import_roster("username,email\nann,ann@test.net")
+        self.assertEqual(err.strip(), "line 1: Missing columns: first_name, last_name")
+
+
+class SyncReplicasTest(SimpleTestCase):
+    def test_copy_database(self):
+        with TemporaryDirectory() as directory:
+            source, replica = os.path.join(directory, "source.sqlite3"), os.path.join(directory, "replica.sqlite3")
+            with sqlite3.connect(source) as connection:
+                connection.execute("CREATE TABLE course (name TEXT)")
+                connection.execute("INSERT INTO course VALUES ('Physics 1')")
+            connection.close()
+            # the replica's open connection sees the copy without reconnecting
+            reader = sqlite3.connect(replica)
+            copy_database(source, replica)
+            self.assertEqual(reader.execute("SELECT name FROM course").fetchall(), [("Physics 1",)])
+            reader.close()
+
+    @override_settings(DATABASE_REPLICAS=[], DATABASE_REPORTING=None)
+    def test_without_replicas(self):
+        with self.assertRaises(CommandError):
+            call_command("sync_replicas", stdout=StringIO())
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class SeedScaleTest(TestCase):
+    def seed(self, *args):
+        call_command("seed_scale", "--students", "40", "--instructors", "3", "--courses", "6", "--max-seats", "25",
+                     "--batch-size", "7", *args, stdout=StringIO())
+
+    def test_seed(self):
+        self.seed()
+        self.assertEqual(User.objects.filter(is_student=True).count(), 40)
+        self.assertEqual(Student.objects.count(), 40)
+        self.assertEqual(Course.objects.count(), 6)
+        self.assertTrue(User.objects.get(username="student4").check_password("password"))
+        sizes = [Enrollment.objects.filter(course=course).count() for course in Course.objects.order_by("id")]
+        # the first course is full size
+        self.assertEqual(sizes[0], 25)
+        self.assertTrue(all(10 <= size <= 25 for size in sizes))
+        # seat counts match the enrollments, the full size course has no seat left
+        courses = list(Course.objects.order_by("id"))
+        self.assertEqual([course.enrolled_count for course in courses], sizes)
+        self.assertEqual(courses[0].seats_left(), 0)
+        self.assertTrue(all(0 <= course.seats_left() <= 10 for course in courses))
+        # and so do the other counters and the students' progress
+        call_command("repair_counters", "--check", stdout=StringIO())
+        call_command("rebuild_progress", "--check", stdout=StringIO())
+        self.assertEqual(CourseProgress.objects.count(), sum(sizes))
+        # final grades only exist in finished courses, submissions only for enrolled students
+        self.assertFalse(Grade.objects.filter(course__is_active=True).exists())
+        self.assertFalse(Submission.objects.exclude(
+            student__enrollment__course=models.F("assignment__course")).exists())
+        self.assertTrue(Assignment.objects.exists())
+        # courses are added to the search index
+        course = Course.objects.filter(is_active=True).first()
+        self.assertIn(course, [result[0] for result in search_courses(course.name)])
+
+    def test_reproducible(self):
+        def summary(courses):
+            return [(course.name, course.credits, Enrollment.objects.filter(course=course).count())
+                    for course in courses.order_by("id")]
+        self.seed("--seed", "3")
+        first = summary(Course.objects.all())
+        last_id = Course.objects.order_by("id").last().id
+        # a second run adds new rows after the existing ones
+        self.seed("--seed", "3")
+        self.assertEqual(summary(Course.objects.filter(id__gt=last_id)), first)
+        self.assertEqual(User.objects.count(), 86)
+
+
+class BenchUrlsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        c1, _ = create_courses()
+        s1, _ = create_students()
+        Enrollment.objects.create(course=c1, student=s1)
+        assignment = Assignment.objects.create(course=c1, title="Lab report")
+        Submission.objects.create(assignment=assignment, student=s1, text="Done")
+
+    def bench(self, *args):
+        out = StringIO()
+        call_command("bench_urls", "--iterations", "2", "--warmup", "0", "--route", "view-course",
+                     "--route", "view-finals", *args, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_results_and_baseline(self):
+        with TemporaryDirectory() as directory:
+            output = os.path.join(directory, "results.json")
+            self.bench("--output", output)
+            with open(output) as file:
+                results = json.load(file)
+            self.assertEqual(results["student"], "jcharles")
+            self.assertEqual(set(results["routes"]), {"view-course:student", "view-course:instructor",
+                                                      "view-finals:student", "view-finals:instructor"})
+            route = results["routes"]["view-course:instructor"]
+            self.assertEqual(route["status"], 200)
+            self.assertGreater(route["queries"], 0)
+            self.assertGreater(route["bytes"], 0)
+            self.assertIn("No regression", self.bench("--baseline", output, "--min-delta", "1000"))
+            # fewer queries or a much lower latency in the baseline are regressions
+            route["queries"] -= 1
+            results["routes"]["view-finals:student"]["p95"] = 0
+            with open(output, "w") as file:
+                json.dump(results, file)
+            with self.assertRaisesMessage(CommandError, "view-course:instructor"):
+                self.bench("--baseline", output, "--min-delta", "1000")
+            with self.assertRaisesMessage(CommandError, "view-finals:student: p95"):
+                self.bench("--baseline", output, "--min-delta", "0")
+
+
+class SlowQueriesTest(SimpleTestCase):
+    def test_summary(self):
+        def entry(duration, line, sql, plan):
+            return json.dumps({"time": 0, "duration_ms": duration, "database": "default", "sql": sql,
+                               "params": [], "file": "views.py", "function": "view", "line": line, "plan": plan})
+
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, "slow.log")
+            with open(f"{path}.1", "w") as file:
+                file.write(entry(150, 10, "SELECT 1", ["SCAN classmanager_attendance"]) + "\n")
+            with open(path, "w") as file:
+                file.write(entry(120, 20, "SELECT 2", None) + "\n")
+                file.write(entry(200, 10, "SELECT 1", ["SEARCH classmanager_attendance"]) + "\n")
+                file.write('{"cut by a rotation\n')
+            out = StringIO()
+            call_command("slow_queries", "--file", path, "--limit", "1", stdout=out)
+        out = out.getvalue()
+        self.assertIn("3 slow queries, 2 distinct", out)
+        self.assertIn("350ms total, 2 queries, mean 175.0ms, max 200.0ms - views.py:10 in view", out)
+        # the plan of the slowest run
+        self.assertIn("SEARCH classmanager_attendance", out)
+        self.assertNotIn("SELECT 2", out)
+
+    def test_missing_log(self):
+        with self.assertRaises(CommandError):
+            call_command("slow_queries", "--file", "/nonexistent/slow.log")
+
+
+class ProfilesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        setup_objects()
+
+    def test_report(self):
+        u1, u2, u3 = get_users()
+        User.objects.filter(pk=u2.pk).update(is_staff=True)
+        self.client.login(username=u2.username, password="123")
+        with TemporaryDirectory() as directory, override_settings(PROFILE_DIR=directory):
+            for _ in range(2):
+                self.client.get("/view_all_courses", HTTP_X_PROFILE="all")
+            self.client.get("/view/my_profile", HTTP_X_PROFILE="cpu")
+            out = StringIO()
+            call_command("profiles", "view-all-courses", "--limit", "5", "--output", os.path.join(directory, "merged"),
+                         stdout=out)
+            self.assertTrue(os.path.exists(os.path.join(directory, "merged")))
+            out = out.getvalue()
+            self.assertIn("view-all-courses: 2 requests", out)
+            self.assertIn("peak memory", out)
+            self.assertIn("function calls", out)
+            self.assertIn("Top allocations over 2 requests", out)
+            out = StringIO()
+            call_command("profiles", stdout=out)
+            self.assertIn("view-my-profile: 1 requests", out.getvalue())
+            with self.assertRaises(CommandError):
+                call_command("profiles", "view-finals")
+
+
+# runs a benchmark of concurrent joins in a subprocess, the seat logic itself is tested by EnrollmentTest
+@skipUnless(os.environ.get("CLASSMANAGER_BENCHMARK_TESTS") == "1", "set CLASSMANAGER_BENCHMARK_TESTS=1 to run")
+class BenchEnrollmentTest(SimpleTestCase):
+    def test_no_overbooking(self):
+        # the command runs threads on its own temporary database, which the test database can't be swapped for
+        with TemporaryDirectory() as directory:
+            result = subprocess.run(
+                [sys.executable, "manage.py", "bench_enrollment", "--students", "60", "--capacity", "20",
+                 "--threads", "8", "--leave", "0.5"],
+                cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=600,
+                env={**os.environ, "CLASSMANAGER_SLOW_QUERY_LOG": os.path.join(directory, "slow.log"),
+                     "CLASSMANAGER_METRICS_DIR": directory, "CLASSMANAGER_CACHE_DIR": os.path.join(directory, "cache")}
+            )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn("20 of 20 seats taken", result.stdout)
+        self.assertIn("No overbooking", result.stdout)
+
+
+class RepairCountersTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_courses()
+        create_students()
+
+    def test_repair(self):
+        u1, u2, u3 = get_users()
+        c1, c2 = Course.objects.get(id=1), Course.objects.get(id=2)
+        assignment = Assignment.objects.create(course=c1, title="Essay")
+        Submission.objects.create(assignment=assignment, student_id=u1.pk, text="Answer")
+        enrollment.join(c1.id, u1.pk)
+        call_command("repair_counters", "--check", stdout=StringIO())
+        # rows written without the app
+        Course.objects.update(assignment_count=5, ungraded_count=0)
+        Instructor.objects.update(course_count=0)
+        with self.assertRaisesMessage(CommandError, "Wrong counters on 2 courses and 1 instructors"):
+            call_command("repair_counters", "--check")
+        out = StringIO()
+        call_command("repair_counters", "--course", str(c1.id), stdout=out)
+        self.assertIn("Recounted 1 courses and 1 instructors, fixed 1 courses and 1 instructors", out.getvalue())
+        c1.refresh_from_db()
+        self.assertEqual((c1.enrolled_count, c1.assignment_count, c1.ungraded_count), (1, 1, 1))
+        self.assertEqual(Instructor.objects.get(pk=u2.pk).course_count, 2)
+        self.assertEqual(Course.objects.get(pk=c2.pk).assignment_count, 5)
+        call_command("repair_counters", stdout=StringIO())
+        call_command("repair_counters", "--check", stdout=StringIO())
+
+
+class RebuildProgressTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_courses()
+        create_students()
+
+    def test_rebuild(self):
+        u1, _, u3 = get_users()
+        c1, c2 = Course.objects.get(id=1), Course.objects.get(id=2)
+        for course, user in ((c1, u1), (c1, u3), (c2, u1)):
+            enrollment.join(course.id, user.pk)
+        assignment = Assignment.objects.create(course=c1, title="Essay", points=10)
+        Submission.objects.create(assignment=assignment, student_id=u1.pk, text="Answer", score=7)
+        Attendance.objects.create(course=c1, student_id=u3.pk, week=1)
+        call_command("rebuild_progress", "--check", stdout=StringIO())
+        # rows written without the app
+        CourseProgress.objects.filter(course=c1, student=u1.pk).update(points_earned=0)
+        CourseProgress.objects.filter(course=c2).delete()
+        Attendance.objects.bulk_create([Attendance(course=c1, student_id=u3.pk, week=2)])
+        with self.assertRaisesMessage(CommandError, "Wrong progress for 3 enrollments"):
+            call_command("rebuild_progress", "--check")
+        out = StringIO()
+        call_command("rebuild_progress", "--course", str(c1.id), stdout=out)
+        self.assertIn("Rebuilt the progress of 2 enrollments, fixed 2", out.getvalue())
+        self.assertEqual(list(CourseProgress.objects.filter(course=c1).order_by("student").values_list(
+            "points_earned", "points_possible", "submission_count", "attendance_count"
+        )), [(7, 10, 1, 0), (0, 10, 0, 2)])
+        self.assertFalse(CourseProgress.objects.filter(course=c2).exists())
+        call_command("rebuild_progress", stdout=StringIO())
+        call_command("rebuild_progress", "--check", stdout=StringIO())
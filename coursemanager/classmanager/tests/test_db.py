@@ -0,0 +1,76 @@
+import json
+from unittest import mock
+
+from django.db import OperationalError, connection
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from .test_models import get_users
+from .test_views import setup_objects
+from ..db import retry_on_busy
+from ..models import Course
+
+
+class ConnectionProfileTest(TestCase):
+    def test_pragmas_applied(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute("PRAGMA cache_size")
+            self.assertEqual(cursor.fetchone()[0], -64000)
+            # NORMAL
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+
+@override_settings(SQLITE_BUSY_RETRIES=3, SQLITE_BUSY_BACKOFF=0)
+class RetryOnBusyTest(SimpleTestCase):
+    def test_retries_until_success(self):
+        view = mock.Mock(side_effect=[OperationalError("database is locked")] * 2 + ["response"])
+        self.assertEqual(retry_on_busy(view)("request"), "response")
+        self.assertEqual(view.call_count, 3)
+
+    def test_gives_up_after_retries(self):
+        view = mock.Mock(side_effect=OperationalError("database is locked"))
+        with self.assertRaises(OperationalError):
+            retry_on_busy(view)("request")
+        self.assertEqual(view.call_count, 4)
+
+    def test_other_errors_not_retried(self):
+        view = mock.Mock(side_effect=OperationalError("no such table: classmanager_course"))
+        with self.assertRaises(OperationalError):
+            retry_on_busy(view)("request")
+        self.assertEqual(view.call_count, 1)
+        # nor inside an outer transaction, which the error already broke
+        view = mock.Mock(side_effect=OperationalError("database is locked"))
+        with mock.patch.object(connection, "in_atomic_block", True), self.assertRaises(OperationalError):
+            retry_on_busy(view)("request")
+        self.assertEqual(view.call_count, 1)
+
+
+class SlowQueryLogTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        setup_objects()
+
+    def setUp(self):
+        self.u1, self.u2, self.u3 = get_users()
+        self.c1 = Course.objects.get(id=1)
+        self.client.login(username=self.u2.username, password="123")
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_logged_with_call_site_and_plan(self):
+        with self.assertLogs("classmanager.slow_queries", "INFO") as logs:
+            self.client.get(f"/view/attendance/{self.c1.id}")
+        entries = [json.loads(record.getMessage()) for record in logs.records]
+        # the attendances are read while the view iterates over them
+        entry = next(entry for entry in entries if "classmanager_attendance" in entry["sql"])
+        self.assertEqual((entry["file"], entry["function"]), ("views.py", "view_attendance"))
+        self.assertEqual(entry["params"], [self.c1.id])
+        self.assertTrue(entry["plan"])
+        # the EXPLAIN queries aren't logged themselves
+        self.assertFalse(any(entry["sql"].startswith("EXPLAIN") for entry in entries))
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=None)
+    def test_disabled(self):
+        with self.assertNoLogs("classmanager.slow_queries", "INFO"):
+            self.client.get(f"/view/attendance/{self.c1.id}")
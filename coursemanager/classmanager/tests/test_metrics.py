@@ -0,0 +1,100 @@
+import json
+import os
+import subprocess
+import sys
+from tempfile import TemporaryDirectory
+
+from django.test import TestCase, override_settings
+from .test_models import get_users
+from .test_views import setup_objects
+from .. import metrics
+from ..models import User, Course
+
+
+class MetricsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        setup_objects()
+
+    def setUp(self):
+        self.u1, self.u2, self.u3 = get_users()
+        self.c1 = Course.objects.get(id=1)
+        self.client.login(username=self.u2.username, password="123")
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings = override_settings(METRICS_ENABLED=True, METRICS_DIR=self.directory, METRICS_TOKEN="secret")
+        settings.enable()
+        self.addCleanup(settings.disable)
+        # counted from scratch, and nothing left to write once the tests end
+        for counts in (metrics.registry.counters, metrics.registry.histograms):
+            counts.clear()
+            self.addCleanup(counts.clear)
+
+    def scrape(self):
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+        return dict(line.rsplit(" ", 1) for line in response.content.decode().splitlines()
+                    if not line.startswith("#"))
+
+    def test_request_metrics(self):
+        for _ in range(2):
+            self.client.get(f"/view_course/{self.c1.id}")
+        self.client.get("/view_course/999")
+        samples = self.scrape()
+        self.assertEqual(samples['classmanager_requests_total{view="view-course",method="GET",status="200"}'], "3")
+        self.assertEqual(samples['classmanager_request_duration_seconds_count{view="view-course"}'], "3")
+        self.assertEqual(samples['classmanager_request_duration_seconds_bucket{view="view-course",le="+Inf"}'], "3")
+        # every request of the view runs queries
+        self.assertEqual(samples['classmanager_request_queries_bucket{view="view-course",le="0"}'], "0")
+        self.assertEqual(samples['classmanager_request_queries_count{view="view-course"}'], "3")
+        # the content of the course is rendered once, then read from the cache
+        self.assertEqual(samples['classmanager_cache_requests_total{cache="course_content",result="hit"}'], "1")
+        self.assertEqual(samples['classmanager_cache_requests_total{cache="course_content",result="miss"}'], "1")
+        self.assertEqual(samples['classmanager_cache_hit_ratio{cache="course_content"}'], "0.5")
+
+    def test_workers_merged(self):
+        # counts written by another worker process
+        with open(os.path.join(self.directory, f"{os.getppid()}.json"), "w") as file:
+            json.dump({
+                "counters": {"classmanager_requests_total": {'view="index",method="GET",status="200"': 4}},
+                "histograms": {"classmanager_request_queries": {
+                    'view="index"': {"counts": [4] + [0] * len(metrics.QUERY_BUCKETS), "sum": 0}
+                }}
+            }, file)
+        self.client.get("/")
+        samples = self.scrape()
+        self.assertEqual(samples['classmanager_requests_total{view="index",method="GET",status="200"}'], "5")
+        self.assertEqual(samples['classmanager_request_queries_count{view="index"}'], "5")
+        # the file of this worker
+        self.assertIn(f"{os.getpid()}.json", os.listdir(self.directory))
+
+    def test_stopped_workers_removed(self):
+        self.client.get("/")
+        # a worker that was killed before removing its file
+        stopped = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"], capture_output=True,
+                                 text=True, check=True).stdout.strip()
+        with open(os.path.join(self.directory, f"{stopped}.json"), "w") as file:
+            json.dump({"counters": {"classmanager_requests_total": {
+                'view="index",method="GET",status="200"': 4}}, "histograms": {}}, file)
+        samples = self.scrape()
+        self.assertEqual(samples['classmanager_requests_total{view="index",method="GET",status="200"}'], "1")
+        self.assertEqual(os.listdir(self.directory), [f"{os.getpid()}.json"])
+        # a worker removes its own file when it exits
+        metrics.remove_on_exit()
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_token_or_staff(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer wrong").status_code, 401)
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret").status_code, 200)
+        with override_settings(METRICS_TOKEN=None):
+            self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer None").status_code, 401)
+            User.objects.filter(pk=self.u2.pk).update(is_staff=True)
+            self.assertEqual(self.client.get("/metrics").status_code, 200)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled(self):
+        # answered by the 404 page
+        self.assertTemplateUsed(self.client.get("/metrics"), "classmanager/404.html")
+
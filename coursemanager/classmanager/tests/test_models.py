@@ -1,3 +1,6 @@
+from unittest import skipUnless
+from django.db import connection
+from django.db.models import Q
 from django.test import TestCase
 from ..models import User, Student, Instructor, Course, Enrollment, \
     Announcement, Assignment, Submission, Attendance, Grade
@@ -176,3 +179,56 @@ class CourseFeatureModelTest(TestCase):
         for grade in grade1, grade2:
             grade_expected_name = f"'{grade.student.get_name()}' scored {grade.score}% in '{grade.course.name}'"
             self.assertEqual(str(grade), grade_expected_name)
+
+
+@skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN is specific to SQLite")
+class QueryPlanTest(TestCase):
+    # checks that the hot queries in views.py are answered from an index instead of a table scan
+    @classmethod
+    def setUpTestData(cls):
+        create_courses()
+
+    def setUp(self):
+        self.c1 = Course.objects.get(id=1)
+        self.instructor = Instructor.objects.get(user_id=2)
+        self.s1, self.s2 = create_students()
+        self.assignment = Assignment.objects.create(title="Introduce yourselves!", course=self.c1)
+
+    def query_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertUsesIndex(self, queryset):
+        for detail in self.query_plan(queryset):
+            # e.g. "SCAN classmanager_course" is a table scan, "SEARCH ... USING INDEX ..." is not
+            if detail.startswith("SCAN"):
+                self.assertIn("INDEX", detail, f"{detail} in {queryset.query}")
+            self.assertNotIn("TEMP B-TREE", detail, f"{detail} in {queryset.query}")
+
+    def test_hot_queries_use_indexes(self):
+        c1, s1 = self.c1, self.s1
+        querysets = [
+            Course.objects.filter(is_active=True).order_by("name"),
+            # keyset pagination of the catalog
+            Course.objects.filter(Q(name__gte="Physics") & (Q(name__gt="Physics") | Q(id__gt=1)), is_active=True)
+            .order_by("name", "id"),
+            Course.objects.filter(instructor=self.instructor).order_by("-date_created"),
+            Course.objects.filter(enrollment__student=s1.pk),
+            Enrollment.objects.filter(course=c1, student=s1),
+            Enrollment.objects.filter(course=c1),
+            Student.objects.filter(enrollment__course=c1),
+            Announcement.objects.filter(course=c1).order_by("-date_created"),
+            Assignment.objects.filter(course=c1).order_by("-date_created"),
+            Submission.objects.filter(assignment=self.assignment),
+            Submission.objects.filter(assignment=self.assignment, student=s1),
+            Submission.objects.filter(assignment__course=c1, student=s1),
+            Attendance.objects.filter(course=c1).order_by("week"),
+            Attendance.objects.filter(student=s1, course=c1),
+            Grade.objects.filter(course=c1),
+            Grade.objects.filter(course=c1, student=s1),
+        ]
+        for queryset in querysets:
+            with self.subTest(query=str(queryset.query)):
+                self.assertUsesIndex(queryset)
@@ -0,0 +1,77 @@
+import time
+
+from django.contrib.sessions.backends.signed_cookies import SessionStore
+from django.contrib.sessions.models import Session
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from ..models import Course, Grade
+from ..routers import PIN_KEY, ReplicaRouter, replica_middleware, reporting_database, routing_scope
+
+
+@override_settings(DATABASE_REPLICAS=["replica1", "replica2"], DATABASE_REPORTING="reporting")
+class ReplicaRouterTest(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+
+    def request(self, view, session=None):
+        # runs the view through the middleware and returns the request's session
+        request = RequestFactory().get("/")
+        request.session = session if session is not None else SessionStore()
+        replica_middleware(view)(request)
+        return request.session
+
+    def test_reads_go_to_replicas_until_written(self):
+        with routing_scope():
+            reads = {self.router.db_for_read(Course) for _ in range(50)}
+            self.assertEqual(reads, {"replica1", "replica2"})
+            self.assertEqual(self.router.db_for_write(Course), "default")
+            self.assertEqual(self.router.db_for_read(Course), "default")
+
+    def test_sessions_read_from_default(self):
+        with routing_scope():
+            self.assertEqual(self.router.db_for_read(Session), "default")
+
+    def test_session_sticks_to_default_after_write(self):
+        reads = []
+
+        def write(request):
+            self.router.db_for_write(Course)
+            return HttpResponse()
+
+        def read(request):
+            reads.append(self.router.db_for_read(Course))
+            return HttpResponse()
+        session = self.request(write)
+        self.assertGreater(session[PIN_KEY], time.time())
+        self.request(read, session)
+        self.assertEqual(reads, ["default"])
+        # reads go back to the replicas once the pin expired, and other sessions are not affected
+        session[PIN_KEY] = time.time() - 1
+        self.request(read, session)
+        self.request(read)
+        self.assertIn(reads[1], ["replica1", "replica2"])
+        self.assertIn(reads[2], ["replica1", "replica2"])
+
+    def test_reporting_views(self):
+        reads = []
+
+        @reporting_database
+        def report(request):
+            reads.append(self.router.db_for_read(Grade))
+            return HttpResponse()
+        self.request(report)
+        self.assertEqual(reads, ["reporting"])
+        # unless the session has to see its own writes
+        session = SessionStore()
+        session[PIN_KEY] = time.time() + 10
+        self.request(report, session)
+        self.assertEqual(reads[-1], "default")
+
+    @override_settings(DATABASE_REPLICAS=[], DATABASE_REPORTING=None)
+    def test_without_replicas(self):
+        with routing_scope():
+            self.assertEqual(self.router.db_for_read(Course), "default")
+            self.assertEqual(reporting_database(lambda request: self.router.db_for_read(Grade))(None), "default")
+        self.assertEqual(self.router.allow_migrate("replica1", "classmanager"), False)
+        self.assertEqual(self.router.allow_migrate("default", "classmanager"), True)
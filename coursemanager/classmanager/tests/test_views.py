@@ -1,8 +1,31 @@
-from django.test import TestCase
+import json
+import os
+import subprocess
+import sys
+from io import StringIO
+from tempfile import TemporaryDirectory
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from .test_models import create_users, get_users, create_students, create_courses
 from django.urls import reverse
+from .. import counters, enrollment, roster
+from ..middleware import profiling_middleware
 from ..models import User, Student, Instructor, Course, Enrollment, \
-    Announcement, Assignment, Submission, Attendance, Grade
+    Announcement, Assignment, Submission, Attendance, Grade, WaitlistEntry, GradingPolicy, CourseProgress
+
+
+def bump_in_other_process(name):
+    # bumps a cached version the way another server process would, through the cache directory of the tests
+    subprocess.run([sys.executable, "manage.py", "shell", "-c",
+                    f"from classmanager import course_cache; course_cache.bump_version({name!r})"],
+                   cwd=settings.BASE_DIR, check=True, capture_output=True,
+                   env={**os.environ, "CLASSMANAGER_CACHE_DIR": str(settings.CACHES["default"]["LOCATION"])})
 
 
 def setup_objects():
@@ -204,3 +227,901 @@ class CourseViewTest(TestCase):
         data = {"name": "Biology", "department": "Science", "description": "Entry level biology", "length": 12}
         response = self.client.post("/create/course", data=data)
         self.assertIn("failure_message", response.context)
+
+
+def enroll_students(course, count, start=0):
+    # creates and enrolls `count` students in the course, each with a submission, attendance and grade
+    assignment = Assignment.objects.get_or_create(title="Essay", course=course)[0]
+    for i in range(start, start + count):
+        user = User.objects.create(first_name=f"Student{i}", last_name="Test", username=f"student{i}",
+                                   email=f"student{i}@test.net", is_student=True)
+        student = Student.objects.create(user=user)
+        Enrollment.objects.create(course=course, student=student)
+        Submission.objects.create(assignment=assignment, student=student, text="Answer")
+        Attendance.objects.create(student=student, course=course, week=1)
+        Grade.objects.create(student=student, course=course, score=90)
+    return assignment
+
+
+class QueryCountTest(TestCase):
+    # tests that list views issue a constant number of queries regardless of class size
+    @classmethod
+    def setUpTestData(cls):
+        setup_objects()
+
+    def setUp(self):
+        self.u1, self.u2, self.u3 = get_users()
+        self.s1, self.s2 = create_students()
+        self.c1, self.c2 = Course.objects.get(id=1), Course.objects.get(id=2)
+        self.assignment = enroll_students(self.c1, 2)
+        Enrollment.objects.create(course=self.c1, student=self.s1)
+        Enrollment.objects.create(course=self.c2, student=self.s1)
+        Submission.objects.create(assignment=self.assignment, student=self.s1, text="Mine")
+
+    def count_queries(self, username, path):
+        self.client.login(username=username, password="123")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.client.logout()
+        return len(queries)
+
+    def assertConstantQueries(self, username, path):
+        before = self.count_queries(username, path)
+        enroll_students(self.c1, 8, start=2)
+        after = self.count_queries(username, path)
+        self.assertEqual(before, after, path)
+
+    def test_instructor_list_views(self):
+        c1 = self.c1.id
+        for path in (f"/create/attendance/{c1}", f"/view/attendance/{c1}",
+                     f"/view/submissions/{c1}/{self.assignment.id}", f"/grade/final/{c1}", f"/view/final/{c1}",
+                     f"/view/all/announcements/{c1}", f"/view/all/assignments/{c1}", "/view_all_courses"):
+            with self.subTest(path=path):
+                self.assertConstantQueries(self.u2.username, path)
+                # remove students created by the previous subtest
+                User.objects.filter(username__startswith="student").exclude(
+                    username__in=["student0", "student1"]).delete()
+
+    def test_student_list_views(self):
+        for path in ("/view_joined_courses", f"/view/submissions/{self.c1.id}", f"/view/final/{self.c1.id}"):
+            with self.subTest(path=path):
+                self.assertConstantQueries(self.u1.username, path)
+                User.objects.filter(username__startswith="student").exclude(
+                    username__in=["student0", "student1"]).delete()
+
+
+class CourseAccessTest(TestCase):
+    # tests the course_access decorator shared by the course views
+    @classmethod
+    def setUpTestData(cls):
+        setup_objects()
+
+    def setUp(self):
+        self.u1, self.u2, self.u3 = get_users()
+        self.s1, self.s2 = create_students()
+        self.c1, self.c2 = Course.objects.get(id=1), Course.objects.get(id=2)
+        Enrollment.objects.create(course=self.c1, student=self.s1)
+        self.assignment = Assignment.objects.create(title="Essay", course=self.c1)
+
+    def test_enrolled_student_access(self):
+        self.client.login(username=self.u1.username, password="123")
+        response = self.client.get(f"/view_course/{self.c1.id}")
+        self.assertTemplateUsed(response, "classmanager/view_course.html")
+        # student is not enrolled in the second course
+        response = self.client.get(f"/view_course/{self.c2.id}")
+        self.assertTemplateUsed(response, "classmanager/failure.html")
+        # instructor only route
+        response = self.client.get(f"/grade/final/{self.c1.id}")
+        self.assertIn("failure_message", response.context)
+
+    def test_instructor_access(self):
+        self.client.login(username=self.u2.username, password="123")
+        response = self.client.get(f"/view/attendance/{self.c1.id}")
+        self.assertTemplateUsed(response, "classmanager/view_attendance.html")
+        response = self.client.get("/view/attendance/99")
+        self.assertEqual(response.context["failure_message"], "The course you are searching for does not exist")
+        # course created by another instructor
+        other = User.objects.create(username="other", is_instructor=True)
+        other.set_password("123")
+        other.save()
+        Instructor.objects.create(user=other)
+        self.client.login(username="other", password="123")
+        response = self.client.get(f"/view/attendance/{self.c1.id}")
+        self.assertTemplateUsed(response, "classmanager/failure.html")
+
+    def test_user_without_role(self):
+        self.client.login(username="bbaz", password="123")
+        response = self.client.get(f"/view/all/announcements/{self.c1.id}")
+        self.assertEqual(response.context["failure_message"],
+                         "Sorry, you don't have the permission to view announcements")
+
+    def test_access_queries(self):
+        # session + user lookups, a single access query, then the view's own query
+        self.client.login(username=self.u1.username, password="123")
+        with self.assertNumQueries(4):
+            self.client.get(f"/create/submission/{self.c1.id}/{self.assignment.id}")
+        with self.assertNumQueries(4):
+            self.client.get(f"/view/all/assignments/{self.c1.id}")
+        self.client.login(username=self.u2.username, password="123")
+        with self.assertNumQueries(4):
+            self.client.get(f"/view/all/announcements/{self.c1.id}")
+
+
+class AttendanceViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        setup_objects()
+
+    def setUp(self):
+        self.u1, self.u2, self.u3 = get_users()
+        self.s1, self.s2 = create_students()
+        self.c1 = Course.objects.get(id=1)
+        enroll_students(self.c1, 5)
+        Enrollment.objects.create(course=self.c1, student=self.s1)
+        self.client.login(username=self.u2.username, password="123")
+
+    def test_create_attendance(self):
+        # student0 already attended week 1, s2 is not enrolled in the course
+        data = {"week": 1, str(self.s1.pk): "on", str(self.s2.pk): "on"}
+        for student in Student.objects.filter(user__username__startswith="student"):
+            data[str(student.pk)] = "on"
+        response = self.client.post(f"/create/attendance/{self.c1.id}", data=data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Attendance.objects.filter(course=self.c1, week=1).count(), 6)
+        self.assertFalse(Attendance.objects.filter(student=self.s2).exists())
+        # submitting the same attendance again doesn't create duplicates
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(f"/create/attendance/{self.c1.id}", data=data)
+        self.assertEqual(Attendance.objects.filter(course=self.c1, week=1).count(), 6)
+        self.assertLess(len(queries), 10)
+
+    def test_invalid_week(self):
+        for week in ("last", 0, self.c1.length + 1):
+            response = self.client.post(f"/create/attendance/{self.c1.id}",
+                                        data={"week": week, str(self.s1.pk): "on"})
+            self.assertEqual(response.context["failure_message"],
+                             "Sorry, please select a valid week for the attendance")
+        self.assertFalse(Attendance.objects.filter(student=self.s1).exists())
+        # the last week of the course can be taken
+        self.assertContains(self.client.get(f"/create/attendance/{self.c1.id}"),
+                            f"<option value={self.c1.length}>{self.c1.length}</option>")
+        self.client.post(f"/create/attendance/{self.c1.id}", data={"week": self.c1.length, str(self.s1.pk): "on"})
+        self.assertTrue(Attendance.objects.filter(student=self.s1, week=self.c1.length).exists())
+
+
+class CourseCatalogTest(TestCase):
+    # tests pagination, filters and facets of the course catalog
+    @classmethod
+    def setUpTestData(cls):
+        create_courses()
+        instructor = Instructor.objects.get(user_id=2)
+        for i in range(45):
+            Course.objects.create(instructor=instructor, name=f"Course {i:02}", department=("Math", "Art")[i % 2],
+                                  credits=3 + i % 3, description="")
+        Course.objects.create(instructor=instructor, name="Course 00", department="Math", credits=3, description="")
+        Course.objects.create(instructor=instructor, name="Inactive", is_active=False, description="")
+
+    def test_pages_cover_all_courses_once(self):
+        names, path = [], "/view_all_courses"
+        while path:
+            response = self.client.get(path)
+            names += [(course.name, course.id) for course in response.context["courses"]]
+            next_page = response.context.get("next_page")
+            path = f"/view_all_courses?{next_page}" if next_page else None
+        expected = list(Course.objects.filter(is_active=True).order_by("name", "id").values_list("name", "id"))
+        self.assertEqual(names, expected)
+
+    def test_filters_and_facets(self):
+        response = self.client.get("/view_all_courses?department=Math&credits=3")
+        courses = response.context["courses"]
+        self.assertTrue(all(c.department == "Math" and c.credits == 3 for c in courses))
+        self.assertEqual(len(courses), Course.objects.filter(is_active=True, department="Math", credits=3).count())
+        # department counts are restricted to 3 credit courses and credit counts to Math courses
+        self.assertEqual(dict(response.context["department_facets"])["Math"], len(courses))
+        self.assertEqual(dict(response.context["credit_facets"]), {3: 9, 4: 7, 5: 8})
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/view_all_courses?after=garbage")
+        self.assertEqual(response.context["courses"][0].name, "Astrophysics")
+
+
+class CourseSearchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        c1, c2 = create_courses()
+        c1.description = "Mechanics, waves and <b>optics</b> for beginners"
+        c1.save()
+
+    def search(self, query):
+        response = self.client.get(reverse("search-courses"), {"q": query})
+        return response.context["results"]
+
+    def test_ranked_results_with_snippets(self):
+        results = self.search("physics")
+        # "Physics 1" matches in its name while "Astrophysics" does not match as a prefix
+        self.assertEqual([course.name for course, _, _ in results], ["Physics 1"])
+        self.assertEqual(results[0][1], "<mark>Physics</mark> 1")
+        _, _, snippet = self.search("optic")[0]
+        self.assertIn("&lt;b&gt;<mark>optics</mark>&lt;/b&gt;", snippet)
+        # instructor names and departments are searchable too
+        self.assertEqual(len(self.search("Bernat science")), 2)
+        # operators typed by the user are treated as plain words
+        self.assertEqual(self.search('"phys* OR NEAR('), [])
+
+    def test_index_follows_course_changes(self):
+        course = Course.objects.get(name="Astrophysics")
+        course.name = "Cosmology"
+        course.save()
+        self.assertEqual(self.search("astrophysics"), [])
+        self.assertEqual(len(self.search("cosmology")), 1)
+        course.is_active = False
+        course.save()
+        self.assertEqual(self.search("cosmology"), [])
+        course.delete()
+        user = User.objects.get(username="abernat")
+        user.last_name = "Smith"
+        user.save()
+        self.assertEqual(len(self.search("smith")), 1)
+
+
+class GradebookTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        setup_objects()
+
+    def setUp(self):
+        self.u1, self.u2, self.u3 = get_users()
+        self.s1, self.s2 = create_students()
+        self.c1 = Course.objects.get(id=1)
+        Enrollment.objects.create(course=self.c1, student=self.s1)
+        Enrollment.objects.create(course=self.c1, student=self.s2)
+        self.a1 = Assignment.objects.create(title="Essay", course=self.c1, points=10)
+        self.a2 = Assignment.objects.create(title="Quiz", course=self.c1, points=5)
+        self.a3 = Assignment.objects.create(title="Project", course=self.c1, points=20)
+        Submission.objects.create(assignment=self.a1, student=self.s1, score=4, is_graded=True, text="first try")
+        Submission.objects.create(assignment=self.a1, student=self.s1, score=8, is_graded=True, text="second try")
+        Submission.objects.create(assignment=self.a1, student=self.s2, score=6, is_graded=True, text="answer")
+        Submission.objects.create(assignment=self.a2, student=self.s2, score=5, is_graded=True, text="answer")
+        # over the assignment's points
+        Submission.objects.create(assignment=self.a2, student=self.s1, score=7, is_graded=True, text="answer")
+        Submission.objects.create(assignment=self.a3, student=self.s1, text="not graded yet")
+
+    def test_gradebook(self):
+        self.client.login(username=self.u2.username, password="123")
+        with self.assertNumQueries(6):
+            response = self.client.get(f"/view/gradebook/{self.c1.id}")
+        gradebook = response.context["gradebook"]
+        # students are ordered by last name, Burke (s2) before Charles (s1)
+        self.assertEqual([row["student"] for row in response.context["rows"]], [self.s2, self.s1])
+        self.assertEqual(gradebook.totals.tolist(), [11, 13])
+        self.assertEqual(gradebook.student_missing.tolist(), [1, 0])
+        self.assertEqual(gradebook.assignment_missing.tolist(), [0, 0, 1])
+        self.assertEqual(gradebook.means[0], 7)
+        self.assertEqual(gradebook.medians[1], 5)
+        self.assertEqual(gradebook.stddevs[0], 1)
+        self.assertIsNone(response.context["columns"][2]["mean"])
+        self.assertAlmostEqual(response.context["rows"][0]["percentage"], 11 / 35 * 100)
+        self.assertEqual(response.context["rows"][1]["cells"][2], {"score": None, "ungraded": True})
+        self.assertContains(response, "ungraded")
+        # the totals are the points earned of final grades and progress
+        self.assertEqual(dict(CourseProgress.objects.filter(course=self.c1).values_list("student", "points_earned")),
+                         {self.s2.pk: 11, self.s1.pk: 13})
+
+    def test_students_cannot_view_gradebook(self):
+        self.client.login(username=self.u1.username, password="123")
+        response = self.client.get(f"/view/gradebook/{self.c1.id}")
+        self.assertTemplateUsed(response, "classmanager/failure.html")
+
+
+class ExportTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        setup_objects()
+
+    def setUp(self):
+        self.u1, self.u2, self.u3 = get_users()
+        self.c1 = Course.objects.get(id=1)
+        enroll_students(self.c1, 3)
+        self.client.login(username=self.u2.username, password="123")
+
+    def test_csv_export(self):
+        response = self.client.get(f"/export/roster/{self.c1.id}")
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Disposition"], f'attachment; filename="course-{self.c1.id}-roster.csv"')
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], "student_id,username,first_name,last_name,email,major,standing,date_joined")
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[1].startswith(f"{Student.objects.get(user__username='student0').pk},student0,"))
+
+    def test_ndjson_export(self):
+        for dataset in ("attendance", "submissions", "grades"):
+            response = self.client.get(f"/export/{dataset}/{self.c1.id}", {"format": "ndjson"})
+            rows = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+            self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]["score"], 90)
+
+    def test_invalid_exports(self):
+        response = self.client.get(f"/export/passwords/{self.c1.id}")
+        self.assertIn("failure_message", response.context)
+        self.client.login(username=self.u1.username, password="123")
+        response = self.client.get(f"/export/roster/{self.c1.id}")
+        self.assertTemplateUsed(response, "classmanager/failure.html")
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class UploadRosterTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        setup_objects()
+
+    def test_upload_roster(self):
+        u1, u2, _ = get_users()
+        other = Course.objects.create(instructor=Instructor.objects.create(user=User.objects.create(username="x")),
+                                      name="Other", description="")
+        roster = SimpleUploadedFile("roster.csv", b"username,email,first_name,last_name,courses\n"
+                                                  b"ann,ann@test.net,Ann,Lee,1\n"
+                                                  b"bob,bob@test.net,Bob,Ray,%d\n" % other.id)
+        self.client.login(username=u2.username, password="123")
+        response = self.client.post(reverse("import-roster"), {"roster": roster})
+        # instructors can't enroll students in courses they didn't create
+        self.assertEqual(response.context["result"].errors,
+                         [(3, f"Course {other.id} does not exist or can't be joined")])
+        self.assertTrue(Enrollment.objects.filter(course_id=1, student__user__username="ann").exists())
+        # students can't import rosters
+        self.client.login(username=u1.username, password="123")
+        response = self.client.get(reverse("import-roster"))
+        self.assertTemplateUsed(response, "classmanager/failure.html")
+
+    def test_large_or_unreadable_roster(self):
+        _, u2, _ = get_users()
+        self.client.login(username=u2.username, password="123")
+        rows = b"".join(b"student%d,s%d@test.net,Stu,Dent,1\n" % (i, i) for i in range(roster.UPLOAD_MAX_ROWS + 1))
+        response = self.client.post(reverse("import-roster"), {"roster": SimpleUploadedFile(
+            "roster.csv", b"username,email,first_name,last_name,courses\n" + rows)})
+        self.assertTrue(response.context["failure_message"].startswith(
+            f"Sorry, rosters of more than {roster.UPLOAD_MAX_ROWS} students can't be uploaded"))
+        self.assertFalse(Student.objects.filter(user__username__startswith="student").exists())
+        response = self.client.post(reverse("import-roster"),
+                                    {"roster": SimpleUploadedFile("roster.csv", b"\xff\xfeusername")})
+        self.assertContains(response, "Sorry, the roster must be a UTF-8 encoded CSV file")
+
+
+class CourseContentCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        setup_objects()
+
+    def setUp(self):
+        self.u1, self.u2, self.u3 = get_users()
+        self.s1, self.s2 = create_students()
+        self.c1 = Course.objects.get(id=1)
+        Enrollment.objects.create(course=self.c1, student=self.s1)
+        Announcement.objects.create(course=self.c1, text="Welcome to class")
+
+    def test_cached_until_course_changes(self):
+        self.client.login(username=self.u2.username, password="123")
+        response = self.client.get(f"/view_course/{self.c1.id}")
+        self.assertContains(response, "Welcome to class")
+        self.assertTemplateUsed(response, "classmanager/course_content.html")
+        # repeat views skip the announcement and assignment queries and the fragment render
+        with self.assertNumQueries(3):
+            response = self.client.get(f"/view_course/{self.c1.id}")
+        self.assertTemplateNotUsed(response, "classmanager/course_content.html")
+        self.assertContains(response, "Welcome to class")
+        # students see the student version of the fragment
+        self.client.login(username=self.u1.username, password="123")
+        response = self.client.get(f"/view_course/{self.c1.id}")
+        self.assertContains(response, "View all Your submissions")
+        self.assertNotContains(response, "Create an Announcement")
+        # writes are visible on the next view
+        self.client.login(username=self.u2.username, password="123")
+        self.client.post(f"/create/announcement/{self.c1.id}", {"text": "Quiz on Friday"})
+        self.assertContains(self.client.get(f"/view_course/{self.c1.id}"), "Quiz on Friday")
+        Assignment.objects.create(title="Lab report", course=self.c1)
+        self.assertContains(self.client.get(f"/view_course/{self.c1.id}"), "Lab report")
+        Announcement.objects.filter(text="Quiz on Friday").delete()
+        self.assertNotContains(self.client.get(f"/view_course/{self.c1.id}"), "Quiz on Friday")
+
+    def test_version_shared_between_processes(self):
+        self.client.login(username=self.u2.username, password="123")
+        self.assertContains(self.client.get(f"/view_course/{self.c1.id}"), "Welcome to class")
+        # another server process handles a write to the course and bumps its version in the shared cache
+        Announcement.objects.filter(course=self.c1).update(text="Class moved online")
+        bump_in_other_process(f"course:{self.c1.id}")
+        self.assertContains(self.client.get(f"/view_course/{self.c1.id}"), "Class moved online")
+
+
+@override_settings(ROOT_URLCONF="classmanager.tests.async_urls")
+class AsyncViewsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        setup_objects()
+        cls.u1, cls.u2, cls.u3 = get_users()
+        cls.s1, cls.s2 = create_students()
+        cls.c1 = Course.objects.get(id=1)
+        Enrollment.objects.create(course=cls.c1, student=cls.s1)
+        Announcement.objects.create(course=cls.c1, text="Welcome to class")
+        Assignment.objects.create(course=cls.c1, title="Lab report", points=20)
+        Grade.objects.create(course=cls.c1, student=cls.s1, score=88)
+
+    async def test_catalog(self):
+        await self.async_client.aforce_login(self.u1)
+        response = await self.async_client.get("/view_all_courses")
+        self.assertTemplateUsed(response, "classmanager/view_courses.html")
+        self.assertContains(response, "Astrophysics")
+        self.assertEqual(response.context["credit_facets"], [(4, 2)])
+        # anonymous users can browse the catalog as well
+        await self.async_client.alogout()
+        self.assertContains(await self.async_client.get("/view_all_courses?department=Science"), "Physics 1")
+
+    async def test_view_course(self):
+        await self.async_client.aforce_login(self.u2)
+        response = await self.async_client.get(f"/view_course/{self.c1.id}")
+        self.assertContains(response, "Welcome to class")
+        self.assertContains(response, "Lab report")
+        self.assertContains(response, "Create an Announcement")
+        await self.async_client.aforce_login(self.u1)
+        response = await self.async_client.get(f"/view_course/{self.c1.id}")
+        self.assertContains(response, "View all Your submissions")
+        self.assertNotContains(response, "Create an Announcement")
+        # students that are not enrolled get the failure page
+        await self.async_client.aforce_login(self.u3)
+        response = await self.async_client.get(f"/view_course/{self.c1.id}")
+        self.assertContains(response, "Sorry, you don&#x27;t have the permission to view this course")
+        await self.async_client.alogout()
+        response = await self.async_client.get(f"/view_course/{self.c1.id}")
+        self.assertEqual(response.status_code, 302)
+
+    async def test_view_all(self):
+        await self.async_client.aforce_login(self.u1)
+        response = await self.async_client.get(f"/view/all/announcements/{self.c1.id}")
+        self.assertTemplateUsed(response, "classmanager/view_announcements.html")
+        self.assertContains(response, "Welcome to class")
+        response = await self.async_client.get(f"/view/all/assignments/{self.c1.id}")
+        self.assertContains(response, "Lab report")
+        response = await self.async_client.get(f"/view/all/quizzes/{self.c1.id}")
+        self.assertTemplateUsed(response, "classmanager/failure.html")
+
+    async def test_view_finals(self):
+        await self.async_client.aforce_login(self.u2)
+        response = await self.async_client.get(f"/view/final/{self.c1.id}")
+        self.assertContains(response, "&#x27;Joe Charles&#x27; scored 88%")
+        await self.async_client.aforce_login(self.u1)
+        response = await self.async_client.get(f"/view/final/{self.c1.id}")
+        self.assertContains(response, "Your grade for Physics 1 is 88/100!")
+
+    async def test_view_my_profile(self):
+        await self.async_client.aforce_login(self.u2)
+        response = await self.async_client.get("/view/my_profile")
+        self.assertEqual(response.context["courses"], 2)
+        self.assertEqual(response.context["instructor"].department, "Science")
+        await self.async_client.aforce_login(self.u1)
+        response = await self.async_client.get("/view/my_profile")
+        self.assertEqual(response.context["student"].major, "Math")
+
+
+class PerformanceMiddlewareTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        setup_objects()
+
+    def setUp(self):
+        self.u1, self.u2, self.u3 = get_users()
+        self.c1 = Course.objects.get(id=1)
+        self.client.login(username=self.u2.username, password="123")
+
+    @override_settings(PERFORMANCE_SAMPLE_RATE=1)
+    def test_sampled_request(self):
+        with self.assertLogs("classmanager.performance", "INFO") as logs, \
+                CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f"/view/attendance/{self.c1.id}")
+        timing = {metric.split(";")[0]: metric for metric in response["Server-Timing"].split(", ")}
+        self.assertEqual(set(timing), {"db", "template", "app", "total"})
+        self.assertIn(f'desc="{len(queries)} queries"', timing["db"])
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line["url_name"], "view-attendance")
+        self.assertEqual(line["status"], 200)
+        self.assertEqual(line["queries"], len(queries))
+        self.assertGreater(line["template_ms"], 0)
+        self.assertGreaterEqual(line["total_ms"], line["db_ms"] + line["template_ms"])
+
+    @override_settings(PERFORMANCE_SAMPLE_RATE=0)
+    def test_unsampled_request(self):
+        response = self.client.get(f"/view/attendance/{self.c1.id}")
+        self.assertNotIn("Server-Timing", response)
+
+
+class ProfilingMiddlewareTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        setup_objects()
+
+    def setUp(self):
+        self.u1, self.u2, self.u3 = get_users()
+        self.c1 = Course.objects.get(id=1)
+        self.client.login(username=self.u2.username, password="123")
+
+    def test_staff_request_profiled(self):
+        User.objects.filter(pk=self.u2.pk).update(is_staff=True)
+        with TemporaryDirectory() as directory, override_settings(PROFILE_DIR=directory):
+            response = self.client.get(f"/view/attendance/{self.c1.id}", HTTP_X_PROFILE="all")
+            self.assertEqual(response.status_code, 200)
+            path = os.path.join(directory, response["X-Profile"])
+            self.assertTrue(response["X-Profile"].startswith("view-attendance/"))
+            self.assertTrue(os.path.exists(f"{path}.pstats"))
+            self.assertTrue(os.path.exists(f"{path}.allocations"))
+            with open(f"{path}.json") as file:
+                metadata = json.load(file)
+            self.assertEqual(metadata["user"], self.u2.username)
+            self.assertGreater(metadata["peak_bytes"], 0)
+            # only the requested profiler runs
+            response = self.client.get(f"/view/attendance/{self.c1.id}?profile=cpu")
+            path = os.path.join(directory, response["X-Profile"])
+            self.assertTrue(os.path.exists(f"{path}.pstats"))
+            self.assertFalse(os.path.exists(f"{path}.allocations"))
+
+    def test_only_staff_profiled(self):
+        with TemporaryDirectory() as directory, override_settings(PROFILE_DIR=directory):
+            response = self.client.get(f"/view/attendance/{self.c1.id}", HTTP_X_PROFILE="all")
+            self.assertNotIn("X-Profile", response)
+            self.assertEqual(os.listdir(directory), [])
+
+    def test_async_chain_stays_async(self):
+        async def view(request):
+            pass
+
+        self.assertTrue(iscoroutinefunction(profiling_middleware(view)))
+
+    @override_settings(ROOT_URLCONF="classmanager.tests.async_urls")
+    async def test_async_request_profiled(self):
+        await User.objects.filter(pk=self.u2.pk).aupdate(is_staff=True)
+        await self.async_client.aforce_login(self.u2)
+        with TemporaryDirectory() as directory, override_settings(PROFILE_DIR=directory):
+            response = await self.async_client.get(f"/view_course/{self.c1.id}", headers={"X-Profile": "cpu"})
+            self.assertContains(response, "Create an Announcement")
+            self.assertTrue(os.path.exists(os.path.join(directory, f"{response['X-Profile']}.pstats")))
+            response = await self.async_client.get(f"/view_course/{self.c1.id}")
+            self.assertNotIn("X-Profile", response)
+
+
+class EnrollmentTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        setup_objects()
+        create_students()
+
+    def setUp(self):
+        self.u1, self.u2, self.u3 = get_users()
+        self.c1 = Course.objects.get(id=1)
+        Course.objects.filter(pk=self.c1.pk).update(capacity=1)
+
+    def join(self, user):
+        self.client.login(username=user.username, password="123")
+        return self.client.post(f"/join_course/{self.c1.id}")
+
+    def test_join_full_course_and_promotion(self):
+        self.assertContains(self.join(self.u1), "You have successfully joined this course!")
+        self.assertContains(self.join(self.u1), "Sorry, You cannot join the same course twice")
+        # the only seat is taken
+        self.assertContains(self.join(self.u3), "This course is full, you are number 1 on its waitlist")
+        self.assertContains(self.join(self.u3), "Sorry, you are already on the waitlist of this course")
+        self.assertContains(self.client.get(f"/join_course/{self.c1.id}"), "0 of 1 seats left")
+        self.assertEqual(Course.objects.get(pk=self.c1.pk).enrolled_count, 1)
+        # leaving gives the seat to the first student of the waitlist
+        self.client.login(username=self.u1.username, password="123")
+        self.client.post(f"/leave_course/{self.c1.id}")
+        self.assertEqual(list(Enrollment.objects.filter(course=self.c1).values_list("student", flat=True)),
+                         [self.u3.pk])
+        self.assertFalse(WaitlistEntry.objects.exists())
+        self.assertEqual(Course.objects.get(pk=self.c1.pk).enrolled_count, 1)
+
+    def test_waitlisted_student_joins_free_seat(self):
+        self.join(self.u1)
+        self.join(self.u3)
+        Course.objects.filter(pk=self.c1.pk).update(capacity=2)
+        self.assertContains(self.join(self.u3), "You have successfully joined this course!")
+        self.assertFalse(WaitlistEntry.objects.exists())
+        # an entry left for an enrolled student is skipped, its seat stays free
+        WaitlistEntry.objects.create(course=self.c1, student_id=self.u3.pk)
+        self.client.login(username=self.u1.username, password="123")
+        self.client.post(f"/leave_course/{self.c1.id}")
+        self.assertEqual(list(Enrollment.objects.filter(course=self.c1).values_list("student", flat=True)),
+                         [self.u3.pk])
+        self.assertFalse(WaitlistEntry.objects.exists())
+        self.assertEqual(Course.objects.get(pk=self.c1.pk).enrolled_count, 1)
+
+    def test_deleted_student_frees_seat(self):
+        self.join(self.u1)
+        self.join(self.u3)
+        assignment = Assignment.objects.create(course=self.c1, title="Essay", points=10)
+        Submission.objects.create(assignment=assignment, student_id=self.u1.pk, text="Answer")
+        User.objects.get(pk=self.u1.pk).delete()
+        # the seat goes to the waitlist and the submission isn't counted anymore
+        self.assertEqual(list(Enrollment.objects.filter(course=self.c1).values_list("student", flat=True)),
+                         [self.u3.pk])
+        course = Course.objects.get(pk=self.c1.pk)
+        self.assertEqual((course.enrolled_count, course.ungraded_count), (1, 0))
+        self.assertFalse(counters.drifted(Course.objects.all(), counters.course_counts()).exists())
+
+    def test_seat_freed_without_waitlist(self):
+        self.join(self.u1)
+        self.client.post(f"/leave_course/{self.c1.id}")
+        self.assertEqual(Course.objects.get(pk=self.c1.pk).enrolled_count, 0)
+        self.assertContains(self.join(self.u3), "You have successfully joined this course!")
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        setup_objects()
+        create_students()
+
+    def setUp(self):
+        self.u1, self.u2, self.u3 = get_users()
+        self.c1 = Course.objects.get(id=1)
+        Enrollment.objects.create(course=self.c1, student_id=self.u1.pk)
+
+    def test_counters_follow_writes(self):
+        self.client.login(username=self.u2.username, password="123")
+        self.assertEqual(Instructor.objects.get(pk=self.u2.pk).course_count, 2)
+        self.client.post("/create/course", {"name": "Optics", "department": "Science", "description": "",
+                                            "length": 10, "credits": 3})
+        self.assertEqual(Instructor.objects.get(pk=self.u2.pk).course_count, 3)
+        self.client.post(f"/create/announcement/{self.c1.id}", {"text": "Welcome"})
+        self.client.post(f"/create/assignment/{self.c1.id}", {"title": "Essay", "description": "",
+                                                              "due_date": "2030-01-01", "points": 10})
+        assignment = Assignment.objects.get(course=self.c1)
+        self.client.login(username=self.u1.username, password="123")
+        self.client.post(f"/create/submission/{self.c1.id}/{assignment.id}", {"text": "Answer"})
+        course = Course.objects.get(pk=self.c1.pk)
+        self.assertEqual((course.announcement_count, course.assignment_count, course.ungraded_count), (1, 1, 1))
+        # grading counts a submission once, however many times its score changes
+        submission = Submission.objects.get(assignment=assignment)
+        self.client.login(username=self.u2.username, password="123")
+        for score in (5, 8):
+            self.client.post(f"/grade/submission/{submission.id}", {"score": score})
+        self.assertEqual(Course.objects.get(pk=self.c1.pk).ungraded_count, 0)
+        self.assertTrue(Submission.objects.get(pk=submission.pk).is_graded)
+        # ungraded submissions of a student leaving the course aren't counted anymore
+        Submission.objects.create(assignment=assignment, student_id=self.u1.pk, text="Another answer")
+        self.assertEqual(Course.objects.get(pk=self.c1.pk).ungraded_count, 1)
+        self.client.login(username=self.u1.username, password="123")
+        self.client.post(f"/leave_course/{self.c1.id}")
+        self.assertEqual(Course.objects.get(pk=self.c1.pk).ungraded_count, 0)
+        Assignment.objects.filter(pk=assignment.pk).delete()
+        self.assertEqual(Course.objects.get(pk=self.c1.pk).assignment_count, 0)
+
+    def test_cascades_skip_counters(self):
+        assignments = [Assignment.objects.create(course=self.c1, title=title, points=10) for title in ("A", "B")]
+        for assignment in assignments:
+            for _ in range(3):
+                Submission.objects.create(assignment=assignment, student_id=self.u1.pk, text="Answer")
+        self.assertEqual(Course.objects.get(pk=self.c1.pk).ungraded_count, 6)
+        # deleting an assignment recounts its course once
+        with CaptureQueriesContext(connection) as queries:
+            assignments[0].delete()
+        course_updates = [query for query in queries if query["sql"].startswith('UPDATE "classmanager_course"')]
+        self.assertEqual(len(course_updates), 2)
+        self.assertEqual(Course.objects.get(pk=self.c1.pk).ungraded_count, 3)
+        with CaptureQueriesContext(connection) as queries:
+            Course.objects.filter(pk=self.c1.pk).delete()
+        self.assertFalse([query for query in queries if query["sql"].startswith('UPDATE "classmanager_course"')])
+
+    def test_profile_uses_counter(self):
+        Instructor.objects.filter(pk=self.u2.pk).update(course_count=2)
+        self.client.login(username=self.u2.username, password="123")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/view/my_profile")
+        self.assertContains(response, "<strong>Courses taught:</strong> 2")
+        self.assertFalse(any("classmanager_course" in query["sql"] for query in queries))
+
+
+class GradingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        setup_objects()
+        create_students()
+
+    def setUp(self):
+        self.u1, self.u2, self.u3 = get_users()
+        self.c1 = Course.objects.get(id=1)
+        for user in (self.u1, self.u3):
+            Enrollment.objects.create(course=self.c1, student_id=user.pk)
+        a1 = Assignment.objects.create(course=self.c1, title="Essay", description="", points=10)
+        a2 = Assignment.objects.create(course=self.c1, title="Lab", description="", points=30)
+        # the best submission of an assignment counts, capped at the assignment's points
+        for assignment, user, score in ((a1, self.u1, 8), (a1, self.u1, 12), (a2, self.u1, 20), (a1, self.u3, 5)):
+            Submission.objects.create(assignment=assignment, student_id=user.pk, text="", score=score)
+        for user, week in ((self.u1, 1), (self.u1, 2), (self.u3, 1)):
+            Attendance.objects.create(course=self.c1, student_id=user.pk, week=week)
+        self.client.login(username=self.u2.username, password="123")
+
+    def compute(self, **policy):
+        data = {"assignment_weight": 80, "attendance_weight": 20, "a_cutoff": 90, "b_cutoff": 80, "c_cutoff": 70,
+                "d_cutoff": 60}
+        return self.client.post(f"/grade/final/{self.c1.id}/compute", {**data, **policy})
+
+    def grades(self):
+        return {(grade.student_id, grade.score, grade.letter) for grade in Grade.objects.filter(course=self.c1)}
+
+    def test_compute_final_grades(self):
+        response = self.compute()
+        self.assertContains(response, "Computed 2 final grades")
+        # 80% of 30/40 points and 20% of 2/2 weeks, 80% of 5/40 points and 20% of 1/2 weeks
+        self.assertEqual(self.grades(), {(self.u1.pk, 80, "B"), (self.u3.pk, 20, "F")})
+        self.assertEqual(Student.objects.get(pk=self.u1.pk).credits, 34)
+        # computing again updates the grades in place and doesn't give the credits twice
+        self.compute(a_cutoff=80, b_cutoff=70, c_cutoff=60, d_cutoff=50)
+        self.assertEqual(self.grades(), {(self.u1.pk, 80, "A"), (self.u3.pk, 20, "F")})
+        self.assertEqual(Student.objects.get(pk=self.u1.pk).credits, 34)
+        self.assertEqual(GradingPolicy.objects.get(course=self.c1).a_cutoff, 80)
+
+    def test_invalid_policy(self):
+        for policy in ({"assignment_weight": 70}, {"b_cutoff": 95}):
+            response = self.compute(**policy)
+            self.assertTemplateUsed(response, "classmanager/compute_finals.html")
+            self.assertIn("failure_message", response.context)
+        self.assertFalse(Grade.objects.exists())
+        self.assertFalse(GradingPolicy.objects.exists())
+
+    def test_missing_part_gives_its_weight(self):
+        Attendance.objects.all().delete()
+        self.compute()
+        self.assertEqual(self.grades(), {(self.u1.pk, 75, "C"), (self.u3.pk, 12, "F")})
+
+    def test_manual_grade_gets_letter(self):
+        self.client.post(f"/grade/final/{self.c1.id}/{self.u1.pk}", {"score": 91})
+        self.assertEqual(self.grades(), {(self.u1.pk, 91, "A")})
+        response = self.client.get(f"/view/final/{self.c1.id}")
+        self.assertContains(response, "scored 91% (A)")
+
+
+
+class CourseProgressTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        setup_objects()
+        create_students()
+
+    def setUp(self):
+        self.u1, self.u2, self.u3 = get_users()
+        self.c1 = Course.objects.get(id=1)
+        for user in (self.u1, self.u3):
+            self.login(user)
+            self.client.post(f"/join_course/{self.c1.id}")
+
+    def login(self, user):
+        self.client.login(username=user.username, password="123")
+
+    def progress(self, user):
+        return CourseProgress.objects.filter(course=self.c1, student=user.pk).values_list(
+            "points_earned", "points_possible", "submission_count", "attendance_count").first()
+
+    def test_writes_add_to_progress(self):
+        self.login(self.u2)
+        for title, points in (("Essay", 10), ("Lab", 30)):
+            self.client.post(f"/create/assignment/{self.c1.id}", {"title": title, "description": "",
+                                                                  "due_date": "2030-01-01", "points": points})
+        essay = Assignment.objects.get(title="Essay")
+        self.login(self.u1)
+        for _ in range(2):
+            self.client.post(f"/create/submission/{self.c1.id}/{essay.id}", {"text": "Answer"})
+        self.assertEqual(self.progress(self.u1), (0, 40, 2, 0))
+        # the best submission counts, capped at the assignment's points
+        first, second = Submission.objects.filter(assignment=essay).order_by("id")
+        self.login(self.u2)
+        for submission, score in ((first, 6), (second, 4), (second, 15), (first, 3)):
+            self.client.post(f"/grade/submission/{submission.id}", {"score": score})
+        self.assertEqual(self.progress(self.u1), (10, 40, 2, 0))
+        # taking the same attendance twice counts it once
+        for _ in range(2):
+            self.client.post(f"/create/attendance/{self.c1.id}", {"week": 1, str(self.u1.pk): "on"})
+        self.assertEqual(self.progress(self.u1), (10, 40, 2, 1))
+        self.assertEqual(self.progress(self.u3), (0, 40, 0, 0))
+        Submission.objects.filter(pk=second.pk).delete()
+        self.assertEqual(self.progress(self.u1), (3, 40, 1, 1))
+        Assignment.objects.filter(pk=essay.pk).delete()
+        self.assertEqual(self.progress(self.u1), (0, 30, 0, 1))
+        call_command("rebuild_progress", "--check", stdout=StringIO())
+        # leaving the course removes the progress
+        self.login(self.u1)
+        self.client.post(f"/leave_course/{self.c1.id}")
+        self.assertIsNone(self.progress(self.u1))
+
+    def test_cascades_skip_progress(self):
+        for week in (1, 2, 3):
+            Attendance.objects.create(course=self.c1, student_id=self.u1.pk, week=week)
+        # leaving deletes the progress once instead of updating it for every removed record
+        self.login(self.u1)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(f"/leave_course/{self.c1.id}")
+        progress_queries = [query["sql"] for query in queries if "classmanager_courseprogress" in query["sql"]]
+        self.assertEqual(len(progress_queries), 1)
+        self.assertIsNone(self.progress(self.u1))
+        with CaptureQueriesContext(connection) as queries:
+            Course.objects.filter(pk=self.c1.pk).delete()
+        self.assertFalse([query for query in queries
+                          if query["sql"].startswith('UPDATE "classmanager_courseprogress"')])
+        self.assertFalse(CourseProgress.objects.exists())
+
+    def test_pages_read_progress(self):
+        assignment = Assignment.objects.create(course=self.c1, title="Essay", description="", points=20)
+        Submission.objects.create(assignment=assignment, student_id=self.u1.pk, text="", score=15)
+        self.login(self.u1)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/view_joined_courses")
+        self.assertContains(response, "<strong>Points earned:</strong> 15/20")
+        self.assertContains(response, "(75%)")
+        self.assertFalse(any("classmanager_submission" in query["sql"] for query in queries))
+        self.login(self.u2)
+        response = self.client.get(f"/grade/final/{self.c1.id}")
+        self.assertContains(response, "Points: 15/20")
+        self.assertContains(response, "Points: 0/20")
+
+
+class BatchGradingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        setup_objects()
+        create_students()
+
+    def setUp(self):
+        self.u1, self.u2, self.u3 = get_users()
+        self.c1 = Course.objects.get(id=1)
+        for user in (self.u1, self.u3):
+            enrollment.join(self.c1.id, user.pk)
+        self.assignment = Assignment.objects.create(course=self.c1, title="Essay", description="", points=10)
+        self.s1, self.s2, self.s3 = [Submission.objects.create(assignment=self.assignment, student_id=user.pk,
+                                                               text=f"Answer {i}")
+                                     for i, user in enumerate((self.u1, self.u3, self.u3))]
+        self.url = f"/grade/submissions/{self.c1.id}/{self.assignment.id}"
+        self.client.login(username=self.u2.username, password="123")
+
+    def scores(self):
+        return list(Submission.objects.order_by("id").values_list("score", "is_graded"))
+
+    def earned(self):
+        return list(CourseProgress.objects.filter(course=self.c1).order_by("student")
+                    .values_list("points_earned", flat=True))
+
+    def test_grade_all(self):
+        response = self.client.get(self.url)
+        self.assertContains(response, "Answer 2")
+        self.assertContains(response, f'name="score-{self.s3.id}"')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, {f"score-{self.s1.id}": "7", f"score-{self.s2.id}": "4",
+                                                   f"score-{self.s3.id}": "12"})
+        self.assertContains(response, "Sorry, no score has been saved, please correct the 1 invalid score")
+        self.assertContains(response, "The score must be a whole number between 1 and 10")
+        self.assertEqual(self.scores(), [(0, False)] * 3)
+        self.assertEqual(len([query for query in queries if query["sql"].startswith("UPDATE")]), 0)
+        response = self.client.post(self.url, {f"score-{self.s1.id}": "7", f"score-{self.s2.id}": "4",
+                                               f"score-{self.s3.id}": "9"})
+        self.assertContains(response, "Saved the scores of 3 submissions")
+        self.assertEqual(self.scores(), [(7, True), (4, True), (9, True)])
+        self.assertEqual(Course.objects.get(pk=self.c1.pk).ungraded_count, 0)
+        self.assertEqual(self.earned(), [7, 9])
+        # blank and unchanged scores are left alone
+        response = self.client.post(self.url, {f"score-{self.s1.id}": "7", f"score-{self.s2.id}": "",
+                                               f"score-{self.s3.id}": "2"})
+        self.assertContains(response, "Saved the scores of 1 submission")
+        self.assertEqual(self.scores(), [(7, True), (4, True), (2, True)])
+        self.assertEqual(self.earned(), [7, 4])
+
+    def test_query_count_is_constant(self):
+        def grade(score):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.post(self.url, {f"score-{submission.id}": score for submission in
+                                            Submission.objects.filter(assignment=self.assignment)})
+            return len(queries)
+
+        few = grade("5")
+        for i in range(20):
+            Submission.objects.create(assignment=self.assignment, student_id=self.u1.pk, text=f"Answer {i}")
+        self.assertEqual(grade("6"), few)
+
+    def test_students_cannot_grade(self):
+        self.client.login(username=self.u1.username, password="123")
+        self.client.post(self.url, {f"score-{self.s1.id}": "10"})
+        self.assertEqual(self.scores()[0], (0, False))
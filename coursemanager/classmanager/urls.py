@@ -1,6 +1,10 @@
+from django.conf import settings
 from django.urls import path
 
-from . import views
+from . import api, async_views, metrics, views
+
+# read-heavy views that have an async version, used when served over ASGI
+read_views = async_views if settings.ASYNC_VIEWS else views
 
 urlpatterns = [
     path("", views.index, name="index"),
@@ -11,8 +15,9 @@ urlpatterns = [
     path("register/user", views.register_user, name="register-user"),
     path("register/<str:role>", views.register_role, name="register-role"),
     path("create/course", views.create_course, name="create-course"),
-    path("view_all_courses", views.view_all_courses, name="view-all-courses"),
-    path("view_course/<int:course_id>", views.view_course, name="view-course"),
+    path("view_all_courses", read_views.view_all_courses, name="view-all-courses"),
+    path("search_courses", views.search_courses, name="search-courses"),
+    path("view_course/<int:course_id>", read_views.view_course, name="view-course"),
     path("join_course/<int:course_id>", views.join_course, name="join-course"),
     path("leave_course/<int:course_id>", views.leave_course, name="leave-course"),
     path("view_joined_courses", views.view_joined_courses, name="view-joined-courses"),
@@ -22,15 +27,28 @@ urlpatterns = [
     path("create/submission/<int:course_id>/<int:assignment_id>", views.create_submission, name="create-submission"),
     path("create/attendance/<int:course_id>", views.create_attendance, name="create-attendance"),
     path("view/attendance/<int:course_id>", views.view_attendance, name="view-attendance"),
-    path("view/all/<str:activity>/<int:course_id>", views.view_all, name="view-all"),
+    path("view/all/<str:activity>/<int:course_id>", read_views.view_all, name="view-all"),
     path("view/submissions/<int:course_id>/<int:assignment_id>", views.view_submissions, name="view-submissions"),
     path("view/submissions/<int:course_id>", views.view_all_submissions, name="view-all-submissions"),
+    path("grade/submissions/<int:course_id>/<int:assignment_id>", views.grade_submissions,
+         name="grade-submissions"),
+    path("view/gradebook/<int:course_id>", views.view_gradebook, name="view-gradebook"),
+    path("export/<str:dataset>/<int:course_id>", views.export_course_data, name="export-data"),
     path("grade/submission/<int:submission_id>", views.grade_submission, name="grade-submission"),
     path("deactivate/course/<int:course_id>", views.deactivate_course, name="deactivate-course"),
     path("grade/final/<int:course_id>", views.grade_finals, name="grade-finals"),
     path("grade/final/<int:course_id>/<int:user_id>", views.grade_final, name="grade-final"),
-    path("view/final/<int:course_id>", views.view_finals, name="view-finals"),
-    path("view/my_profile", views.view_my_profile, name="view-my-profile"),
+    path("grade/final/<int:course_id>/compute", views.compute_finals, name="compute-finals"),
+    path("view/final/<int:course_id>", read_views.view_finals, name="view-finals"),
+    path("import/roster", views.upload_roster, name="import-roster"),
+    path("view/my_profile", read_views.view_my_profile, name="view-my-profile"),
     path("change/name", views.change_name, name="change-name"),
-    path("contact_us", views.contact_us, name="contact_us")
+    path("contact_us", views.contact_us, name="contact_us"),
+    # read-only JSON API
+    path("api/courses", api.courses, name="api-courses"),
+    path("api/courses/<int:course_id>", api.course, name="api-course"),
+    path("api/courses/<int:course_id>/assignments", api.assignments, name="api-assignments"),
+    path("api/courses/<int:course_id>/announcements", api.announcements, name="api-announcements"),
+    path("api/courses/<int:course_id>/grades", api.grades, name="api-grades"),
+    path("metrics", metrics.metrics, name="metrics")
 ]
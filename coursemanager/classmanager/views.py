@@ -1,15 +1,32 @@
+import csv
+import json
+import time
+from io import TextIOWrapper
+
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import AuthenticationForm
-from django.db import IntegrityError
-from django.http import HttpResponseRedirect
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q
+from django.http import HttpResponseRedirect, StreamingHttpResponse
 from django.shortcuts import render
+from django.template.defaultfilters import pluralize
+from django.template.loader import render_to_string
 from django.urls import reverse
+from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 
+from . import counters, course_cache, enrollment, exports, grading, progress, roster, search
+from .access import course_access, instructor_check
+from .db import retry_on_busy
 from .forms import StudentRegisterForm, InstructorRegisterForm, CourseCreationForm, \
-    AnnouncementCreationForm, AssignmentCreationForm, SubmissionForm
+    AnnouncementCreationForm, AssignmentCreationForm, SubmissionForm, GradingPolicyForm
+from .gradebook import build_gradebook
 from .models import User, Student, Instructor, Course, Enrollment, \
-    Announcement, Assignment, Submission, Attendance, Grade
+    Announcement, Assignment, Submission, Attendance, Grade, CourseProgress
+from .routers import reporting_database
+
+# number of courses shown on each page of the course catalog
+COURSES_PER_PAGE = 20
 
 
 def index(request):
@@ -185,7 +202,9 @@ def create_course(request):
         if course_form.is_valid() and request.user.is_instructor:
             new_course = course_form.save(commit=False)
             new_course.instructor = Instructor.objects.get(pk=request.user)
-            new_course.save()
+            # the instructor's course count changes in the same transaction
+            with transaction.atomic():
+                new_course.save()
             context["success_message"] = "Course Created Successfully"
             return render(request, "classmanager/index.html", context)
         else:
@@ -200,51 +219,55 @@ def create_course(request):
 
 
 def view_all_courses(request):
-    # return all active courses
-    courses = Course.objects.filter(is_active=True).order_by("name")
-    return render(request, "classmanager/view_courses.html", {
-        "courses": courses,
+    # return a page of active courses, optionally filtered by department and credits
+    department, credits, cursor = catalog_filters(request.GET)
+    courses = list(catalog_page(department, credits, cursor))
+    facets = list(facet_rows())
+    return render(request, "classmanager/view_courses.html",
+                  catalog_context(request, courses, facets, department, credits, cursor))
+
+
+def search_courses(request):
+    # full-text search over active courses
+    query = request.GET.get("q", "").strip()
+    return render(request, "classmanager/search_courses.html", {
+        "query": query,
+        "results": search.search_courses(query) if query else []
     })
 
 
 @login_required
+@retry_on_busy
+@course_access("join a course", instructor=False, enrolled=False)
 def join_course(request, course_id):
     context = {}
-    # check if student is permitted
-    if not (student_check(request, course_id, "join a course", context)):
-        return render(request, "classmanager/failure.html", context)
+    course, student = request.access.course, request.access.student
+    context["course"] = course
     if request.method == "POST":
-        course = Course.objects.get(pk=course_id)
-        student = Student.objects.get(pk=request.user)
-        context["course"] = course
-        # check if user is already enrolled in that specific course
-        if len(Enrollment.objects.filter(course=course, student=student)) != 0:
+        # takes a seat if one is free, else adds the student to the waitlist
+        result = enrollment.join(course.id, student.pk)
+        if result == enrollment.ENROLLED:
+            context["success_message"] = "You have successfully joined this course!"
+        elif result == enrollment.WAITLISTED:
+            context["success_message"] = f"This course is full, you are number " \
+                                         f"{enrollment.waitlist_position(course.id, student.pk)} on its waitlist"
+        elif result == enrollment.ALREADY_WAITLISTED:
+            context["failure_message"] = "Sorry, you are already on the waitlist of this course"
+        else:
             context["failure_message"] = "Sorry, You cannot join the same course twice"
-            return render(request, "classmanager/join_course.html", context)
-        new_enrollment = Enrollment(course=course, student=student)
-        new_enrollment.save()
-        context["success_message"] = "You have successfully joined this course!"
+        course.refresh_from_db(fields=["enrolled_count"])
         return render(request, "classmanager/join_course.html", context)
     else:
-        course = Course.objects.get(pk=course_id)
-        context["course"] = course
+        context["waitlist_position"] = enrollment.waitlist_position(course.id, student.pk)
         return render(request, "classmanager/join_course.html", context)
 
 
 @login_required
+@retry_on_busy
+@course_access("leave a course", instructor=False)
 def leave_course(request, course_id):
     context = {}
-    # check if student is permitted
-    if not (student_check(request, course_id, "leave a course", context)):
-        return render(request, "classmanager/failure.html", context)
-
-    course = Course.objects.get(pk=course_id)
-    student = Student.objects.get(pk=request.user)
-    # check if user is  enrolled in that specific course
-    if len(Enrollment.objects.filter(course=course, student=student)) != 1:
-        context["failure_message"] = "Sorry, you are not enrolled in this course so you can't leave"
-        return render(request, "classmanager/failure.html", context)
-
+    course = request.access.course
     # check if course is active
     if not course.is_active:
         context["failure_message"] = "Sorry, you cannot leave a course that has ended"
@@ -252,7 +275,7 @@ def leave_course(request, course_id):
     context["course"] = course
     if request.method == "POST":
         # delete all records related to this user in the course
-        delete_records(request, course_id)
+        delete_records(request.access)
         context["success_message"] = "You have successfully left a course!"
         return render(request, "classmanager/leave_course.html", context)
     else:
@@ -263,11 +286,8 @@ def leave_course(request, course_id):
 def view_joined_courses(request):
     if request.user.is_student:
         # if the user is a student, return a template with the joined courses in the context
-        student = Student.objects.get(pk=request.user)
-        course_keys = Enrollment.objects.filter(student=student)
-        courses = []
-        for key in course_keys:
-            courses.append(Course.objects.get(pk=key.course.id))
+        # with the student's progress in each course
+        courses = CourseProgress.objects.filter(student=request.user.pk).select_related("course__instructor__user")
         return render(request, "classmanager/joined_courses.html", {
             "courses": courses
         })
@@ -280,7 +300,8 @@ def view_joined_courses(request):
 def view_created_courses(request):
     if request.user.is_instructor:
         instructor = Instructor.objects.get(pk=request.user)
-        courses = Course.objects.filter(instructor=instructor).order_by("-date_created")
+        courses = Course.objects.filter(instructor=instructor).select_related("instructor__user")\
+            .order_by("-date_created")
         return render(request, "classmanager/created_courses.html", {
             "courses": courses
         })
@@ -290,51 +311,33 @@ def view_created_courses(request):
 
 
 @login_required
+@course_access("view this course")
 def view_course(request, course_id):
-    # check if course is valid
-    try:
-        course = Course.objects.get(pk=course_id)
-    except Course.DoesNotExist:
-        return render(request, "classmanager/failure.html", {
-            "failure_message": "Sorry, the course you wanted does not exist or was deleted"
-        })
-    # check if user has permissions
-    if request.user.is_student:
-        # check if student is enrolled in the course
-        student = Student.objects.get(pk=request.user)
-        if len(Enrollment.objects.filter(course=course_id, student=student)) == 0:
-            return render(request, "classmanager/failure.html", {
-                "failure_message": "Sorry, you need to join a course in order to view it"
-            })
-    elif request.user.is_instructor:
-        # check if instructor is the creator of the course
-        instructor = Instructor.objects.get(pk=request.user)
-        if course.instructor != instructor:
-            return render(request, "classmanager/failure.html", {
-                "failure_message": "Sorry, you need to create a course in order to view it"
-            })
-    else:
-        return render(request, "classmanager/failure.html", {
-            "failure_message": "Sorry, you need to join a course as a student or create it as an instructor in order "
-                               "to view it "
-        })
-    # get announcements, assignments, attendance and submissions.
-    announcements = Announcement.objects.filter(course=course).order_by("-date_created")
-    assignments = Assignment.objects.filter(course=course).order_by("-date_created")
+    course = request.access.course
+    # announcements and assignments are rendered once per version of the course and role of the user
+    role = "instructor" if request.access.instructor else "student"
+    version = course_cache.course_version(course.id)
+    course_content = course_cache.get_content(course.id, role, version)
+    if course_content is None:
+        announcements = Announcement.objects.filter(course=course).order_by("-date_created")
+        assignments = Assignment.objects.filter(course=course).order_by("-date_created")
+        course_content = render_to_string("classmanager/course_content.html", {
+            "course": course,
+            "announcements": announcements,
+            "assignments": assignments
+        }, request)
+        course_cache.set_content(course.id, role, version, course_content)
     return render(request, "classmanager/view_course.html", {
         "course": course,
-        "announcements": announcements,
-        "assignments": assignments
+        "course_content": course_content
     })
 
 
 @login_required
+@course_access("create an announcement", student=False)
 def create_announcement(request, course_id):
-    # check if user is an instructor
     context = {}
-    course = Course.objects.get(pk=course_id)
-    if not instructor_check(request, course_id, "create an announcement", context):
-        return render(request, "classmanager/failure.html", context)
+    course = request.access.course
     context["course"] = course
 
     if request.method == "POST":
@@ -342,7 +345,8 @@ def create_announcement(request, course_id):
         if announcement_form.is_valid():
             new_announcement = announcement_form.save(commit=False)
             new_announcement.course = course
-            new_announcement.save()
+            with transaction.atomic():
+                new_announcement.save()
             context["success_message"] = "Announcement Created Successfully"
         else:
             context["failure_message"] = "Sorry, your announcement cannot be blank, please refresh, " \
@@ -355,19 +359,18 @@ def create_announcement(request, course_id):
 
 
 @login_required
+@course_access("create an assignment", student=False)
 def create_assignment(request, course_id):
-    # check if user is an instructor
     context = {}
-    course = Course.objects.get(pk=course_id)
-    if not instructor_check(request, course_id, "create an assignment", context):
-        return render(request, "classmanager/failure.html", context)
+    course = request.access.course
     context["course"] = course
     if request.method == "POST":
         assignment_form = AssignmentCreationForm(request.POST)
         if assignment_form.is_valid():
             new_assignment = assignment_form.save(commit=False)
             new_assignment.course = course
-            new_assignment.save()
+            with transaction.atomic():
+                new_assignment.save()
             context["success_message"] = "Assignment Created Successfully"
         else:
             context["failure_message"] = "Sorry, your form is not valid, please reload the page and resubmit"
@@ -379,17 +382,18 @@ def create_assignment(request, course_id):
 
 
 @login_required
+@retry_on_busy
+@course_access("create a submission", instructor=False)
 def create_submission(request, course_id, assignment_id):
     context = {}
-    # check if user is a student
-    if not student_check(request, course_id, "create a submission", context):
-        return render(request, "classmanager/failure.html", context)
-
-    course = Course.objects.get(pk=course_id)
+    course, student = request.access.course, request.access.student
     context["course"] = course
-    assignment = Assignment.objects.get(pk=assignment_id)
+    try:
+        assignment = Assignment.objects.get(pk=assignment_id, course=course)
+    except Assignment.DoesNotExist:
+        context["failure_message"] = "The Assignment you are searching for does not exist"
+        return render(request, "classmanager/failure.html", context)
     context["assignment"] = assignment
-    student = Student.objects.get(pk=request.user)
     context["student"] = student
 
     if request.method == "POST":
@@ -398,7 +402,8 @@ def create_submission(request, course_id, assignment_id):
             new_submission = submission_form.save(commit=False)
             new_submission.student = student
             new_submission.assignment = assignment
-            new_submission.save()
+            with transaction.atomic():
+                new_submission.save()
             context["success_message"] = "Assignment submitted successfully!"
             return render(request, "classmanager/create_submission.html", context)
     else:
@@ -408,51 +413,61 @@ def create_submission(request, course_id, assignment_id):
 
 
 @login_required
+@retry_on_busy
+@course_access("create an attendance", student=False)
 def create_attendance(request, course_id):
-    # check if user is an instructor
     context = {}
-    if not instructor_check(request, course_id, "create an attendance", context):
-        return render(request, "classmanager/failure.html", context)
-    course = Course.objects.get(pk=course_id)
+    course = request.access.course
     context["course"] = course
     if request.method == "POST":
         attendance_form = request.POST
-        week = int(attendance_form["week"])
+        try:
+            week = int(attendance_form["week"])
+        except (KeyError, ValueError):
+            week = None
+        if week not in course.weeks():
+            context["failure_message"] = "Sorry, please select a valid week for the attendance"
+            return render(request, "classmanager/failure.html", context)
         student_ids = []
         # iterate over attendance form and check for students that were ticked ('on'). then put those in a list
         for k, v in attendance_form.items():
-            if v == "on":
-                student_ids.append(k)
-        # create and save new attendance for each student in selected week
-        for student_id in student_ids:
-            # only create new attendance if attendance for that student in that week does not exist
-            try:
-                Attendance.objects.get(student=Student.objects.get(pk=student_id), course=course, week=week)
-            except Attendance.DoesNotExist:
-                new_attendance = Attendance(student=Student.objects.get(pk=student_id), course=course, week=week)
-                new_attendance.save()
+            if v == "on" and k.isdigit():
+                student_ids.append(int(k))
+        # only students enrolled in the course can attend it
+        enrolled_ids = Enrollment.objects.filter(course=course, student__in=student_ids)\
+            .values_list("student_id", flat=True)
+        # insert all attendances at once, the unique (student, course, week) constraint skips existing ones
+        with transaction.atomic():
+            attended = set(Attendance.objects.filter(course=course, week=week, student__in=enrolled_ids)
+                           .values_list("student_id", flat=True))
+            new_ids = [student_id for student_id in enrolled_ids if student_id not in attended]
+            Attendance.objects.bulk_create(
+                [Attendance(student_id=student_id, course=course, week=week) for student_id in new_ids],
+                ignore_conflicts=True
+            )
+            # bulk inserts skip the signals adding attendances to the students' progress
+            progress.attended(course.id, new_ids)
         return HttpResponseRedirect(reverse("index"))
     else:
         # get all students enrolled in class and put in a list
-        student_keys = Enrollment.objects.filter(course=course)
-        student_list = []
-        for key in student_keys:
-            student_list.append(Student.objects.get(pk=key.student))
+        student_list = list(Student.objects.filter(enrollment__course=course).select_related("user"))
         if len(student_list) < 1:
             context["failure_message"] = "Sorry you cannot take an attendance for an empty class"
             return render(request, "classmanager/failure.html", context)
         else:
-            context["weeks"] = range(1, course.length)
+            context["weeks"] = course.weeks()
             context["students"] = student_list
             return render(request, "classmanager/create_attendance.html", context)
 
 
 @login_required
+@course_access("view attendance", student=False)
+@reporting_database
 def view_attendance(request, course_id):
     context = {}
-    instructor_check(request, course_id, "view attendance", context)
-    course = Course.objects.get(pk=course_id)
-    attendances = Attendance.objects.filter(course=course).order_by("week")
+    course = request.access.course
+    attendances = Attendance.objects.filter(course=course).select_related("student__user", "course")\
+        .order_by("week")
     # make dictionary that stores lists of attendances based on week
     attendance_dict = {}
     for attendance in attendances:
@@ -468,17 +483,10 @@ def view_attendance(request, course_id):
 
 
 @login_required
+@course_access("view {activity}")
 def view_all(request, activity, course_id):
     context = {}
-    # check if user is an instructor or student with permissions
-    if request.user.is_student:
-        if not (student_check(request, course_id, f"view {activity}", context)):
-            return render(request, "classmanager/failure.html", context)
-    elif request.user.is_instructor:
-        if not (instructor_check(request, course_id, f"view {activity}", context)):
-            return render(request, "classmanager/failure.html", context)
-
-    course = Course.objects.get(pk=course_id)
+    course = request.access.course
     context["course"] = course
     if activity == "announcements":
         announcements = Announcement.objects.filter(course=course).order_by("-date_created")
@@ -495,48 +503,96 @@ def view_all(request, activity, course_id):
 
 
 @login_required
+@course_access("view all submissions", student=False)
 def view_submissions(request, course_id, assignment_id):
     # *instructor only route* (to view all submissions of a specific assignment)
-    # check if user is an instructor
     context = {}
-    if not instructor_check(request, course_id, "view all submissions", context):
-        return render(request, "classmanager/failure.html", context)
-    course = Course.objects.get(pk=course_id)
+    course = request.access.course
     context["course"] = course
     # get assignment record
     try:
-        assignment = Assignment.objects.get(pk=assignment_id)
+        assignment = Assignment.objects.get(pk=assignment_id, course=course)
     except Assignment.DoesNotExist:
         context["failure_message"] = "The Assignment you are searching for does not exist"
         return render(request, "classmanager/failure.html", context)
     else:
         context["assignment"] = assignment
         # get submissions for assignment
-        submissions = Submission.objects.filter(assignment=assignment)
+        submissions = Submission.objects.filter(assignment=assignment).select_related("student__user", "assignment")
         context["submissions"] = submissions
         return render(request, "classmanager/view_submissions.html", context)
 
 
 @login_required
-def view_all_submissions(request, course_id):
-    # *student only route* (to view all their submissions in a course)
+@retry_on_busy
+@course_access("grade submissions", student=False)
+def grade_submissions(request, course_id, assignment_id):
+    # *instructor only route* (to grade every submission of an assignment at once)
     context = {}
-    if not request.user.is_student:
-        context["failure_message"] = "Sorry you cannot access this page"
-        return render(request, "classmanager/failure.html", context)
+    course = request.access.course
+    context["course"] = course
     try:
-        # search for all submissions made by student in that course
-        course = Course.objects.get(pk=course_id)
-        student = Student.objects.get(pk=request.user)
-        submissions = Submission.objects.filter(assignment__course=course, student=student).order_by("-date_submitted")
-    except Course.DoesNotExist or Student.DoesNotExist:
-        context["failure_message"] = "Sorry but records do not exist for this student/course"
+        assignment = Assignment.objects.get(pk=assignment_id, course=course)
+    except Assignment.DoesNotExist:
+        context["failure_message"] = "The Assignment you are searching for does not exist"
         return render(request, "classmanager/failure.html", context)
-    else:
-        context["course"] = course
-        context["student"] = student
-        context["submissions"] = submissions
-        return render(request, "classmanager/view_all_submissions.html", context)
+    context["assignment"] = assignment
+    submissions = list(Submission.objects.filter(assignment=assignment).select_related("student__user")
+                       .order_by("student__user__last_name", "student__user__first_name", "id"))
+    # (submission, score typed in, error) of every submission, graded submissions start with their score
+    rows = [(submission, str(submission.score) if submission.is_graded else "", None) for submission in submissions]
+    if request.method == "POST":
+        rows, graded = [], []
+        for submission in submissions:
+            score = request.POST.get(f"score-{submission.id}", "").strip()
+            error = None
+            if score:
+                try:
+                    value = int(score)
+                except ValueError:
+                    value = None
+                # like grading a single submission, a score is at least 1 point
+                if value is None or not 1 <= value <= assignment.points:
+                    error = f"The score must be a whole number between 1 and {assignment.points}"
+                elif not submission.is_graded or value != submission.score:
+                    graded.append((submission, value))
+            rows.append((submission, score, error))
+        errors = sum(1 for _, _, error in rows if error)
+        if errors:
+            # nothing is saved until every score is valid
+            context["failure_message"] = f"Sorry, no score has been saved, please correct the {errors} invalid " \
+                                         f"score{pluralize(errors)}"
+        elif graded:
+            old_scores = {submission.pk: submission.score for submission, _ in graded}
+            newly_graded = sum(1 for submission, _ in graded if not submission.is_graded)
+            for submission, score in graded:
+                submission.score, submission.is_graded = score, True
+            with transaction.atomic():
+                Submission.objects.bulk_update([submission for submission, _ in graded], ["score", "is_graded"])
+                # like grade_submission, the views that grade update the ungraded count and the students' progress
+                if newly_graded:
+                    counters.graded(course.id, newly_graded)
+                progress.rescored(assignment, old_scores)
+            context["success_message"] = f"Saved the scores of {len(graded)} submission{pluralize(len(graded))}"
+        else:
+            context["success_message"] = "No score has changed"
+    context["rows"] = rows
+    return render(request, "classmanager/grade_submissions.html", context)
+
+
+@login_required
+@course_access("view your submissions", instructor=False)
+def view_all_submissions(request, course_id):
+    # *student only route* (to view all their submissions in a course)
+    context = {}
+    course, student = request.access.course, request.access.student
+    # search for all submissions made by student in that course
+    submissions = Submission.objects.filter(assignment__course=course, student=student)\
+        .select_related("assignment").order_by("-date_submitted")
+    context["course"] = course
+    context["student"] = student
+    context["submissions"] = submissions
+    return render(request, "classmanager/view_all_submissions.html", context)
 
 
 @login_required
@@ -544,56 +600,93 @@ def grade_submission(request, submission_id):
     context = {}
     # check if submission is valid
     try:
-        submission = Submission.objects.get(pk=submission_id)
-        course = Course.objects.get(pk=submission.assignment.course.id)
+        submission = Submission.objects.select_related("assignment__course", "student__user").get(pk=submission_id)
     except Submission.DoesNotExist:
         context["failure_message"] = "The Submission you are trying to grade for does not exist"
         return render(request, "classmanager/failure.html", context)
+    course = submission.assignment.course
     # check if user is an instructor
-    if not instructor_check(request, course.id, "grade a submission", context):
+    if not instructor_check(request, course, "grade a submission", context):
         return render(request, "classmanager/failure.html", context)
 
     context["submission"] = submission
     context["course"] = course
     if request.method == "POST":
         score = request.POST["score"]
+        was_graded, old_score = submission.is_graded, submission.score
         submission.score = score
-        submission.save()
+        submission.is_graded = True
+        with transaction.atomic():
+            submission.save()
+            if not was_graded:
+                counters.graded(course.id)
+            progress.rescored(submission.assignment, {submission.pk: old_score})
         context["success_message"] = "Score updated successfully!"
     return render(request, "classmanager/grade_submission.html", context)
 
 
 @login_required
+@course_access("view the gradebook", student=False)
+@reporting_database
+def view_gradebook(request, course_id):
+    # *instructor only route* (to view every student's score on every assignment of a course)
+    course = request.access.course
+    gradebook = build_gradebook(course)
+    return render(request, "classmanager/view_gradebook.html", {
+        "course": course,
+        "gradebook": gradebook,
+        "rows": gradebook.rows(),
+        "columns": gradebook.columns()
+    })
+
+
+@login_required
+@course_access("export course data", student=False)
+def export_course_data(request, dataset, course_id):
+    # *instructor only route* (streams a course dataset as CSV or NDJSON without loading it in memory)
+    course = request.access.course
+    export_format = request.GET.get("format", "csv")
+    if dataset not in exports.DATASETS or export_format not in ("csv", "ndjson"):
+        return render(request, "classmanager/failure.html", {
+            "failure_message": "Sorry, the export you asked for does not exist"
+        })
+    columns, rows = exports.export_rows(dataset, course)
+    if export_format == "csv":
+        response = StreamingHttpResponse(exports.csv_lines(columns, rows), content_type="text/csv")
+    else:
+        response = StreamingHttpResponse(exports.ndjson_lines(columns, rows), content_type="application/x-ndjson")
+    response["Content-Disposition"] = f'attachment; filename="course-{course.id}-{dataset}.{export_format}"'
+    return response
+
+
+@login_required
+@course_access("give final grades", student=False)
 def grade_finals(request, course_id):
-    # check if user is an instructor
     context = {}
-    if not instructor_check(request, course_id, "give final grades", context):
-        return render(request, "classmanager/failure.html", context)
-    course = Course.objects.get(pk=course_id)
+    course = request.access.course
     context["course"] = course
-    # get all students enrolled in the course and return template
-    enrollments = Enrollment.objects.filter(course=course)
+    # get all students enrolled in the course, with their progress, and return template
+    enrollments = CourseProgress.objects.filter(course=course).select_related("student__user")
     context["enrollments"] = enrollments
     return render(request, "classmanager/grade_finals.html", context)
 
 
 @login_required
+@course_access("give final grades", student=False)
 def grade_final(request, course_id, user_id):
-    # check if user is an instructor
     context = {}
-    if not instructor_check(request, course_id, "give final grades", context):
-        return render(request, "classmanager/failure.html", context)
-    course = Course.objects.get(pk=course_id)
+    course = request.access.course
     context["course"] = course
-    student = Student.objects.get(user=User.objects.get(pk=user_id))
+    student = Student.objects.select_related("user").get(pk=user_id)
     context["student"] = student
     if request.method == "POST":
         # check if grade already exists, if it does, update it, else create one.
         score = request.POST["score"]
+        letter = grading.policy_of(course).letter(int(score))
         try:
             grade = Grade.objects.get(course=course, student=student)
         except Grade.DoesNotExist:
-            new_grade = Grade(student=student, course=course, score=score)
+            new_grade = Grade(student=student, course=course, score=score, letter=letter)
             new_grade.save()
             context["success_message"] = "Grade has been created for student"
             # increase student's standing
@@ -601,52 +694,67 @@ def grade_final(request, course_id, user_id):
             student.save()
         else:
             grade.score = score
+            grade.letter = letter
             grade.save()
             context["success_message"] = "Grade has been updated for student"
     else:
-        attendance = len(Attendance.objects.filter(student=student, course=course))
+        attendance = Attendance.objects.filter(student=student, course=course).count()
         context["attendance"] = attendance
     return render(request, "classmanager/grade_final.html", context)
 
 
 @login_required
-def view_finals(request, course_id):
+@retry_on_busy
+@course_access("give final grades", student=False)
+def compute_finals(request, course_id):
+    # *instructor only route* (to set the grading policy and compute every student's final grade from it)
     context = {}
-    # check if user is valid for this operation
-    if request.user.is_instructor:
-        if not instructor_check(request, course_id, "view final scores", context):
-            return render(request, "classmanager/failure.html", context)
+    course = request.access.course
+    context["course"] = course
+    policy = grading.policy_of(course)
+    if request.method == "POST":
+        policy_form = GradingPolicyForm(request.POST, instance=policy)
+        if policy_form.is_valid():
+            policy_form.save()
+            start = time.perf_counter()
+            count = grading.compute_final_grades(course)
+            context["success_message"] = f"Computed {count} final grades in " \
+                                         f"{(time.perf_counter() - start) * 1000:.0f}ms"
+        else:
+            context["failure_message"] = "Sorry, the grading policy is not valid, please correct it and resubmit"
     else:
-        if not student_check(request, course_id, "view final scores", context):
-            return render(request, "classmanager/failure.html", context)
-    course = Course.objects.get(pk=course_id)
-    if request.user.is_instructor:
-        grades = Grade.objects.filter(course=course)
+        policy_form = GradingPolicyForm(instance=policy)
+    context["policy_form"] = policy_form
+    return render(request, "classmanager/compute_finals.html", context)
+
+
+@login_required
+@course_access("view final scores")
+@reporting_database
+def view_finals(request, course_id):
+    context = {}
+    access = request.access
+    course = access.course
+    if access.instructor:
+        grades = Grade.objects.filter(course=course).select_related("student__user", "course")
         context["grades"] = grades
-    elif request.user.is_student:
-        user = User.objects.get(pk=request.user.id)
-        student = Student.objects.get(user=user)
+    else:
         try:
             # check if student has a grade yet
-            grade = Grade.objects.get(course=course, student=student)
+            grade = Grade.objects.get(course=course, student=access.student)
             context["grade"] = grade
         except Grade.DoesNotExist:
             # else, pass as it would be handled in template
             pass
-    else:
-        # if user doesn't have a role, redirect them to index
-        return HttpResponseRedirect(reverse("index"))
     context["course"] = course
     return render(request, "classmanager/view_finals.html", context)
 
 
 @login_required
+@course_access("deactivate a course", student=False)
 def deactivate_course(request, course_id):
-    # check if user is an instructor
     context = {}
-    if not instructor_check(request, course_id, "deactivate a course", context):
-        return render(request, "classmanager/failure.html", context)
-    course = Course.objects.get(pk=course_id)
+    course = request.access.course
     context["course"] = course
     # deactivate the course if active or send message to user if already deactivated
     if request.method == "POST":
@@ -660,17 +768,53 @@ def deactivate_course(request, course_id):
 
 
 @login_required
+@course_access("delete a course", student=False)
 def delete_course(request, course_id):
-    # check if user is an instructor
     context = {}
-    if not instructor_check(request, course_id, "delete a course", context):
-        return render(request, "classmanager/failure.html", context)
-    course = Course.objects.get(pk=course_id)
-    course.delete()
+    request.access.course.delete()
     context["success_message"] = "Course successfully deleted"
     return render(request, "classmanager/index.html", context)
 
 
+@login_required
+def upload_roster(request):
+    # *instructor and staff route* (creates student accounts from a CSV file and enrolls them)
+    context = {}
+    if not (request.user.is_instructor or request.user.is_staff):
+        context["failure_message"] = "Sorry, you don't have the permission to import a roster"
+        return render(request, "classmanager/failure.html", context)
+    context["columns"] = ", ".join(roster.REQUIRED_COLUMNS + ["password", "major", "standing", "courses"])
+    context["max_rows"] = roster.UPLOAD_MAX_ROWS
+    if request.method == "POST":
+        if "roster" not in request.FILES:
+            context["failure_message"] = "Please choose a CSV file to import"
+            return render(request, "classmanager/import_roster.html", context)
+        # instructors can only enroll students in their own courses
+        # the header and a line per student, a quoted value spanning lines counts more than once
+        if sum(1 for _ in request.FILES["roster"]) > roster.UPLOAD_MAX_ROWS + 1:
+            context["failure_message"] = f"Sorry, rosters of more than {roster.UPLOAD_MAX_ROWS} students can't be " \
+                                         f"uploaded, ask an administrator to import them with manage.py import_roster"
+            return render(request, "classmanager/import_roster.html", context)
+        request.FILES["roster"].seek(0)
+        courses = Course.objects.all() if request.user.is_staff else Course.objects.filter(instructor=request.user.pk)
+        file = TextIOWrapper(request.FILES["roster"].file, encoding="utf-8-sig", newline="")
+        try:
+            # passwords are hashed in the request's process, a web worker doesn't start a process pool
+            result = roster.import_roster(file, courses=courses, processes=1)
+        except (csv.Error, UnicodeDecodeError):
+            # the header couldn't be read, nothing was imported
+            context["failure_message"] = "Sorry, the roster must be a UTF-8 encoded CSV file"
+            return render(request, "classmanager/import_roster.html", context)
+        context["result"] = result
+        if result.unreadable_line:
+            context["failure_message"] = f"Sorry, the roster could not be read from line {result.unreadable_line} " \
+                                         f"on, the rows before it created {result.created} students and " \
+                                         f"{result.enrolled} enrollments"
+        else:
+            context["success_message"] = f"Created {result.created} students and {result.enrolled} enrollments"
+    return render(request, "classmanager/import_roster.html", context)
+
+
 # USER INFO AND STATIC VIEWS
 @login_required
 def view_my_profile(request):
@@ -680,7 +824,7 @@ def view_my_profile(request):
     elif request.user.is_instructor:
         instructor = Instructor.objects.get(user=request.user)
         context["instructor"] = instructor
-        context["courses"] = len(Course.objects.filter(instructor=instructor))
+        context["courses"] = instructor.course_count
     return render(request, "classmanager/view_profile.html", context)
 
 
@@ -694,61 +838,91 @@ def has_account(request):
     return request.user.is_student or request.user.is_instructor
 
 
-# check if user is permitted to perform an instructor action in a specific course
-def instructor_check(request, course_id, action, context):
-    # check if course is valid
+# encode the (name, id) position of a course as an opaque pagination cursor
+def encode_cursor(course):
+    return urlsafe_base64_encode(json.dumps([course.name, course.id]).encode())
+
+
+# decode a pagination cursor, returns None if it is missing or invalid
+def decode_cursor(cursor):
     try:
-        course = Course.objects.get(pk=course_id)
-    except Course.DoesNotExist:
-        context["failure_message"] = "The course you are searching for does not exist"
-        return False
-    else:
-        # check if user is an instructor
-        if not request.user.is_instructor:
-            context["failure_message"] = f"Sorry, you don't have the permission to {action} in this course."
-            return False
-        else:
-            # check if instructor is the instructor of the course
-            course_instructor = course.instructor
-            instructor = Instructor.objects.get(pk=request.user)
-            # return failure message if not course instructor
-            if course_instructor != instructor:
-                context["failure_message"] = f"Sorry, you don't have the permission to {action} in this " \
-                                             "course. "
-                return False
-        return True
-
-
-# check if user is permitted to perform an student action in a specific course
-def student_check(request, course_id, action, context):
-    if not request.user.is_student:
-        context["failure_message"] = f"Sorry, you don't have the permission to {action}"
-        return False
-    else:
-        # if student is joining a course, return true (special case)
-        if action == "join a course":
-            return True
-        # check if student is enrolled in this course
-        course = Course.objects.get(pk=course_id)
-        student = Student.objects.get(pk=request.user)
-        try:
-            Enrollment.objects.get(course=course, student=student)
-        except Enrollment.DoesNotExist:
-            # case where student is not enrolled in the class but tried to access page
-            context["failure_message"] = f"Sorry, you don't have the permission to {action}"
-            return False
-    return True
-
-
-# delete all student records for the user that made the request
-def delete_records(request, course_id):
-    student = Student.objects.get(pk=request.user)
-    course = Course.objects.get(pk=course_id)
-    enrollment = Enrollment.objects.filter(student=student, course=course)
+        name, course_id = json.loads(urlsafe_base64_decode(cursor))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(name, str) or not isinstance(course_id, int):
+        return None
+    return name, course_id
+
+
+# read the department, credits and pagination cursor of a catalog page from the query string
+def catalog_filters(params):
+    credits = params.get("credits", "")
+    return params.get("department", ""), int(credits) if credits.isdigit() else None, \
+        decode_cursor(params.get("after", ""))
+
+
+# queryset of the courses shown on a catalog page, with one extra course to tell if there is a next page
+def catalog_page(department, credits, cursor):
+    courses = Course.objects.filter(is_active=True)
+    if department:
+        courses = courses.filter(department=department)
+    if credits is not None:
+        courses = courses.filter(credits=credits)
+    # keyset pagination on (name, id) so that deep pages seek the name index instead of skipping rows
+    if cursor is not None:
+        name, course_id = cursor
+        courses = courses.filter(Q(name__gte=name) & (Q(name__gt=name) | Q(id__gt=course_id)))
+    return courses.select_related("instructor__user").order_by("name", "id")[:COURSES_PER_PAGE + 1]
+
+
+# template context of a catalog page from its evaluated courses and facet rows
+def catalog_context(request, courses, facets, department, credits, cursor):
+    context = {}
+    if len(courses) > COURSES_PER_PAGE:
+        courses = courses[:COURSES_PER_PAGE]
+        query = request.GET.copy()
+        query["after"] = encode_cursor(courses[-1])
+        context["next_page"] = query.urlencode()
+    if cursor is not None:
+        query = request.GET.copy()
+        del query["after"]
+        context["first_page"] = query.urlencode()
+    context["department_facets"], context["credit_facets"] = course_facets(facets, department, credits)
+    context["department"] = department
+    context["credits"] = credits
+    context["courses"] = courses
+    return context
+
+
+# count active courses per department and per credits in a single aggregate query
+def facet_rows():
+    return Course.objects.filter(is_active=True).values("department", "credits")\
+        .annotate(count=Count("id")).order_by()
+
+
+# fold the aggregate rows into facets, each facet's counts respect the filter selected on the other one
+def course_facets(rows, department, credits):
+    departments, credit_counts = {}, {}
+    for row in rows:
+        if credits is None or row["credits"] == credits:
+            departments[row["department"]] = departments.get(row["department"], 0) + row["count"]
+        if not department or row["department"] == department:
+            credit_counts[row["credits"]] = credit_counts.get(row["credits"], 0) + row["count"]
+    return sorted(departments.items()), sorted(credit_counts.items())
+
+
+# delete all student records for the student and course of a resolved CourseAccess
+def delete_records(access):
+    student, course = access.student, access.course
     submissions = Submission.objects.filter(assignment__course=course, student=student)
     attendances = Attendance.objects.filter(student=student, course=course)
-    for i in (enrollment, submissions, attendances):
-        i.delete()
+    with transaction.atomic():
+        # frees the seat, which goes to the first student of the waitlist. Leaving first deletes the student's
+        # progress, which the deleted records then don't have to update
+        enrollment.leave(course.id, student.pk)
+        with progress.suspended():
+            for i in (submissions, attendances):
+                i.delete()
 
 
 # Common Error Views
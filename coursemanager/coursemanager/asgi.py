@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'coursemanager.settings')
+# route the read-heavy views to their async versions (see settings.ASYNC_VIEWS)
+os.environ.setdefault('CLASSMANAGER_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
@@ -10,18 +10,31 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.1/ref/settings/
 """
 
+import hashlib
 import os.path
+import tempfile
 from pathlib import Path
-from .secret_settings import *
+
+from django.core.management.utils import get_random_secret_key
+
+try:
+    from .secret_settings import *
+except ImportError:
+    # without secret_settings.py the key comes from the environment, or a random one is used and sessions don't
+    # survive a restart
+    SECRET_KEY = os.environ.get('CLASSMANAGER_SECRET_KEY') or get_random_secret_key()
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# temporary files of this checkout, apart from those of other checkouts on the host
+CHECKOUT_TMP_DIR = Path(tempfile.gettempdir()) / f'classmanager-{hashlib.sha1(bytes(BASE_DIR)).hexdigest()[:12]}'
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/3.1/howto/deployment/checklist/
 
 # SECURITY WARNING: keep the secret key used in production secret!
-# STORED IN secret_settings.py
+# STORED IN secret_settings.py (not versioned) or CLASSMANAGER_SECRET_KEY
 
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
@@ -37,7 +50,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'classmanager',
+    'classmanager.apps.ClassmanagerConfig',
     'crispy_forms',
     'coverage'
 ]
@@ -47,11 +60,14 @@ CRISPY_TEMPLATE_PACK = 'bootstrap4'
 AUTH_USER_MODEL = 'classmanager.User'
 
 MIDDLEWARE = [
+    'classmanager.middleware.performance_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'classmanager.routers.replica_middleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'classmanager.middleware.profiling_middleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -83,9 +99,143 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # keep connections open between requests for this many seconds
+        'CONN_MAX_AGE': int(os.environ.get('CLASSMANAGER_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # take the write lock when a transaction begins, a transaction that reads and then writes would
+            # otherwise fail with "database is locked" right away instead of waiting for busy_timeout
+            'transaction_mode': 'IMMEDIATE',
+        },
+    }
+}
+
+# Read replicas
+# Reads can be spread over copies of the database, given as SQLite files separated by commas in
+# CLASSMANAGER_REPLICAS, and reports (views decorated with routers.reporting_database) can be sent to the
+# file in CLASSMANAGER_REPORTING_DB. `manage.py sync_replicas` keeps the copies in sync with the default database.
+
+DATABASE_REPLICAS = []
+for number, name in enumerate(filter(None, os.environ.get('CLASSMANAGER_REPLICAS', '').split(',')), start=1):
+    DATABASES[f'replica{number}'] = dict(DATABASES['default'], NAME=name, TEST={'MIRROR': 'default'})
+    DATABASE_REPLICAS.append(f'replica{number}')
+
+DATABASE_REPORTING = None
+if os.environ.get('CLASSMANAGER_REPORTING_DB'):
+    DATABASES['reporting'] = dict(DATABASES['default'], NAME=os.environ['CLASSMANAGER_REPORTING_DB'],
+                                  TEST={'MIRROR': 'default'})
+    DATABASE_REPORTING = 'reporting'
+
+DATABASE_ROUTERS = ['classmanager.routers.ReplicaRouter']
+
+# seconds during which a session reads from the default database after it wrote, long enough for the copies
+# to catch up
+REPLICA_STICKY_SECONDS = 15
+
+# SQLite connection profile, classmanager.db applies these pragmas to every new connection
+SQLITE_PRAGMAS = {
+    # readers and the writer don't block each other
+    'journal_mode': 'wal',
+    # with WAL, a crash of the app can't corrupt the database and commits skip the fsync
+    'synchronous': 'normal',
+    # page cache in KiB when negative (64 MB)
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+    # milliseconds a connection waits for a lock before failing with SQLITE_BUSY
+    'busy_timeout': 5000,
+    'temp_store': 'memory',
+}
+
+# write views still failing with SQLITE_BUSY after busy_timeout are retried this many times, waiting
+# SQLITE_BUSY_BACKOFF seconds before the first retry and twice as long before each next one
+SQLITE_BUSY_RETRIES = 3
+SQLITE_BUSY_BACKOFF = 0.1
+
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+# Course pages are cached under per-course versions that writes replace, so the cache has to be shared by every
+# server process for a write handled by one of them to be seen by the others. The default is a directory of files
+# shared by the processes of the host (in CHECKOUT_TMP_DIR), servers on several hosts need a cache server such as
+# Memcached or Redis instead.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CLASSMANAGER_CACHE_DIR', CHECKOUT_TMP_DIR / 'cache'),
+        'OPTIONS': {
+            # a third of the entries are removed once there are more, a removed version gets a new one
+            'MAX_ENTRIES': 10000,
+        },
     }
 }
 
+# Async views
+# Served over ASGI (asgi.py sets CLASSMANAGER_ASYNC_VIEWS), the read-heavy views are routed to their async
+# versions in classmanager/async_views.py instead of running in the sync thread pool
+
+ASYNC_VIEWS = os.environ.get('CLASSMANAGER_ASYNC_VIEWS', '0') == '1'
+
+# Performance instrumentation
+# This fraction of the requests get a Server-Timing header and a JSON line on the classmanager.performance
+# logger with their database, template and total time
+
+PERFORMANCE_SAMPLE_RATE = float(os.environ.get('CLASSMANAGER_PERF_SAMPLE_RATE', 0.1))
+
+# Queries slower than this many milliseconds are logged to SLOW_QUERY_LOG with the code that issued them and their
+# query plan (summarized by `manage.py slow_queries`), None (an empty CLASSMANAGER_SLOW_QUERY_MS or "off") to
+# disable
+SLOW_QUERY_THRESHOLD_MS = os.environ.get('CLASSMANAGER_SLOW_QUERY_MS', '100').strip()
+SLOW_QUERY_THRESHOLD_MS = None if SLOW_QUERY_THRESHOLD_MS.lower() in ('', 'off') else float(SLOW_QUERY_THRESHOLD_MS)
+
+SLOW_QUERY_LOG = os.environ.get('CLASSMANAGER_SLOW_QUERY_LOG', BASE_DIR / 'slow_queries.log')
+
+# Requests of staff users with an X-Profile header or a profile query parameter (cpu, memory or all) are profiled,
+# their profiles are saved here (summarized by `manage.py profiles`)
+PROFILE_DIR = os.environ.get('CLASSMANAGER_PROFILE_DIR', BASE_DIR / 'profiles')
+
+# Request counts, latency and query histograms and cache hit ratios per URL name, served at /metrics in the
+# Prometheus format. Each worker process writes its counts to METRICS_DIR at most every METRICS_FLUSH_INTERVAL
+# seconds and removes them when it stops. The default directory is in CHECKOUT_TMP_DIR, so other checkouts
+# on the host don't add to its counts. Only staff users, or scrapers sending METRICS_TOKEN as a bearer
+# token, can read them.
+METRICS_ENABLED = os.environ.get('CLASSMANAGER_METRICS', '1') == '1'
+
+METRICS_DIR = os.environ.get('CLASSMANAGER_METRICS_DIR', CHECKOUT_TMP_DIR / 'metrics')
+
+METRICS_FLUSH_INTERVAL = 1.0
+
+METRICS_TOKEN = os.environ.get('CLASSMANAGER_METRICS_TOKEN')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+        'slow_queries': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': SLOW_QUERY_LOG,
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            # the file is opened on the first slow query
+            'delay': True,
+        },
+    },
+    'loggers': {
+        'classmanager.performance': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'classmanager.slow_queries': {
+            'handlers': ['slow_queries'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 
@@ -127,3 +277,6 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = (os.path.join(BASE_DIR,'classmanager/static'),)
 
 DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
+
+# turns metrics and the performance and slow query log lines off for the tests
+TEST_RUNNER = 'classmanager.tests.runner.TestRunner'